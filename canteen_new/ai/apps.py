@@ -9,20 +9,5 @@ class AiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'ai'
     verbose_name = 'AI推荐模块'
-
-    def ready(self):
-        """应用启动时初始化LLM服务"""
-        # 导入并初始化LLM服务
-        from .llm_service import llm_service
-        from config.llm_config import setup_llm_environment
-        
-        print("=== AI模块初始化 ===")
-        setup_llm_environment()
-        
-        # 验证LLM服务状态
-        if llm_service.client:
-            print(f"✅ LLM服务已初始化: {llm_service.client}")
-        else:
-            print("⚠️ LLM服务使用模拟模式")
-        
-        print("=" * 30)
+    # LLM服务等组件在首次处理AI请求时才创建（见 ai.llm_service.get_llm_service），
+    # 启动时不再初始化LLM客户端和输出配置诊断信息
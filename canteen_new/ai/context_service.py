@@ -3,23 +3,13 @@
 提供天气、节日、用户偏好、客流量等情景数据
 """
 import datetime
-import os
 from typing import List, Dict, Any, Optional
-from lunarcalendar import Converter, Solar
-import holidays
-import requests
 from django.conf import settings
 
 
 class ContextService:
     """情景数据服务类"""
     
-    def __init__(self):
-        self.weather_api_key = os.getenv('WEATHER_API_KEY')
-        self.weather_api_provider = os.getenv('WEATHER_API_PROVIDER', 'gaode')
-        self.weather_city = os.getenv('WEATHER_CITY', '北京')
-        self.weather_api_url = "https://restapi.amap.com/v3/weather/weatherInfo"
-    
     def get_situational_festival_info(self, target_date: datetime.date = None) -> List[str]:
         """
         聚合获取指定日期的中国传统节日、24节气、法定/公共节日等情景信息。
@@ -30,109 +20,25 @@ class ContextService:
         Returns:
             一个包含所有识别出的节日/节气名称的列表。
         """
+        from .festival_calendar import festival_calendar
+
         if target_date is None:
             target_date = datetime.date.today()
-        
-        festivals = set()
-        year, month, day = target_date.year, target_date.month, target_date.day
-        
-        # ------------------- A. 农历和 24 节气 (使用 LunarCalendar) -------------------
-        try:
-            # 1. 构造 Solar 对象 (公历日期)
-            current_solar = Solar(year, month, day)
-            current_date = datetime.date(year, month, day) # 用于 holidays 库
-
-            # 2. 提取 24 节气信息
-            try:
-                if hasattr(current_solar, 'solar_term') and current_solar.solar_term:
-                    festivals.add(f"节气: {current_solar.solar_term}")
-            except AttributeError:
-                pass
-
-            # 3. 提取公历节日信息 (LunarCalendar自带的)
-            if hasattr(current_solar, 'solar_festival') and current_solar.solar_festival:
-                festivals.update(current_solar.solar_festival)
-
-            # 4. 提取农历节日信息 (需要先转换)
-            try:
-                lunar = Converter.Solar2Lunar(current_solar)
-                
-                if hasattr(lunar, 'lunar_festival') and lunar.lunar_festival:
-                    festivals.update(lunar.lunar_festival)
-
-            except Exception:
-                # 农历转换异常处理
-                pass
-                
-        except Exception as e:
-            print(f"LunarCalendar 处理异常: {e}")
-            pass
-
-        # ------------------- B. 法定/公共节假日 (使用 holidays 库) -------------------
-        
-        # 使用中国 (CN) 地区设置，获取公共假期
-        try:
-            cn_holidays = holidays.CountryHoliday('CN', years=year)
-            if target_date in cn_holidays:
-                festival_name = cn_holidays.get(target_date)
-                if festival_name:
-                    festivals.add(festival_name)
-        except Exception as e:
-            print(f"holidays 处理异常: {e}")
-            pass
-
-        # ------------------- C. 有趣的/非官方的固定节日 (自定义) -------------------
-        
-        # 添加一些可能影响心情或饮食倾向的节日
-        custom_festivals = {
-            (1, 1): "元旦节",
-            (2, 14): "情人节",
-            (3, 8): "妇女节",
-            (3, 15): "消费者权益日",
-            (5, 1): "劳动节",
-            (6, 1): "儿童节",
-            (7, 7): "七夕节",  # 这里的七夕是公历的，农历的已由 LunarCalendar 处理
-            (8, 8): "全民健身日",
-            (11, 11): "光棍节/购物节",
-            (12, 31): "跨年夜"
-        }
-        
-        today_tuple = (month, day)
-        if today_tuple in custom_festivals:
-            festivals.add(custom_festivals[today_tuple])
-        
-        # ------------------- D. 趣味信息输出 -------------------
-        
-        festival_str = "".join(festivals)
-        if "立春" in festival_str:
-            festivals.add("新岁伊始，宜养肝")
-        if "情人节" in festival_str or "七夕" in festival_str:
-            festivals.add("浪漫氛围，宜情侣套餐")
-        if "冬至" in festival_str:
-            festivals.add("冬至进补，宜温补食物")
-        if "夏至" in festival_str:
-            festivals.add("夏至清热，宜清淡饮食")
-
-        # 如果列表为空，返回一个默认标签
-        if not festivals:
-            # 判断是否为周末
-            if target_date.weekday() >= 5:  # 5=周六, 6=周日
-                return ["周末"]
-            else:
-                return ["普通工作日"]
-        
-        return sorted(list(festivals))
+        # 节日标签按年预先计算并保存在日历文件中，查询只需一次数组索引
+        return festival_calendar.tags_for(target_date)
     
     def get_weather_info(self) -> Dict[str, Any]:
         """
         获取天气信息
-        使用高德天气API获取真实天气数据
+        从共享天气缓存读取（见 ai.weather），不等待外部天气API；缓存为空时使用备用数据
         
         Returns:
             天气信息字典
         """
+        from .weather import weather_cache
+        
         # 如果没有配置天气API密钥，返回空数据
-        if not self.weather_api_key:
+        if not weather_cache.is_configured():
             print("警告: 未配置天气API密钥，天气数据不可用")
             return {
                 "weather": "未知",
@@ -143,51 +49,14 @@ class ContextService:
             }
         
         try:
-            # 调用高德天气API
-            params = {
-                'key': self.weather_api_key,
-                'city': self.weather_city,
-                'extensions': 'base',  # base: 实时天气, all: 预报天气
-                'output': 'JSON'
-            }
-            
-            response = requests.get(self.weather_api_url, params=params, timeout=10)
-            
-            if response.status_code == 200:
-                data = response.json()
-                
-                # 检查API返回状态
-                if data.get('status') == '1' and data.get('lives'):
-                    weather_data = data['lives'][0]
-                    
-                    # 解析天气数据
-                    weather = weather_data.get('weather', '未知')
-                    temperature = int(weather_data.get('temperature', 0))
-                    humidity = int(weather_data.get('humidity', 0))
-                    wind_direction = weather_data.get('winddirection', '未知')
-                    wind_power = weather_data.get('windpower', '0级')
-                    
-                    # 将风力等级转换为数字
-                    wind_level = self._convert_wind_power_to_level(wind_power)
-                    
-                    return {
-                        "weather": weather,
-                        "temperature": temperature,
-                        "season": self._get_season(datetime.date.today()),
-                        "humidity": humidity,
-                        "wind_level": wind_level,
-                        "wind_direction": wind_direction
-                    }
-                else:
-                    print(f"高德天气API返回错误: {data.get('info', '未知错误')}")
-                    return self._get_fallback_weather_data()
-            else:
-                print(f"天气API调用失败: {response.status_code}")
-                return self._get_fallback_weather_data()
-                
+            weather = weather_cache.get()
         except Exception as e:
-            print(f"天气API调用异常: {e}")
+            print(f"读取天气缓存异常: {e}")
+            weather = None
+        
+        if weather is None:
             return self._get_fallback_weather_data()
+        return {**weather, "season": self._get_season(datetime.date.today())}
     
     def _get_fallback_weather_data(self) -> Dict[str, Any]:
         """获取备用天气数据（当API不可用时）"""
@@ -215,14 +84,20 @@ class ContextService:
             "wind_level": 2
         }
     
-    def get_crowd_info(self) -> Dict[str, Any]:
+    def get_crowd_info(self, pickup_time: Optional[datetime.datetime] = None) -> Dict[str, Any]:
         """
         获取客流量信息
-        从数据库获取实时客流量数据
+        从数据库获取实时客流量数据；指定取餐时间时使用该时刻的预测
         
+        Args:
+            pickup_time: 取餐时间（可选）
+            
         Returns:
             客流量信息字典
         """
+        if pickup_time is not None:
+            return self._estimate_crowd_info(pickup_time)
+        
         try:
             from data.services import dish_service
             
@@ -247,9 +122,24 @@ class ContextService:
             print(f"获取客流量数据失败: {e}")
             return self._estimate_crowd_info()
     
-    def _estimate_crowd_info(self) -> Dict[str, Any]:
-        """基于时间估算客流量信息"""
-        current_hour = datetime.datetime.now().hour
+    def _estimate_crowd_info(self, at: Optional[datetime.datetime] = None) -> Dict[str, Any]:
+        """基于时间估算客流量信息：优先使用周内时段预测模型，模型不可用时按典型客流模式估算"""
+        at = at or datetime.datetime.now()
+        try:
+            from data.services import crowd_level_label
+            from data.wait_forecast import wait_forecaster
+            
+            forecast = wait_forecaster.forecast(at)
+            if forecast:
+                return {
+                    "crowd_level": crowd_level_label(forecast['avg_count']),
+                    "avg_wait_time": forecast['avg_wait_time'],
+                    "peak_hours": wait_forecaster.peak_hours(at.weekday())
+                }
+        except Exception as e:
+            print(f"客流预测失败: {e}")
+        
+        current_hour = at.hour
         
         # 基于典型食堂客流模式估算
         if 11 <= current_hour <= 13 or 17 <= current_hour <= 19:
@@ -314,19 +204,62 @@ class ContextService:
                 "spice_tolerance": ""
             }
     
-    def get_all_context_data(self, user_id: Optional[int] = None) -> Dict[str, Any]:
+    def get_canteen_crowd_info(self, pickup_time: Optional[datetime.datetime] = None,
+                               canteens: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
         """
-        获取所有情景数据
+        获取各食堂的客流量信息
         
         Args:
-            user_id: 用户ID
+            pickup_time: 取餐时间（可选），指定时使用各食堂在该时刻的预测
+            canteens: 需要预测的食堂（指定取餐时间时使用）
             
         Returns:
-            包含所有情景数据的字典
+            食堂名称 -> {crowd_level, avg_wait_time, trend}
+        """
+        try:
+            from data.services import crowd_level_label
+            
+            if pickup_time is not None:
+                from data.wait_forecast import wait_forecaster
+                
+                result = {}
+                for canteen in canteens or []:
+                    forecast = wait_forecaster.forecast(pickup_time, canteen)
+                    if forecast:
+                        result[canteen] = {
+                            "crowd_level": crowd_level_label(forecast['avg_count']),
+                            "avg_wait_time": forecast['avg_wait_time'],
+                            "trend": "unknown"
+                        }
+                return result
+            
+            from data.traffic_stats import traffic_statistics
+            
+            return {
+                item['canteen']: {
+                    "crowd_level": crowd_level_label(item['avg_count']),
+                    "avg_wait_time": item['avg_waiting_time'],
+                    "trend": item['trend']
+                }
+                for item in traffic_statistics.get()['canteens'] if item['samples']
+            }
+        except Exception as e:
+            print(f"获取食堂客流量数据失败: {e}")
+            return {}
+    
+    def get_global_context_data(self) -> Dict[str, Any]:
+        """
+        获取与用户无关的情景数据（日期/节日、天气、客流），由情景快照定时调用
+        
+        Returns:
+            {date, date_info, weather_info, crowd_info}，crowd_info 中的 canteens 为各食堂客流
         """
         current_date = datetime.date.today()
+        crowd_info = self.get_crowd_info()
+        crowd_info["canteens"] = self.get_canteen_crowd_info()
         
         return {
+            "date": current_date,
             "date_info": {
                 "current_date": current_date.strftime('%Y年%m月%d日'),
                 "festival_tags": self.get_situational_festival_info(current_date),
@@ -334,10 +267,39 @@ class ContextService:
                 "current_season": self._get_season(current_date)
             },
             "weather_info": self.get_weather_info(),
-            "crowd_info": self.get_crowd_info(),
-            "user_preferences": self.get_user_preferences(user_id)
+            "crowd_info": crowd_info
         }
     
+    def get_all_context_data(self, user_id: Optional[int] = None,
+                             pickup_time: Optional[datetime.datetime] = None) -> Dict[str, Any]:
+        """
+        获取所有情景数据
+        全局部分读取情景快照（见 ai.context_snapshot），每次请求只计算用户偏好和指定取餐时间的客流预测
+        
+        Args:
+            user_id: 用户ID
+            pickup_time: 取餐时间（可选），客流信息使用该时刻的预测
+            
+        Returns:
+            包含所有情景数据的字典
+        """
+        from .context_snapshot import context_snapshots
+        
+        if context_snapshots.is_enabled():
+            context_data = context_snapshots.get().to_context()
+        else:
+            context_data = self.get_global_context_data()
+            context_data.pop("date")
+        
+        if pickup_time is not None:
+            canteens = list(context_data["crowd_info"].get("canteens", {}))
+            context_data["crowd_info"] = {
+                **self.get_crowd_info(pickup_time),
+                "canteens": self.get_canteen_crowd_info(pickup_time, canteens)
+            }
+        context_data["user_preferences"] = self.get_user_preferences(user_id)
+        return context_data
+    
     def _get_season(self, date: datetime.date) -> str:
         """根据日期判断季节"""
         month = date.month
@@ -378,21 +340,6 @@ class ContextService:
             return 11
         else:
             return 12
-    
-    def _convert_wind_power_to_level(self, wind_power: str) -> int:
-        """将高德天气的风力描述转换为风力等级"""
-        # 高德天气返回的风力格式如："3-4级", "5-6级", "微风"等
-        if not wind_power or wind_power == '微风':
-            return 1
-        
-        # 提取数字部分
-        import re
-        numbers = re.findall(r'\d+', wind_power)
-        if numbers:
-            # 取第一个数字作为风力等级
-            return int(numbers[0])
-        else:
-            return 1
 
 
 # 测试函数
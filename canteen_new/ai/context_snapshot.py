@@ -0,0 +1,167 @@
+"""
+全局情景快照
+日期/节日、天气和客流（含各食堂客流）对所有用户相同，由后台定时线程按固定间隔重新构建，
+保存为带版本号的不可变快照；请求只读取当前快照，并在其上叠加按用户计算的部分
+（用户偏好、指定取餐时间的客流预测），不再为每个请求查询数据库或缓存。
+快照内容发生变化时版本号加一，内容不变的刷新保持原版本号。
+快照超过最长有效期（如定时线程异常退出）或日期变化时，读取方同步重建。
+"""
+import datetime
+import logging
+import threading
+import time
+from dataclasses import dataclass, replace
+from types import MappingProxyType
+from typing import Any, Callable, Dict, Mapping, Optional
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+def _freeze(value: Any) -> Any:
+    """将字典和列表转换为只读的映射和元组"""
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+def _thaw(value: Any) -> Any:
+    """将只读的映射和元组转换回普通字典和列表（每个请求得到独立的副本）"""
+    if isinstance(value, Mapping):
+        return {key: _thaw(item) for key, item in value.items()}
+    if isinstance(value, tuple):
+        return [_thaw(item) for item in value]
+    return value
+
+
+@dataclass(frozen=True)
+class ContextSnapshot:
+    """全局情景快照（不可变）"""
+    version: int
+    built_at: float
+    date: datetime.date
+    date_info: Mapping[str, Any]
+    weather_info: Mapping[str, Any]
+    crowd_info: Mapping[str, Any]
+
+    def same_content(self, other: Optional['ContextSnapshot']) -> bool:
+        return (
+            other is not None
+            and self.date_info == other.date_info
+            and self.weather_info == other.weather_info
+            and self.crowd_info == other.crowd_info
+        )
+
+    def to_context(self) -> Dict[str, Any]:
+        """转换为 get_all_context_data 格式的情景数据（不含用户偏好）"""
+        return {
+            "date_info": _thaw(self.date_info),
+            "weather_info": _thaw(self.weather_info),
+            "crowd_info": _thaw(self.crowd_info),
+        }
+
+
+class ContextSnapshotStore:
+    """全局情景快照的构建、刷新与读取"""
+
+    def __init__(self, builder: Callable[[], Dict[str, Any]] = None,
+                 clock: Callable[[], float] = time.time):
+        self._builder = builder
+        self._clock = clock
+        self._snapshot: Optional[ContextSnapshot] = None
+        self._lock = threading.Lock()
+        self._ticker_lock = threading.Lock()
+        self._ticker: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @staticmethod
+    def _config() -> Dict[str, Any]:
+        return settings.CONTEXT_SNAPSHOT
+
+    def is_enabled(self) -> bool:
+        return self._config().get('ENABLED', True)
+
+    def _build_global_context(self) -> Dict[str, Any]:
+        if self._builder is None:
+            from .context_service import ContextService
+            self._builder = ContextService().get_global_context_data
+        return self._builder()
+
+    def _is_stale(self, snapshot: Optional[ContextSnapshot]) -> bool:
+        return (
+            snapshot is None
+            or self._clock() - snapshot.built_at > self._config().get('MAX_AGE', 120)
+            or snapshot.date != datetime.date.today()
+        )
+
+    def refresh(self, only_if_stale: bool = False) -> ContextSnapshot:
+        """
+        重新构建快照；内容变化时版本号加一
+
+        Args:
+            only_if_stale: 为 True 时，等待锁期间其他线程已完成重建则直接返回新快照
+        """
+        with self._lock:
+            if only_if_stale and not self._is_stale(self._snapshot):
+                return self._snapshot
+            context = self._build_global_context()
+            previous = self._snapshot
+            snapshot = ContextSnapshot(
+                version=previous.version if previous else 0,
+                built_at=self._clock(),
+                date=context['date'],
+                date_info=_freeze(context['date_info']),
+                weather_info=_freeze(context['weather_info']),
+                crowd_info=_freeze(context['crowd_info']),
+            )
+            if not snapshot.same_content(previous):
+                snapshot = replace(snapshot, version=snapshot.version + 1)
+            # 替换引用是原子操作，读取方总是拿到完整的快照
+            self._snapshot = snapshot
+            return snapshot
+
+    def get(self) -> ContextSnapshot:
+        """
+        读取当前快照（首次读取时启动后台刷新线程）
+
+        Returns:
+            当前快照；尚无快照、快照过期或日期已变化时同步重建
+        """
+        self._ensure_ticker()
+        snapshot = self._snapshot
+        if self._is_stale(snapshot):
+            snapshot = self.refresh(only_if_stale=True)
+        return snapshot
+
+    def _ensure_ticker(self) -> None:
+        if self._ticker is not None and self._ticker.is_alive():
+            return
+        with self._ticker_lock:
+            if self._ticker is not None and self._ticker.is_alive():
+                return
+            self._stop.clear()
+            self._ticker = threading.Thread(target=self._run, name='context-snapshot', daemon=True)
+            self._ticker.start()
+
+    def _run(self) -> None:
+        from data.database import db_connection_scope
+
+        interval = self._config().get('REFRESH_INTERVAL', 30)
+        while not self._stop.wait(interval):
+            try:
+                # 后台线程不经过请求周期，每次刷新前后关闭失效的数据库连接（归还连接池）
+                with db_connection_scope():
+                    self.refresh()
+            except Exception as e:
+                logger.warning(f"刷新情景快照失败: {e}")
+
+    def stop(self) -> None:
+        """停止后台刷新线程"""
+        self._stop.set()
+
+
+# 创建全局实例
+context_snapshots = ContextSnapshotStore()
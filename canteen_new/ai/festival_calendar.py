@@ -0,0 +1,203 @@
+"""
+节日与节气日历
+节日标签（24 节气、公历/农历节日、法定假日、自定义节日及对应的饮食提示）只与日期有关，
+因此按年预先计算：每年生成一个按"一年中的第几天"索引的数组，每个元素是当天标签在
+标签表中的序号，保存为 JSON 文件。查询某天的标签只需一次数组索引。
+
+日历文件可由 python manage.py build_festival_calendar 预先生成；
+某一年的文件不存在时在首次查询时生成并保存，之后的进程直接读取文件，
+不再导入 lunarcalendar 和 holidays。
+"""
+import datetime
+import json
+import logging
+import os
+import threading
+from typing import Dict, List, Tuple
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# 日历文件格式或标签规则变化时递增，旧文件会被重新生成
+CALENDAR_VERSION = 1
+
+# 有趣的/非官方的固定节日（可能影响心情或饮食倾向）
+CUSTOM_FESTIVALS = {
+    (1, 1): "元旦节",
+    (2, 14): "情人节",
+    (3, 8): "妇女节",
+    (3, 15): "消费者权益日",
+    (5, 1): "劳动节",
+    (6, 1): "儿童节",
+    (7, 7): "七夕节",  # 这里的七夕是公历的，农历的已由 LunarCalendar 处理
+    (8, 8): "全民健身日",
+    (11, 11): "光棍节/购物节",
+    (12, 31): "跨年夜"
+}
+
+# 节日关键字 -> 饮食提示
+FESTIVAL_TIPS = [
+    (("立春",), "新岁伊始，宜养肝"),
+    (("情人节", "七夕"), "浪漫氛围，宜情侣套餐"),
+    (("冬至",), "冬至进补，宜温补食物"),
+    (("夏至",), "夏至清热，宜清淡饮食"),
+]
+
+
+def _library_tags(year: int) -> Tuple[Dict[datetime.date, set], bool]:
+    """
+    用 lunarcalendar 和 holidays 计算一整年的节气、节日和法定假日
+
+    Returns:
+        (日期 -> 标签集合, 是否完整计算)；缺少依赖库或计算出错时结果不完整，不应保存
+    """
+    tags: Dict[datetime.date, set] = {}
+    complete = True
+    try:
+        # 农历和节假日库较大，只在生成日历时导入
+        from lunarcalendar import Converter, Solar
+        import holidays
+    except ImportError as e:
+        logger.warning(f"生成节日日历缺少依赖库: {e}")
+        return tags, False
+
+    # A. 农历和 24 节气
+    date = datetime.date(year, 1, 1)
+    while date.year == year:
+        day_tags = tags.setdefault(date, set())
+        try:
+            current_solar = Solar(date.year, date.month, date.day)
+            if getattr(current_solar, 'solar_term', None):
+                day_tags.add(f"节气: {current_solar.solar_term}")
+            if getattr(current_solar, 'solar_festival', None):
+                day_tags.update(current_solar.solar_festival)
+            try:
+                lunar = Converter.Solar2Lunar(current_solar)
+                if getattr(lunar, 'lunar_festival', None):
+                    day_tags.update(lunar.lunar_festival)
+            except Exception:
+                # 农历转换异常处理
+                pass
+        except Exception as e:
+            print(f"LunarCalendar 处理异常: {e}")
+            complete = False
+        date += datetime.timedelta(days=1)
+
+    # B. 法定/公共节假日：每年只构造一次假日表
+    try:
+        cn_holidays = holidays.CountryHoliday('CN', years=year)
+        for holiday_date, name in cn_holidays.items():
+            if holiday_date.year == year and name:
+                tags.setdefault(holiday_date, set()).add(name)
+    except Exception as e:
+        print(f"holidays 处理异常: {e}")
+        complete = False
+
+    return tags, complete
+
+
+def _finalize(date: datetime.date, festivals: set) -> List[str]:
+    """加上自定义节日和饮食提示；没有任何节日时返回周末/普通工作日"""
+    festivals = set(festivals)
+    custom = CUSTOM_FESTIVALS.get((date.month, date.day))
+    if custom:
+        festivals.add(custom)
+
+    festival_str = "".join(festivals)
+    for keywords, tip in FESTIVAL_TIPS:
+        if any(keyword in festival_str for keyword in keywords):
+            festivals.add(tip)
+
+    if not festivals:
+        return ["周末"] if date.weekday() >= 5 else ["普通工作日"]
+    return sorted(festivals)
+
+
+class FestivalCalendar:
+    """按年预计算的节日标签表"""
+
+    def __init__(self):
+        # 年份 -> 按一年中第几天索引的标签元组
+        self._years: Dict[int, List[Tuple[str, ...]]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def path_for(year: int) -> str:
+        return os.path.join(settings.FESTIVAL_CALENDAR['DATA_DIR'], f"{year}.json")
+
+    def build(self, year: int) -> Tuple[List[Tuple[str, ...]], bool]:
+        """
+        计算一整年的节日标签
+
+        Returns:
+            (按一年中第几天索引的标签元组列表, 是否完整计算)
+        """
+        library_tags, complete = _library_tags(year)
+        days = []
+        date = datetime.date(year, 1, 1)
+        while date.year == year:
+            days.append(tuple(_finalize(date, library_tags.get(date, ()))))
+            date += datetime.timedelta(days=1)
+        return days, complete
+
+    def save(self, year: int, days: List[Tuple[str, ...]]) -> str:
+        """将一年的标签表保存为日历文件（标签表 + 每天的标签序号）"""
+        vocabulary = sorted({tag for tags in days for tag in tags})
+        index = {tag: i for i, tag in enumerate(vocabulary)}
+        path = self.path_for(year)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 先写临时文件再替换，其他进程不会读到写了一半的文件
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                "version": CALENDAR_VERSION,
+                "year": year,
+                "tags": vocabulary,
+                "days": [[index[tag] for tag in tags] for tags in days],
+            }, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(temp_path, path)
+        return path
+
+    def load(self, year: int) -> List[Tuple[str, ...]]:
+        """读取日历文件，文件不存在或版本不符时返回空列表"""
+        path = self.path_for(year)
+        try:
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return []
+        except (OSError, ValueError) as e:
+            logger.warning(f"读取节日日历失败 {path}: {e}")
+            return []
+        if data.get('version') != CALENDAR_VERSION or data.get('year') != year:
+            return []
+        vocabulary = data['tags']
+        return [tuple(vocabulary[i] for i in tags) for tags in data['days']]
+
+    def _get_year(self, year: int) -> List[Tuple[str, ...]]:
+        days = self._years.get(year)
+        if days is not None:
+            return days
+        with self._lock:
+            days = self._years.get(year)
+            if days is None:
+                days = self.load(year)
+                if not days:
+                    days, complete = self.build(year)
+                    if complete:
+                        try:
+                            self.save(year, days)
+                        except OSError as e:
+                            logger.warning(f"保存节日日历失败: {e}")
+                self._years[year] = days
+        return days
+
+    def tags_for(self, date: datetime.date) -> List[str]:
+        """查询某天的节日标签"""
+        days = self._get_year(date.year)
+        return list(days[date.toordinal() - datetime.date(date.year, 1, 1).toordinal()])
+
+
+# 创建全局实例
+festival_calendar = FestivalCalendar()
@@ -3,6 +3,7 @@
 负责从用户输入中提取关键词，生成初始判断参数
 """
 import re
+from functools import lru_cache
 from typing import Dict, Any, List
 
 
@@ -223,5 +224,15 @@ class KeywordExtractor:
         return min(base_confidence, 1.0)
 
 
-# 创建全局实例
-keyword_extractor = KeywordExtractor()
+# 全局实例在首次使用时创建
+@lru_cache(maxsize=None)
+def get_keyword_extractor() -> KeywordExtractor:
+    """获取全局关键词提取器实例"""
+    return KeywordExtractor()
+
+
+def __getattr__(name):
+    # 兼容 from ai.keyword_extractor import keyword_extractor
+    if name == 'keyword_extractor':
+        return get_keyword_extractor()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
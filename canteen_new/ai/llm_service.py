@@ -4,9 +4,9 @@
 """
 import json
 import os
+from functools import lru_cache
 from typing import Dict, Any, List, Optional
-from openai import OpenAI
-from config.llm_config import llm_config
+from config.llm_config import llm_config, setup_llm_environment
 from .utils import GET_DISHES_SCHEMA, validate_tool_arguments, get_dishes_by_criteria
 
 
@@ -26,6 +26,7 @@ class LLMService:
             self.client = None
         else:
             try:
+                from openai import OpenAI
                 self.client = OpenAI(
                     api_key=config['api_key'],
                     base_url=config['base_url']
@@ -47,6 +48,18 @@ class LLMService:
         print(f"情景数据: {context_data}")
         
         try:
+            # 相同意图和情景分段的推荐决策已缓存时跳过LLM调用，只执行菜品查询
+            from .recommendation_cache import recommendation_cache
+            cache_key = recommendation_cache.make_key(initial_params, context_data)
+            cached = recommendation_cache.get(cache_key, initial_params)
+            if cached is not None:
+                print(f"命中推荐缓存: {cached['tool_args']}")
+                validated_args = validate_tool_arguments(dict(cached['tool_args']))
+                dishes = get_dishes_by_criteria(**validated_args)
+                return self._generate_llm_response(
+                    dishes, user_query, context_data, cached['content'], cached['llm_reason']
+                )
+            
             # 构建系统提示
             system_prompt = self._build_enhancement_prompt(initial_params, context_data)
             
@@ -59,8 +72,10 @@ class LLMService:
             # 调用LLM
             response = self.call_llm_with_tools(messages, [GET_DISHES_SCHEMA])
             
-            # 处理LLM响应
-            return self._process_llm_response(response, user_query, context_data)
+            # 处理LLM响应（降级到模拟响应时不缓存）
+            if getattr(response, 'is_fallback', False):
+                cache_key = None
+            return self._process_llm_response(response, user_query, context_data, cache_key)
             
         except Exception as e:
             print(f"LLM增强处理失败: {e}")
@@ -130,7 +145,7 @@ class LLMService:
             return self._mock_llm_call(messages, tools)
     
     def _mock_llm_call(self, messages: List[Dict], tools: List[Dict]):
-        """模拟LLM调用 - 简化版本"""
+        """模拟LLM调用 - 简化版本（响应的 is_fallback 为 True）"""
         user_message = messages[-1]['content']
         system_message = messages[0]['content'] if messages and messages[0]['role'] == 'system' else ""
         
@@ -153,6 +168,7 @@ class LLMService:
             tool_args["max_wait_time"] = 15
         
         return type('MockResponse', (), {
+            'is_fallback': True,
             'choices': [type('MockChoice', (), {
                 'message': type('MockMessage', (), {
                     'tool_calls': [type('MockToolCall', (), {
@@ -166,8 +182,9 @@ class LLMService:
             })]
         })()
     
-    def _process_llm_response(self, response, user_query: str, context_data: Dict) -> Dict[str, Any]:
-        """处理LLM响应"""
+    def _process_llm_response(self, response, user_query: str, context_data: Dict,
+                              cache_key: Optional[str] = None) -> Dict[str, Any]:
+        """处理LLM响应，提供 cache_key 时缓存工具函数参数和推荐理由"""
         try:
             # 检查是否调用了工具函数
             if hasattr(response.choices[0].message, 'tool_calls') and response.choices[0].message.tool_calls:
@@ -183,6 +200,10 @@ class LLMService:
                     if llm_reason:
                         print(f"LLM生成的推荐理由: {llm_reason}")
                     
+                    if cache_key:
+                        from .recommendation_cache import recommendation_cache
+                        recommendation_cache.set(cache_key, tool_args, response.choices[0].message.content, llm_reason)
+                    
                     # 验证参数
                     validated_args = validate_tool_arguments(tool_args)
                     
@@ -289,5 +310,16 @@ class LLMService:
         }
 
 
-# 创建全局实例
-llm_service = LLMService()
+# 全局实例在首次使用时创建，不处理AI请求的进程不会创建LLM客户端
+@lru_cache(maxsize=None)
+def get_llm_service() -> LLMService:
+    """获取全局LLM服务实例（首次调用时输出LLM配置信息）"""
+    setup_llm_environment()
+    return LLMService()
+
+
+def __getattr__(name):
+    # 兼容 from ai.llm_service import llm_service
+    if name == 'llm_service':
+        return get_llm_service()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
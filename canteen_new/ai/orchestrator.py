@@ -3,10 +3,12 @@ AI流程编排器
 统一入口，负责协调关键词提取、情景数据、LLM处理等模块
 """
 import json
+from datetime import datetime
+from functools import lru_cache
 from typing import Dict, Any, List, Optional
-from .keyword_extractor import KeywordExtractor
+from .keyword_extractor import get_keyword_extractor
 from .context_service import ContextService
-from .llm_service import LLMService
+from .llm_service import get_llm_service
 from .utils import get_dishes_by_criteria, validate_tool_arguments
 
 
@@ -14,11 +16,12 @@ class AIOrchestrator:
     """AI流程编排器 - 统一入口"""
     
     def __init__(self):
-        self.keyword_extractor = KeywordExtractor()
+        self.keyword_extractor = get_keyword_extractor()
         self.context_service = ContextService()
-        self.llm_service = LLMService()
+        self.llm_service = get_llm_service()
     
-    def process_query(self, user_query: str, user_id: Optional[int] = None, merge_user_preference: bool = False) -> Dict[str, Any]:
+    def process_query(self, user_query: str, user_id: Optional[int] = None, merge_user_preference: bool = False,
+                      pickup_time: Optional[datetime] = None) -> Dict[str, Any]:
         """
         处理用户查询的主流程
         
@@ -26,6 +29,7 @@ class AIOrchestrator:
             user_query: 用户输入文本
             user_id: 用户ID（可选）
             merge_user_preference: 是否融合用户偏好，默认False
+            pickup_time: 取餐时间（可选），按该时刻的预计等待时间推荐
             
         Returns:
             推荐结果
@@ -39,11 +43,13 @@ class AIOrchestrator:
             # 1. 第一阶段：关键词提取（初始判断）
             print("1. 关键词提取阶段...")
             initial_params = self.keyword_extractor.extract(user_query)
+            if pickup_time is not None:
+                initial_params['pickup_time'] = pickup_time.strftime('%Y-%m-%d %H:%M')
             print(f"初始判断参数: {initial_params}")
             
             # 2. 获取情景数据
             print("2. 获取情景数据...")
-            context_data = self.context_service.get_all_context_data(user_id)
+            context_data = self.context_service.get_all_context_data(user_id, pickup_time)
             print(f"情景数据: {context_data}")
             
             # 3. 如果启用用户偏好融合，获取用户明确设置的偏好
@@ -463,5 +469,15 @@ class AIOrchestrator:
         }
 
 
-# 创建全局实例
-ai_orchestrator = AIOrchestrator()
+# 全局实例在首次处理AI请求时创建
+@lru_cache(maxsize=None)
+def get_ai_orchestrator() -> AIOrchestrator:
+    """获取全局AI流程编排器实例"""
+    return AIOrchestrator()
+
+
+def __getattr__(name):
+    # 兼容 from ai.orchestrator import ai_orchestrator
+    if name == 'ai_orchestrator':
+        return get_ai_orchestrator()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,239 @@
+"""
+排队感知的推荐分流
+高峰期按评分排序会把所有用户推荐到同几个档口，这些档口的队伍越排越长。
+分流排序为每个商家估计用户到达时的等待时间：实时等待时间随取餐时间推迟逐渐让位于
+预测等待时间（data.wait_forecast），再加上最近一段时间内已推荐到该商家、
+尚未反映在客流上报中的人数带来的排队，在评分与等待时间之间权衡。
+已经饱和的商家在滑动窗口内被推荐的人数有上限，超过上限后只在没有其他选择时才会出现；
+同一次推荐的结果尽量分散到不同食堂和商家。
+滑动窗口计数按时间分桶保存在 Django 缓存中，配置共享缓存（见 settings.CACHES）时各工作进程共用，
+默认的进程内缓存下计数和饱和上限按进程计算。
+"""
+import math
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+
+# 缓存中的人数按千分之一人保存为整数（缓存只支持整数增量）
+WEIGHT_SCALE = 1000
+
+
+class RecommendationWindow:
+    """滑动窗口内推荐到每个商家的人数（按排名位置分摊的期望人数）"""
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self._clock = clock
+        self._events: Dict[int, Deque[Tuple[float, float]]] = defaultdict(deque)
+        self._totals: Dict[int, float] = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def _expire(self, merchant_id: int, cutoff: float) -> None:
+        events = self._events[merchant_id]
+        while events and events[0][0] < cutoff:
+            self._totals[merchant_id] -= events.popleft()[1]
+        if not events:
+            self._totals[merchant_id] = 0.0
+
+    def counts(self, merchant_ids: Iterable[int], window_seconds: float) -> Dict[int, float]:
+        """窗口内推荐到各商家的人数"""
+        cutoff = self._clock() - window_seconds
+        with self._lock:
+            result = {}
+            for merchant_id in merchant_ids:
+                self._expire(merchant_id, cutoff)
+                result[merchant_id] = self._totals[merchant_id]
+            return result
+
+    def record(self, weights: Dict[int, float]) -> None:
+        """记录一次推荐：商家ID -> 该商家分到的人数"""
+        now = self._clock()
+        with self._lock:
+            for merchant_id, weight in weights.items():
+                self._events[merchant_id].append((now, weight))
+                self._totals[merchant_id] += weight
+
+
+class SharedRecommendationWindow:
+    """
+    保存在 Django 缓存中的滑动窗口（各进程共享）
+
+    每个商家按 WINDOW_BUCKET_SECONDS 分桶计数，窗口人数为覆盖窗口的各桶之和，
+    统计范围比窗口最多长一个桶。
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.time):
+        self._clock = clock
+
+    @staticmethod
+    def _bucket_seconds() -> float:
+        return settings.QUEUE_ROUTING.get('WINDOW_BUCKET_SECONDS', 30)
+
+    @staticmethod
+    def _key(merchant_id: int, bucket: int) -> str:
+        return f"queue_routing:{merchant_id}:{bucket}"
+
+    def counts(self, merchant_ids: Iterable[int], window_seconds: float) -> Dict[int, float]:
+        """窗口内推荐到各商家的人数"""
+        merchant_ids = list(merchant_ids)
+        bucket_seconds = self._bucket_seconds()
+        current = int(self._clock() // bucket_seconds)
+        # 当前桶只经过了一部分，多取一个桶使统计范围不短于窗口
+        buckets = range(current - math.ceil(window_seconds / bucket_seconds), current + 1)
+        values = cache.get_many([
+            self._key(merchant_id, bucket) for merchant_id in merchant_ids for bucket in buckets
+        ])
+        return {
+            merchant_id: sum(values.get(self._key(merchant_id, bucket), 0) for bucket in buckets) / WEIGHT_SCALE
+            for merchant_id in merchant_ids
+        }
+
+    def record(self, weights: Dict[int, float]) -> None:
+        """记录一次推荐：商家ID -> 该商家分到的人数"""
+        bucket_seconds = self._bucket_seconds()
+        bucket = int(self._clock() // bucket_seconds)
+        timeout = settings.QUEUE_ROUTING.get('WINDOW_SECONDS', 300) + 2 * bucket_seconds
+        for merchant_id, weight in weights.items():
+            key = self._key(merchant_id, bucket)
+            delta = int(round(weight * WEIGHT_SCALE))
+            try:
+                cache.incr(key, delta)
+            except ValueError:
+                # 桶不存在时创建；与其他进程同时创建时 add 失败，再次累加
+                if not cache.add(key, delta, timeout):
+                    cache.incr(key, delta)
+
+
+class QueueBalancer:
+    """排队感知的分流排序"""
+
+    def __init__(self, clock: Callable[[], float] = None):
+        # 指定时钟时（如仿真回放）使用进程内窗口，否则使用缓存中各进程共享的窗口
+        self.window = RecommendationWindow(clock) if clock is not None else SharedRecommendationWindow()
+
+    @staticmethod
+    def _config() -> Dict[str, Any]:
+        return settings.QUEUE_ROUTING
+
+    def is_enabled(self) -> bool:
+        return self._config().get('ENABLED', True)
+
+    def effective_wait(self, live_wait: Optional[float], forecast_wait: Optional[float],
+                       lead_minutes: float) -> float:
+        """
+        合并实时与预测等待时间：取餐时间越晚，实时等待时间的权重越低（按半衰期衰减）
+
+        Args:
+            live_wait: 实时等待时间（分钟）
+            forecast_wait: 取餐时刻的预测等待时间（分钟）
+            lead_minutes: 距离取餐的分钟数
+
+        Returns:
+            预计等待时间（分钟）
+        """
+        if forecast_wait is None:
+            return float(live_wait or 0)
+        if live_wait is None:
+            return float(forecast_wait)
+        half_life = self._config().get('LIVE_HALF_LIFE_MINUTES', 20)
+        weight = 0.5 ** (max(lead_minutes, 0.0) / half_life)
+        return weight * float(live_wait) + (1 - weight) * float(forecast_wait)
+
+    def merchant_waits(self, dishes: List[Any], lead_minutes: float = 0.0) -> Tuple[Dict[int, float], Dict[int, float]]:
+        """
+        各商家的预计等待时间（含窗口内已推荐人数带来的排队）
+
+        Returns:
+            (商家ID -> 预计等待时间, 商家ID -> 窗口内已推荐人数)
+        """
+        config = self._config()
+        waits = {}
+        for dish in dishes:
+            if dish['merchant_id'] not in waits:
+                waits[dish['merchant_id']] = self.effective_wait(
+                    dish.get('wait_time'), dish.get('expected_wait_time'), lead_minutes
+                )
+        pending = self.window.counts(waits, config.get('WINDOW_SECONDS', 300))
+        per_diner = config.get('LOAD_MINUTES_PER_DINER', 0.5)
+        for merchant_id in waits:
+            waits[merchant_id] += pending[merchant_id] * per_diner
+        return waits, pending
+
+    def within_wait(self, dishes: List[Any], max_wait_time: float, lead_minutes: float = 0.0) -> List[Any]:
+        """只保留预计等待时间不超过 max_wait_time 的菜品（保持原有顺序）"""
+        waits, _ = self.merchant_waits(dishes, lead_minutes)
+        return [dish for dish in dishes if waits[dish['merchant_id']] <= max_wait_time]
+
+    def rank(self, dishes: List[Any], limit: int, lead_minutes: float = 0.0,
+             max_wait_time: float = None) -> List[Any]:
+        """
+        分流排序并记录本次推荐
+
+        Args:
+            dishes: 候选菜品（需要 merchant_id、canteen、rating、wait_time，可选 expected_wait_time）
+            limit: 返回数量
+            lead_minutes: 距离取餐的分钟数
+            max_wait_time: 最大预计等待时间（分钟），超过的商家不参与推荐
+
+        Returns:
+            排好序的菜品列表
+        """
+        config = self._config()
+        waits, pending = self.merchant_waits(dishes, lead_minutes)
+        if max_wait_time is not None:
+            dishes = [dish for dish in dishes if waits[dish['merchant_id']] <= max_wait_time]
+
+        # 饱和的商家：预计等待时间过长，且窗口内推荐人数已达上限
+        saturated = {
+            merchant_id for merchant_id, wait in waits.items()
+            if wait >= config.get('SATURATED_WAIT', 20)
+            and pending[merchant_id] >= config.get('MAX_SATURATED_PER_WINDOW', 20)
+        }
+        wait_penalty = config.get('WAIT_PENALTY', 0.1)
+        base_scores = [
+            float(dish.get('rating') or 0) - wait_penalty * waits[dish['merchant_id']]
+            for dish in dishes
+        ]
+        available = [i for i, dish in enumerate(dishes) if dish['merchant_id'] not in saturated]
+        capped = [i for i, dish in enumerate(dishes) if dish['merchant_id'] in saturated]
+
+        # 贪心选取：已选食堂和商家的菜品依次降低得分，使结果分散
+        canteen_spread = config.get('CANTEEN_SPREAD', 0.3)
+        merchant_spread = config.get('MERCHANT_SPREAD', 0.5)
+        canteen_picks: Dict[Any, int] = defaultdict(int)
+        merchant_picks: Dict[int, int] = defaultdict(int)
+        selected: List[Any] = []
+        for pool in (available, capped):
+            pool = list(pool)
+            while pool and len(selected) < limit:
+                best = max(pool, key=lambda i: (
+                    base_scores[i]
+                    - canteen_spread * canteen_picks[dishes[i].get('canteen')]
+                    - merchant_spread * merchant_picks[dishes[i]['merchant_id']]
+                ))
+                pool.remove(best)
+                dish = dishes[best]
+                canteen_picks[dish.get('canteen')] += 1
+                merchant_picks[dish['merchant_id']] += 1
+                selected.append(dish)
+
+        self.record(selected)
+        return selected
+
+    def record(self, dishes: List[Any]) -> None:
+        """按排名位置分摊一位用户（第 i 位的权重与 1/i 成正比），计入各商家的窗口人数"""
+        if not dishes:
+            return
+        raw = [1.0 / position for position in range(1, len(dishes) + 1)]
+        total = sum(raw)
+        weights: Dict[int, float] = defaultdict(float)
+        for dish, value in zip(dishes, raw):
+            weights[dish['merchant_id']] += value / total
+        self.window.record(weights)
+
+
+# 创建全局实例
+queue_balancer = QueueBalancer()
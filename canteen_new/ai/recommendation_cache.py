@@ -0,0 +1,125 @@
+"""
+AI推荐结果缓存
+大部分推荐请求是少数几类意图的不同说法（"便宜的辣面"、"清淡点的"、"二食堂的饺子"），
+关键词提取后的初始参数往往相同。缓存以规范化的初始参数和粗粒度的情景分段
+（季节、气温区间、客流等级、工作日/周末、节日）为键，保存 LLM 生成的工具函数参数、回复和推荐理由；
+命中时跳过 LLM 调用，只执行菜品查询。
+缓存键包含菜单版本号，菜单变化后旧结果自然失效；每条结果另有有效期。
+"""
+import hashlib
+import json
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+
+# 与具体请求相关、不参与缓存键的参数，命中后使用本次请求的值
+REQUEST_PARAMS = ('pickup_time',)
+
+
+def _normalize(value: Any) -> Any:
+    if isinstance(value, str):
+        return value.strip().lower()
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, (list, tuple)):
+        return [_normalize(item) for item in value]
+    return value
+
+
+def normalize_params(params: Dict[str, Any]) -> Dict[str, Any]:
+    """规范化初始参数：去掉空值和请求相关的参数，统一字符串大小写和数值类型"""
+    return {
+        key: _normalize(value)
+        for key, value in sorted(params.items())
+        if key not in REQUEST_PARAMS and value not in (None, '', [], {})
+    }
+
+
+def temperature_band(temperature: Any) -> str:
+    """气温区间，与提示词中的冷热划分一致"""
+    try:
+        temperature = float(temperature)
+    except (TypeError, ValueError):
+        return 'unknown'
+    cold, hot = settings.RECOMMENDATION_CACHE.get('TEMPERATURE_BANDS', (10, 25))
+    if temperature < cold:
+        return 'cold'
+    if temperature > hot:
+        return 'hot'
+    return 'mild'
+
+
+def context_bucket(context_data: Dict[str, Any]) -> Dict[str, Any]:
+    """粗粒度的情景分段：季节、气温区间、客流等级、工作日/周末、节日标签（提示词会据此推荐节日菜品）"""
+    date_info = context_data.get('date_info', {})
+    return {
+        "season": date_info.get('current_season'),
+        "temperature": temperature_band(context_data.get('weather_info', {}).get('temperature')),
+        "crowd": context_data.get('crowd_info', {}).get('crowd_level'),
+        "weekend": bool(date_info.get('is_weekend')),
+        "festivals": sorted(date_info.get('festival_tags') or []),
+    }
+
+
+class RecommendationCache:
+    """按规范化参数和情景分段缓存 LLM 的推荐决策"""
+
+    @staticmethod
+    def _config() -> Dict[str, Any]:
+        return settings.RECOMMENDATION_CACHE
+
+    def is_enabled(self) -> bool:
+        return self._config().get('ENABLED', True)
+
+    def make_key(self, initial_params: Dict[str, Any], context_data: Dict[str, Any]) -> str:
+        """
+        生成缓存键
+
+        Args:
+            initial_params: 关键词提取（及偏好融合）得到的初始参数
+            context_data: 情景数据
+
+        Returns:
+            包含菜单版本号的缓存键
+        """
+        from data.versioning import version_counter, MENU_VERSION
+
+        payload = json.dumps(
+            {"params": normalize_params(initial_params), "context": context_bucket(context_data)},
+            ensure_ascii=False, sort_keys=True, default=str
+        )
+        digest = hashlib.sha1(payload.encode('utf-8')).hexdigest()
+        return f"ai_recommendation:{version_counter.get(MENU_VERSION)}:{digest}"
+
+    def get(self, key: str, initial_params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        读取缓存的推荐决策
+
+        Returns:
+            {tool_args, content, llm_reason}，tool_args 中请求相关的参数已替换为本次请求的值；未命中时为 None
+        """
+        if not self.is_enabled():
+            return None
+        entry = cache.get(key)
+        if entry is None:
+            return None
+        tool_args = {k: v for k, v in entry['tool_args'].items() if k not in REQUEST_PARAMS}
+        for name in REQUEST_PARAMS:
+            if initial_params.get(name) is not None:
+                tool_args[name] = initial_params[name]
+        return {**entry, "tool_args": tool_args}
+
+    def set(self, key: str, tool_args: Dict[str, Any], content: Optional[str], llm_reason: Optional[str]) -> None:
+        """保存 LLM 生成的工具函数参数（不含推荐理由）、回复和推荐理由"""
+        if not self.is_enabled():
+            return
+        cache.set(
+            key,
+            {"tool_args": dict(tool_args), "content": content, "llm_reason": llm_reason},
+            self._config().get('TTL', 600)
+        )
+
+
+# 创建全局实例
+recommendation_cache = RecommendationCache()
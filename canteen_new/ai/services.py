@@ -3,6 +3,7 @@ AI推荐服务层
 实现LLM调用和智能推荐功能
 """
 import json
+from functools import lru_cache
 from typing import Dict, Any, List, Optional
 from .utils import GET_DISHES_SCHEMA, get_dishes_by_criteria, validate_tool_arguments
 from .context_service import ContextService
@@ -45,7 +46,8 @@ class AIRecommendationService:
         print(f"消息内容: {messages}")
         
         # 调用真实LLM服务
-        from .llm_service import llm_service
+        from .llm_service import get_llm_service
+        llm_service = get_llm_service()
         print(f"1. LLM服务状态: {llm_service.client}")
         print(f"2. LLM配置: {llm_service.setup_client()}")
         
@@ -587,7 +589,8 @@ class AIRecommendationService:
         ]
         
         # 调用真实LLM服务
-        from .llm_service import llm_service
+        from .llm_service import get_llm_service
+        llm_service = get_llm_service()
         print(f"LLM服务状态: {llm_service.client}")
         
         try:
@@ -825,5 +828,15 @@ class AIRecommendationService:
         return reasons
 
 
-# 创建服务实例
-ai_recommendation_service = AIRecommendationService()
+# 服务实例在首次使用时创建
+@lru_cache(maxsize=None)
+def get_ai_recommendation_service() -> AIRecommendationService:
+    """获取全局AI推荐服务实例"""
+    return AIRecommendationService()
+
+
+def __getattr__(name):
+    # 兼容 from ai.services import ai_recommendation_service
+    if name == 'ai_recommendation_service':
+        return get_ai_recommendation_service()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
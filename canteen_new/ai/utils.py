@@ -2,8 +2,13 @@
 AI工具函数模块
 定义AI模型可调用的工具函数Schema
 """
+from datetime import datetime
 from typing import Dict, Any, List, Optional
 
+# 工具参数中可接受的客流级别 -> 商家实时状态中的人流量等级（可接受该级别及以下）；
+# 没有客流记录（unknown）的商家不视为超出上限
+CROWD_LEVELS = {'低': 'low,unknown', '中等': 'low,medium,unknown', '高': None}
+
 
 def get_dishes_by_criteria(
     name: str = None,
@@ -17,7 +22,8 @@ def get_dishes_by_criteria(
     limit: int = 10,
     max_wait_time: int = None,
     crowd_level: str = None,
-    canteen: str = None
+    canteen: str = None,
+    pickup_time: str = None
 ) -> List[Dict[str, Any]]:
     """
     根据多种条件查询菜品，支持等待时间、客流级别和食堂筛选
@@ -30,19 +36,25 @@ def get_dishes_by_criteria(
         max_price: 最高价格，单位：元
         min_rating: 最低评分，范围0.0-5.0
         spice_level: 辣度级别，整数值0到5，0为不辣，5为特辣
-        sort_by: 排序方式：rating(评分)、price_asc(价格升序)、price_desc(价格降序)、created_at(最新)
+        sort_by: 排序方式：balanced(排队分流，默认)、rating(评分)、price_asc(价格升序)、price_desc(价格降序)、created_at(最新)
         limit: 返回结果数量限制，默认10，最大50
-        max_wait_time: 最大等待时间（分钟），用于筛选出餐快的菜品
-        crowd_level: 客流级别：低、中等、高，用于推荐等待时间合适的菜品
+        max_wait_time: 最大等待时间（分钟），按取餐时的预计等待时间筛选
+        crowd_level: 可接受的客流级别：低、中等、高，只推荐当前人流量不高于该级别的商家
         canteen: 所属食堂：一食堂、二食堂、三食堂、四食堂、其他
+        pickup_time: 取餐时间（YYYY-MM-DD HH:MM 或 HH:MM），为菜品填写该时刻的预计等待时间
     
     Returns:
         符合条件的菜品列表
     """
     print(f"\n=== 工具函数调试信息 ===")
-    print(f"接收参数: name={name}, category={category}, taste={taste}, min_price={min_price}, max_price={max_price}, min_rating={min_rating}, spice_level={spice_level}, sort_by={sort_by}, limit={limit}, canteen={canteen}")
+    print(f"接收参数: name={name}, category={category}, taste={taste}, min_price={min_price}, max_price={max_price}, min_rating={min_rating}, spice_level={spice_level}, sort_by={sort_by}, limit={limit}, max_wait_time={max_wait_time}, crowd_level={crowd_level}, canteen={canteen}, pickup_time={pickup_time}")
     
     from data.services import dish_service
+    from data.wait_forecast import wait_forecaster, parse_pickup_time
+    from .queue_routing import queue_balancer
+    
+    # 未指定排序方式时使用排队分流排序
+    balanced = sort_by in (None, 'balanced') and queue_balancer.is_enabled()
     
     # 构建查询条件
     criteria = {}
@@ -59,8 +71,10 @@ def get_dishes_by_criteria(
     if spice_level is not None:
         # 辣度等级作为上限，查找小于等于指定辣度的菜品
         criteria['spice_level'] = spice_level
-    if sort_by:
+    if sort_by and sort_by != 'balanced':
         criteria['ordering'] = sort_by
+    if CROWD_LEVELS.get(crowd_level):
+        criteria['crowd_level'] = CROWD_LEVELS[crowd_level]
     if canteen:
         criteria['hall'] = canteen  # 注意：数据库服务使用'hall'参数，不是'canteen'
     
@@ -82,6 +96,27 @@ def get_dishes_by_criteria(
         dishes = [dish for dish in dishes if dish.get('rating', 0) >= min_rating]
         print(f"评分筛选后: {len(dishes)} 个菜品")
     
+    # 填写取餐时刻（默认当前）的预计等待时间，与实时等待时间一起用于等待时间筛选和分流排序
+    now = datetime.now()
+    at = None
+    if pickup_time:
+        try:
+            at = parse_pickup_time(pickup_time)
+        except ValueError as e:
+            print(f"警告：{e}")
+    lead_minutes = max((at - now).total_seconds() / 60, 0.0) if at else 0.0
+    if pickup_time or balanced or max_wait_time is not None:
+        wait_forecaster.annotate(dishes, at or now)
+    
+    if balanced:
+        print(f"应用排队分流排序: max_wait_time={max_wait_time}, 距取餐 {lead_minutes:.0f} 分钟")
+        dishes = queue_balancer.rank(dishes, limit or 10, lead_minutes, max_wait_time)
+        print(f"分流排序后: {len(dishes)} 个菜品")
+    elif max_wait_time is not None:
+        print(f"应用等待时间筛选: max_wait_time={max_wait_time}")
+        dishes = queue_balancer.within_wait(dishes, max_wait_time, lead_minutes)
+        print(f"等待时间筛选后: {len(dishes)} 个菜品")
+    
     # 应用数量限制
     if limit and len(dishes) > limit:
         print(f"应用数量限制: limit={limit}")
@@ -131,7 +166,7 @@ GET_DISHES_SCHEMA = {
                 },
                 "sort_by": {
                     "type": "string",
-                    "description": "排序方式：rating(评分)、price_asc(价格升序)、price_desc(价格降序)、created_at(最新)"
+                    "description": "排序方式：balanced(排队分流，综合评分与预计等待时间，默认)、rating(评分)、price_asc(价格升序)、price_desc(价格降序)、created_at(最新)"
                 },
                 "limit": {
                     "type": "integer", 
@@ -139,16 +174,20 @@ GET_DISHES_SCHEMA = {
                 },
                 "max_wait_time": {
                     "type": "integer",
-                    "description": "最大等待时间（分钟），用于筛选出餐快的菜品"
+                    "description": "最大等待时间（分钟），按取餐时的预计等待时间筛选出餐快的菜品"
                 },
                 "crowd_level": {
                     "type": "string",
-                    "description": "客流级别：低、中等、高，用于推荐等待时间合适的菜品"
+                    "description": "可接受的客流级别：低、中等、高，只推荐当前人流量不高于该级别的商家"
                 },
                 "canteen": {
                     "type": "string",
                     "description": "所属食堂：一食堂、二食堂、三食堂、四食堂、其他"
                 },
+                "pickup_time": {
+                    "type": "string",
+                    "description": "取餐时间，格式YYYY-MM-DD HH:MM；初始参数中有该值时必须原样保留"
+                },
                 "llm_reason": {
                     "type": "string",
                     "description": "简洁的推荐理由，基于筛选条件和情景数据合理描述"
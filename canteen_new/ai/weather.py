@@ -0,0 +1,185 @@
+"""
+天气数据提供方与缓存
+天气数据由可替换的提供方获取（高德天气、本地桩数据），结果保存在 Django 缓存中供各工作进程共享。
+读取时不会等待外部 HTTP 请求：缓存未过期直接返回；过期后先返回旧数据，
+同时在后台线程刷新（stale-while-revalidate）；缓存为空时返回 None 由调用方使用备用数据，
+并同样在后台刷新。多个进程同时发现过期时，只有取得刷新锁的进程会请求提供方。
+"""
+import logging
+import re
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+
+def wind_power_to_level(wind_power: str) -> int:
+    """将高德天气的风力描述（如 "3-4级"、"≤3"、"微风"）转换为风力等级"""
+    if not wind_power or wind_power == '微风':
+        return 1
+    numbers = re.findall(r'\d+', wind_power)
+    # 取第一个数字作为风力等级
+    return int(numbers[0]) if numbers else 1
+
+
+class WeatherProvider(ABC):
+    """天气数据提供方接口"""
+
+    name = 'base'
+
+    def is_configured(self) -> bool:
+        return True
+
+    @abstractmethod
+    def fetch(self) -> Dict[str, Any]:
+        """
+        获取当前天气，失败时抛出异常
+
+        Returns:
+            {weather, temperature, humidity, wind_level, wind_direction}
+        """
+
+
+class AmapWeatherProvider(WeatherProvider):
+    """高德天气（实时天气）"""
+
+    name = 'gaode'
+    api_url = "https://restapi.amap.com/v3/weather/weatherInfo"
+
+    def __init__(self, api_key: Optional[str], city: str, timeout: float = 10):
+        self.api_key = api_key
+        self.city = city
+        self.timeout = timeout
+
+    def is_configured(self) -> bool:
+        return bool(self.api_key)
+
+    def fetch(self) -> Dict[str, Any]:
+        import requests
+
+        params = {
+            'key': self.api_key,
+            'city': self.city,
+            'extensions': 'base',  # base: 实时天气, all: 预报天气
+            'output': 'JSON'
+        }
+        response = requests.get(self.api_url, params=params, timeout=self.timeout)
+        response.raise_for_status()
+        data = response.json()
+        if data.get('status') != '1' or not data.get('lives'):
+            raise ValueError(f"高德天气API返回错误: {data.get('info', '未知错误')}")
+
+        weather_data = data['lives'][0]
+        return {
+            "weather": weather_data.get('weather', '未知'),
+            "temperature": int(weather_data.get('temperature', 0)),
+            "humidity": int(weather_data.get('humidity', 0)),
+            "wind_level": wind_power_to_level(weather_data.get('windpower', '0级')),
+            "wind_direction": weather_data.get('winddirection', '未知'),
+        }
+
+
+class StubWeatherProvider(WeatherProvider):
+    """本地桩数据，用于测试和没有网络的开发环境"""
+
+    name = 'stub'
+
+    def __init__(self, weather: str = '晴', temperature: int = 20, humidity: int = 50,
+                 wind_level: int = 2, wind_direction: str = '东'):
+        self.data = {
+            "weather": weather,
+            "temperature": temperature,
+            "humidity": humidity,
+            "wind_level": wind_level,
+            "wind_direction": wind_direction,
+        }
+
+    def fetch(self) -> Dict[str, Any]:
+        return dict(self.data)
+
+
+def create_weather_provider() -> WeatherProvider:
+    """根据 WEATHER['PROVIDER'] 创建天气提供方"""
+    config = settings.WEATHER
+    provider = config.get('PROVIDER', 'gaode')
+    if provider == 'stub':
+        return StubWeatherProvider()
+    if provider in ('gaode', 'amap'):
+        return AmapWeatherProvider(config.get('API_KEY'), config.get('CITY', '北京'), config.get('TIMEOUT', 10))
+    raise ValueError(f"不支持的天气数据提供方: {provider}")
+
+
+class WeatherCache:
+    """共享天气缓存（stale-while-revalidate）"""
+
+    def __init__(self, provider: WeatherProvider = None):
+        self._provider = provider
+        # 本进程同一时间只启动一个刷新线程
+        self._refreshing = threading.Lock()
+
+    @property
+    def provider(self) -> WeatherProvider:
+        if self._provider is None:
+            self._provider = create_weather_provider()
+        return self._provider
+
+    def _cache_key(self) -> str:
+        return f"weather:{self.provider.name}:{settings.WEATHER.get('CITY', '')}"
+
+    def is_configured(self) -> bool:
+        return self.provider.is_configured()
+
+    def get(self) -> Optional[Dict[str, Any]]:
+        """
+        读取天气（不等待外部请求）
+
+        Returns:
+            天气数据，缓存为空时为 None；缓存过期或为空时触发后台刷新
+        """
+        entry = cache.get(self._cache_key())
+        if entry is None or time.time() - entry['fetched_at'] >= settings.WEATHER.get('FRESH_TTL', 600):
+            self._refresh_in_background()
+        return entry['data'] if entry is not None else None
+
+    def refresh(self) -> Optional[Dict[str, Any]]:
+        """
+        同步刷新天气（在后台线程或定时任务中调用）
+
+        Returns:
+            新的天气数据，其他进程正在刷新或提供方失败时为 None
+        """
+        config = settings.WEATHER
+        lock_key = f"{self._cache_key()}:lock"
+        # 刷新锁在提供方超时后自动释放
+        if not cache.add(lock_key, True, config.get('TIMEOUT', 10) + 5):
+            return None
+        try:
+            data = self.provider.fetch()
+            cache.set(self._cache_key(), {"data": data, "fetched_at": time.time()}, config.get('STALE_TTL', 3 * 3600))
+            return data
+        except Exception as e:
+            logger.warning(f"刷新天气数据失败（{self.provider.name}）: {e}")
+            return None
+        finally:
+            cache.delete(lock_key)
+
+    def _refresh_in_background(self) -> None:
+        if not self._refreshing.acquire(blocking=False):
+            return
+
+        def run():
+            try:
+                self.refresh()
+            finally:
+                self._refreshing.release()
+
+        threading.Thread(target=run, name='weather-refresh', daemon=True).start()
+
+
+# 创建全局实例
+weather_cache = WeatherCache()
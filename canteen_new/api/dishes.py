@@ -8,6 +8,7 @@ from rest_framework import status
 from core.response import api_success, api_error, api_validation_error
 from core.exceptions import ValidationException, BusinessException
 from data.services import dish_service
+from data.wait_forecast import parse_pickup_time
 
 
 @api_view(['GET'])
@@ -15,6 +16,8 @@ def dish_search(request):
     """
     菜品搜索
     GET /api/dishes/search?q={query}&page={page}&limit={limit}
+    GET /api/dishes/search?q={query}&cursor={next_cursor}&limit={limit}  游标翻页
+    GET /api/dishes/search?q={query}&pickup_time={HH:MM或ISO时间}  附带取餐时的预计等待时间
     """
     try:
         # 获取查询参数
@@ -30,6 +33,12 @@ def dish_search(request):
             'ordering': ordering
         }
         
+        # 游标翻页（使用上一页返回的 pagination.next_cursor），游标翻页默认不统计总数
+        if request.GET.get('cursor'):
+            filters['cursor'] = request.GET.get('cursor')
+        if request.GET.get('include_total'):
+            filters['include_total'] = request.GET.get('include_total').lower() == 'true'
+        
         # 添加额外的筛选条件（从搜索结果页应用筛选）
         if request.GET.get('price_min'):
             filters['priceMin'] = float(request.GET.get('price_min'))
@@ -41,6 +50,11 @@ def dish_search(request):
             filters['crowd_level'] = request.GET.get('crowd_level')
         if request.GET.get('hall'):
             filters['hall'] = request.GET.get('hall')
+        if request.GET.get('pickup_time'):
+            try:
+                filters['pickup_time'] = parse_pickup_time(request.GET.get('pickup_time'))
+            except ValueError as e:
+                return api_validation_error(str(e))
         
         # 调用服务层进行搜索
         result = dish_service.search_dishes_service(query, filters)
@@ -124,11 +138,15 @@ def dish_filter(request):
 def popular_dishes(request):
     """
     热门推荐
-    GET /api/dishes/popular
+    GET /api/dishes/popular?limit={limit}&canteen={canteen}&category={category}
     """
     try:
+        limit = max(1, min(int(request.GET.get('limit', 10)), 50))
+        canteen = request.GET.get('canteen')
+        category = request.GET.get('category')
+        
         # 调用服务层获取热门菜品
-        dishes = dish_service.get_popular_dishes()
+        dishes = dish_service.get_popular_dishes(limit, canteen, category)
         
         return api_success({"dishes": dishes}, "获取热门菜品成功")
         
@@ -140,18 +158,20 @@ def popular_dishes(request):
 def random_dishes(request):
     """
     随机菜品推荐
-    GET /api/dishes/random?limit={limit}
+    GET /api/dishes/random?limit={limit}&canteen={canteen}&category={category}
     """
     try:
         # 获取参数，默认返回5个菜品
-        limit = int(request.GET.get('limit', 5))
+        limit = max(1, int(request.GET.get('limit', 5)))
+        canteen = request.GET.get('canteen')
+        category = request.GET.get('category')
         
         # 限制最大数量
         if limit > 20:
             limit = 20
         
         # 调用服务层获取随机菜品
-        dishes = dish_service.get_random_dishes(limit)
+        dishes = dish_service.get_random_dishes(limit, canteen, category)
         
         return api_success({"dishes": dishes}, "获取随机菜品成功")
         
@@ -169,9 +189,15 @@ def ai_recommend(request):
         query = request.data.get('query', '')
         merge_user_preference = request.data.get('merge_user_preference', False)
         user_id = request.data.get('user_id')
+        pickup_time = request.data.get('pickup_time')
         
         if not query:
             return api_validation_error("查询内容不能为空")
+        if pickup_time:
+            try:
+                pickup_time = parse_pickup_time(pickup_time)
+            except ValueError as e:
+                return api_validation_error(str(e))
         
         # 如果前端没有传递user_id，尝试从认证用户获取
         if not user_id and request.user and request.user.is_authenticated:
@@ -180,8 +206,8 @@ def ai_recommend(request):
         print(f"AI推荐请求 - 查询: {query}, 用户ID: {user_id}, 融合用户偏好: {merge_user_preference}")
         
         # 调用新的AI编排器
-        from ai.orchestrator import ai_orchestrator
-        result = ai_orchestrator.process_query(query, user_id, merge_user_preference)
+        from ai.orchestrator import get_ai_orchestrator
+        result = get_ai_orchestrator().process_query(query, user_id, merge_user_preference, pickup_time or None)
         
         # 添加API调用状态信息
         enhanced_result = {
@@ -1,6 +1,6 @@
 """
 商家管理API模块
-实现商家菜品列表、添加菜品、更新菜品、删除菜品、客流量上报等功能
+实现商家菜品列表、添加菜品、更新菜品、删除菜品、批量管理菜品、菜单导入、客流量上报等功能
 """
 from rest_framework.decorators import api_view, parser_classes
 from rest_framework import status
@@ -8,12 +8,15 @@ from rest_framework.parsers import MultiPartParser, FormParser
 from django.core.files.storage import default_storage
 from django.core.files.base import ContentFile
 from django.conf import settings
+from django.db import IntegrityError
+import io
 import os
 
 from core.response import api_success, api_error, api_validation_error
 from core.exceptions import ValidationException, BusinessException
 from data.services import merchant_service
 from data.repositories import DishRepository, MerchantRepository
+from data.menu_import import menu_importer, detect_format, IMPORT_FORMATS
 
 
 @api_view(['GET'])
@@ -180,6 +183,70 @@ def delete_dish(request, dish_id):
         return api_error("SERVER_001", str(e), "服务器内部错误", status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+@api_view(['POST'])
+def bulk_dishes(request):
+    """
+    批量管理菜品（新建、更新、删除），全部校验通过后在一个事务中执行
+    POST /api/merchants/dishes/bulk
+    """
+    try:
+        merchant_id = request.data.get('merchant_id')
+        
+        if not merchant_id:
+            return api_validation_error("商家ID不能为空")
+        
+        result = merchant_service.bulk_manage_dishes_service(
+            merchant_id=merchant_id,
+            operations=request.data.get('operations')
+        )
+        
+        return api_success(result, "菜品批量操作成功")
+        
+    except ValidationException as e:
+        return api_validation_error(e.error_details)
+    except IntegrityError as e:
+        print(f"菜品批量操作冲突: {str(e)}")
+        return api_error("DUPLICATE_DISH", "菜品名称冲突", "菜品名称与已有菜品重复，请修改后重试", status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        print(f"菜品批量操作错误: {str(e)}")
+        return api_error("SERVER_001", str(e), "服务器内部错误", status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['POST'])
+@parser_classes([MultiPartParser, FormParser])
+def import_menu(request):
+    """
+    从 CSV 或 NDJSON 文件批量导入本商家菜品（流式读取，逐行报告错误）
+    POST /api/merchants/menu/import
+    表单字段: merchant_id, file, format(可选), dry_run(可选)
+    """
+    try:
+        merchant_id = request.data.get('merchant_id')
+        file_obj = request.FILES.get('file')
+        
+        if not merchant_id:
+            return api_validation_error("商家ID不能为空")
+        if not file_obj:
+            return api_validation_error("未收到导入文件(file)")
+        
+        fmt = request.data.get('format') or detect_format(file_obj.name)
+        if fmt not in IMPORT_FORMATS:
+            return api_validation_error("文件格式必须是 csv 或 ndjson")
+        dry_run = str(request.data.get('dry_run', '')).lower() in ('true', '1')
+        
+        stream = io.TextIOWrapper(file_obj.file, encoding='utf-8-sig', newline='')
+        report = menu_importer.run(stream, fmt, int(merchant_id), dry_run)
+        
+        return api_success(report, "菜单校验完成" if dry_run else "菜单导入完成")
+        
+    except ValueError as e:
+        # 包括商家ID格式错误和文件编码错误
+        return api_validation_error(str(e))
+    except Exception as e:
+        print(f"菜单导入错误: {str(e)}")
+        return api_error("SERVER_001", str(e), "服务器内部错误", status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
 @api_view(['POST'])
 def report_traffic(request):
     """
@@ -2,14 +2,16 @@
 商家管理API路由配置
 """
 from django.urls import path, re_path
-from .merchant import merchant_dishes, add_dish, update_dish, delete_dish, report_traffic, merchant_list, upload_image
+from .merchant import merchant_dishes, add_dish, update_dish, delete_dish, bulk_dishes, import_menu, report_traffic, merchant_list, upload_image
 
 urlpatterns = [
     # 商家菜品管理
     re_path(r'^dishes/?$', merchant_dishes, name='merchant_dishes'),
     re_path(r'^dishes/add/?$', add_dish, name='add_dish'),
+    re_path(r'^dishes/bulk/?$', bulk_dishes, name='bulk_dishes'),
     re_path(r'^dishes/(?P<dish_id>\d+)/?$', update_dish, name='update_dish'),
     re_path(r'^dishes/(?P<dish_id>\d+)/delete/?$', delete_dish, name='delete_dish'),
+    re_path(r'^menu/import/?$', import_menu, name='import_menu'),
     
     # 客流量管理
     re_path(r'^traffic/?$', report_traffic, name='report_traffic'),
@@ -41,7 +41,7 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.AllowAny',
     ],
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
+        'core.response.FastJSONRenderer',
     ],
     'DEFAULT_PARSER_CLASSES': [
         'rest_framework.parsers.JSONParser',
@@ -63,6 +63,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'data.replication.ReadYourWritesMiddleware',  # 读写分离：写后读主库
 ]
 
 ROOT_URLCONF = 'config.urls'
@@ -87,7 +88,8 @@ WSGI_APPLICATION = 'config.wsgi.application'
 # Database
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.mysql',
+        # 带连接池的 MySQL 后端，连接在请求结束时归还连接池而不是断开
+        'ENGINE': 'data.backends.mysql',
         'NAME': os.getenv('DB_NAME', 'canteen_management'),
         'USER': os.getenv('DB_USER', 'root'),
         'PASSWORD': os.getenv('DB_PASSWORD', ''),
@@ -95,10 +97,56 @@ DATABASES = {
         'PORT': os.getenv('DB_PORT', '3306'),
         'OPTIONS': {
             'charset': 'utf8mb4',
-        }
+        },
+        # 连接池（见 data.database.ConnectionPool）。请求之外的线程须在
+        # data.database.db_connection_scope() 中访问数据库并自行归还连接，
+        # 未归还的连接在线程结束后才由连接池回收
+        'POOL': {
+            'ENABLED': os.getenv('DB_POOL_ENABLED', 'True').lower() == 'true',
+            # 每个进程最多同时借出的连接数
+            'MAX_SIZE': int(os.getenv('DB_POOL_MAX_SIZE', '10')),
+            # 等待空闲连接的最长时间（秒）
+            'TIMEOUT': float(os.getenv('DB_POOL_TIMEOUT', '10')),
+            # 空闲超过该时长（秒）的连接被关闭，应小于 MySQL 的 wait_timeout
+            'IDLE_TIMEOUT': float(os.getenv('DB_POOL_IDLE_TIMEOUT', '300')),
+            # 连接最长使用时间（秒）
+            'MAX_LIFETIME': float(os.getenv('DB_POOL_MAX_LIFETIME', '3600')),
+            # 借出空闲超过 PING_INTERVAL 秒的连接前先 ping 检查
+            'PRE_PING': os.getenv('DB_POOL_PRE_PING', 'True').lower() == 'true',
+            'PING_INTERVAL': float(os.getenv('DB_POOL_PING_INTERVAL', '5')),
+        },
+    }
+}
+
+# 缓存（默认进程内缓存；多进程部署时配置共享缓存，例如
+# CACHE_BACKEND=django.core.cache.backends.redis.RedisCache, CACHE_LOCATION=redis://127.0.0.1:6379/1）
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
     }
 }
 
+# 只读副本，格式: host[:port]，多个以逗号分隔；未配置时读写都走主库
+READ_REPLICAS = []
+for _index, _replica in enumerate(filter(None, os.getenv('DB_REPLICA_HOSTS', '').split(',')), start=1):
+    _host, _, _port = _replica.strip().partition(':')
+    _alias = f'replica_{_index}'
+    DATABASES[_alias] = {
+        **DATABASES['default'],
+        'HOST': _host,
+        'PORT': _port or DATABASES['default']['PORT'],
+        'TEST': {'MIRROR': 'default'},
+    }
+    READ_REPLICAS.append(_alias)
+
+# 读写分离配置
+READ_WRITE_SPLIT = {
+    # 发生写操作后，该客户端在此时长（秒）内的读取仍走主库，保证读到自己的写入
+    'READ_YOUR_WRITES_WINDOW': float(os.getenv('DB_READ_YOUR_WRITES_WINDOW', '5')),
+    'COOKIE_NAME': 'db_primary_until',
+}
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -131,6 +179,151 @@ MEDIA_ROOT = BASE_DIR / 'media'
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# 数据版本检查间隔（秒），进程内缓存最多滞后该时长感知其他进程的写入
+DATA_VERSION_CHECK_INTERVAL = float(os.getenv('DATA_VERSION_CHECK_INTERVAL', '1.0'))
+
+# 进程内菜品目录配置
+DISH_CATALOG = {
+    'ENABLED': os.getenv('DISH_CATALOG_ENABLED', 'True').lower() == 'true',
+}
+
+# 菜品搜索配置
+DISH_SEARCH = {
+    # 分页总数缓存时长（秒），按筛选条件签名和数据版本缓存
+    'TOTAL_CACHE_TTL': int(os.getenv('DISH_SEARCH_TOTAL_CACHE_TTL', '30')),
+    # 是否使用进程内二元组全文索引匹配关键词（关闭时回退到 LIKE 模糊匹配）
+    'INDEX_ENABLED': os.getenv('DISH_SEARCH_INDEX_ENABLED', 'True').lower() == 'true',
+    # 是否使用内存搜索建议索引（关闭时回退到数据库 LIKE 查询）
+    'SUGGEST_ENABLED': os.getenv('DISH_SUGGEST_ENABLED', 'True').lower() == 'true',
+    # 搜索建议热度（订单数、收藏数）的刷新间隔（秒），菜单变化时立即刷新
+    'SUGGEST_REFRESH_INTERVAL': int(os.getenv('DISH_SUGGEST_REFRESH_INTERVAL', '300')),
+}
+
+# 菜品热度排行配置
+POPULARITY = {
+    # 热度半衰期（小时）
+    'HALF_LIFE_HOURS': float(os.getenv('POPULARITY_HALF_LIFE_HOURS', '72')),
+    # 每份订单、每次收藏计入的热度
+    'ORDER_WEIGHT': float(os.getenv('POPULARITY_ORDER_WEIGHT', '1.0')),
+    'FAVORITE_WEIGHT': float(os.getenv('POPULARITY_FAVORITE_WEIGHT', '2.0')),
+    # 进程内排行榜与数据库同步的间隔（秒），本进程的事件立即生效
+    'REFRESH_INTERVAL': int(os.getenv('POPULARITY_REFRESH_INTERVAL', '60')),
+    # 压缩时删除热度低于该值的记录
+    'MIN_SCORE': float(os.getenv('POPULARITY_MIN_SCORE', '0.01')),
+}
+
+# 客流量数据保留策略（天数为空表示永久保留），由 python manage.py prune_traffic 定时执行
+TRAFFIC_RETENTION = {
+    # 原始上报（分析查询读取汇总表，原始数据只用于排查问题）
+    'RAW_DAYS': int(os.getenv('TRAFFIC_RAW_RETENTION_DAYS', '7')),
+    # 分钟/小时/天汇总
+    'MINUTE_DAYS': int(os.getenv('TRAFFIC_MINUTE_RETENTION_DAYS', '3')),
+    'HOUR_DAYS': int(os.getenv('TRAFFIC_HOUR_RETENTION_DAYS', '180')),
+    'DAY_DAYS': int(os.getenv('TRAFFIC_DAY_RETENTION_DAYS', '0')) or None,
+    # 每批删除的行数和批次间隔（秒），避免长事务和锁等待
+    'BATCH_SIZE': int(os.getenv('TRAFFIC_PRUNE_BATCH_SIZE', '1000')),
+    'BATCH_PAUSE': float(os.getenv('TRAFFIC_PRUNE_BATCH_PAUSE', '0.05')),
+}
+
+# 实时客流统计配置
+TRAFFIC_STATS = {
+    # 统计窗口（分钟），趋势与上一个等长窗口比较
+    'WINDOW_MINUTES': int(os.getenv('TRAFFIC_STATS_WINDOW_MINUTES', '15')),
+    # 统计结果缓存时间（秒）
+    'CACHE_TTL': int(os.getenv('TRAFFIC_STATS_CACHE_TTL', '15')),
+    # 均值变化超过该比例时视为上升/下降
+    'TREND_THRESHOLD': float(os.getenv('TRAFFIC_STATS_TREND_THRESHOLD', '0.15')),
+}
+
+# 等待时间预测配置，由 python manage.py train_wait_forecast 每晚增量训练
+WAIT_FORECAST = {
+    'ENABLED': os.getenv('WAIT_FORECAST_ENABLED', 'True').lower() == 'true',
+    # 模型文件路径
+    'MODEL_PATH': os.getenv('WAIT_FORECAST_MODEL_PATH', str(BASE_DIR / 'models' / 'wait_forecast.npz')),
+    # 全量训练读取的历史天数
+    'HISTORY_DAYS': int(os.getenv('WAIT_FORECAST_HISTORY_DAYS', '56')),
+    # 历史数据每过一周的权重衰减系数
+    'WEEKLY_DECAY': float(os.getenv('WAIT_FORECAST_WEEKLY_DECAY', '0.8')),
+    # 收缩强度：时段样本数与该值相当时，商家估计与食堂估计各占一半
+    'PRIOR_STRENGTH': float(os.getenv('WAIT_FORECAST_PRIOR_STRENGTH', '5')),
+    # 服务进程检查模型文件更新的间隔（秒）
+    'REFRESH_INTERVAL': int(os.getenv('WAIT_FORECAST_REFRESH_INTERVAL', '300')),
+}
+
+# 排队感知的推荐分流配置（AI推荐未指定排序方式时使用）
+QUEUE_ROUTING = {
+    'ENABLED': os.getenv('QUEUE_ROUTING_ENABLED', 'True').lower() == 'true',
+    # 每分钟预计等待时间折算的评分（0.1 即多等 10 分钟相当于评分低 1 分）
+    'WAIT_PENALTY': float(os.getenv('QUEUE_ROUTING_WAIT_PENALTY', '0.1')),
+    # 取餐时间每推迟该分钟数，实时等待时间的权重减半（其余使用预测等待时间）
+    'LIVE_HALF_LIFE_MINUTES': float(os.getenv('QUEUE_ROUTING_LIVE_HALF_LIFE_MINUTES', '20')),
+    # 滑动窗口长度（秒），以及窗口内每推荐一人增加的预计等待时间（分钟）
+    # 窗口计数按分桶（秒）保存在缓存中，多进程部署需配置共享缓存，否则计数和饱和上限按进程计算
+    'WINDOW_SECONDS': int(os.getenv('QUEUE_ROUTING_WINDOW_SECONDS', '300')),
+    'WINDOW_BUCKET_SECONDS': int(os.getenv('QUEUE_ROUTING_WINDOW_BUCKET_SECONDS', '30')),
+    'LOAD_MINUTES_PER_DINER': float(os.getenv('QUEUE_ROUTING_LOAD_MINUTES_PER_DINER', '0.5')),
+    # 预计等待时间达到该值（分钟）视为饱和，饱和商家在窗口内最多被推荐的人数
+    'SATURATED_WAIT': float(os.getenv('QUEUE_ROUTING_SATURATED_WAIT', '20')),
+    'MAX_SATURATED_PER_WINDOW': float(os.getenv('QUEUE_ROUTING_MAX_SATURATED_PER_WINDOW', '20')),
+    # 同一次推荐中每多一个同食堂、同商家的菜品扣减的得分
+    'CANTEEN_SPREAD': float(os.getenv('QUEUE_ROUTING_CANTEEN_SPREAD', '0.3')),
+    'MERCHANT_SPREAD': float(os.getenv('QUEUE_ROUTING_MERCHANT_SPREAD', '0.5')),
+}
+
+# 天气数据配置（见 ai.weather，请求路径只读缓存，不等待天气API）
+WEATHER = {
+    # 提供方: gaode(高德天气)、stub(本地桩数据，用于测试)
+    'PROVIDER': os.getenv('WEATHER_API_PROVIDER', 'gaode'),
+    'API_KEY': os.getenv('WEATHER_API_KEY'),
+    'CITY': os.getenv('WEATHER_CITY', '北京'),
+    # 后台刷新时请求天气API的超时时间（秒）
+    'TIMEOUT': float(os.getenv('WEATHER_API_TIMEOUT', '10')),
+    # 缓存超过该时长（秒）后在后台刷新，刷新完成前继续返回旧数据
+    'FRESH_TTL': int(os.getenv('WEATHER_FRESH_TTL', '600')),
+    # 旧数据最长保留时长（秒），刷新一直失败时超过该时长改用备用数据
+    'STALE_TTL': int(os.getenv('WEATHER_STALE_TTL', '10800')),
+}
+
+# AI推荐结果缓存配置（见 ai.recommendation_cache）
+RECOMMENDATION_CACHE = {
+    'ENABLED': os.getenv('RECOMMENDATION_CACHE_ENABLED', 'True').lower() == 'true',
+    # 缓存有效期（秒），菜单变化时立即失效
+    'TTL': int(os.getenv('RECOMMENDATION_CACHE_TTL', '600')),
+    # 气温分段（°C）：低于第一个值为冷，高于第二个值为热
+    'TEMPERATURE_BANDS': (
+        float(os.getenv('RECOMMENDATION_CACHE_COLD_BELOW', '10')),
+        float(os.getenv('RECOMMENDATION_CACHE_HOT_ABOVE', '25')),
+    ),
+}
+
+# 用户口味画像配置（见 data.user_profiles）
+USER_PROFILES = {
+    # 画像缓存有效期（秒）；画像变化时按版本号失效，有效期只用于回收不再访问的画像
+    'CACHE_TTL': int(os.getenv('USER_PROFILE_CACHE_TTL', '3600')),
+}
+
+# 全局情景快照配置（见 ai.context_snapshot）
+CONTEXT_SNAPSHOT = {
+    'ENABLED': os.getenv('CONTEXT_SNAPSHOT_ENABLED', 'True').lower() == 'true',
+    # 后台线程重新构建快照的间隔（秒）
+    'REFRESH_INTERVAL': int(os.getenv('CONTEXT_SNAPSHOT_REFRESH_INTERVAL', '30')),
+    # 快照最长有效期（秒），超过后读取方同步重建
+    'MAX_AGE': int(os.getenv('CONTEXT_SNAPSHOT_MAX_AGE', '120')),
+}
+
+# 节日日历配置（见 ai.festival_calendar，每年一个预先计算的日历文件）
+FESTIVAL_CALENDAR = {
+    'DATA_DIR': os.getenv('FESTIVAL_CALENDAR_DIR', str(BASE_DIR / 'models' / 'calendar')),
+}
+
+# 菜单批量导入配置
+MENU_IMPORT = {
+    # 每批校验并写入的行数
+    'CHUNK_SIZE': int(os.getenv('MENU_IMPORT_CHUNK_SIZE', '1000')),
+    # 报告中最多列出的错误行数（错误总数始终完整统计）
+    'MAX_REPORTED_ERRORS': int(os.getenv('MENU_IMPORT_MAX_REPORTED_ERRORS', '100')),
+}
+
 # AI配置
 AI_CONFIG = {
     'RECOMMENDATION_ENABLED': True,
@@ -4,6 +4,60 @@
 from typing import Any, Dict, Optional
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # 未安装时退回 DRF 的标准库 JSON 渲染
+    orjson = None
+
+
+class SuccessEnvelope(dict):
+    """成功响应体，FastJSONRenderer 识别该类型并使用预编码的外层结构"""
+    __slots__ = ()
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    高速 JSON 渲染器
+
+    使用 orjson 直接序列化响应数据（包括 data.records 中的菜品记录等 slots 数据类），
+    成功响应的 success/data/message 外层结构预先编码为字节串，只序列化变化的部分。
+    orjson 不支持的类型交给 DRF 的 JSONEncoder 处理（Decimal、UUID 等）；
+    未安装 orjson、请求带缩进参数或序列化失败时退回 DRF 的 JSONRenderer。
+    """
+
+    _SUCCESS_PREFIX = b'{"success":true,"data":'
+    _MESSAGE_KEY = b',"message":'
+    _PAGINATION_KEY = b',"pagination":'
+
+    if orjson is not None:
+        _OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_UTC_Z
+    _default = JSONEncoder().default
+
+    def _dumps(self, data: Any) -> bytes:
+        return orjson.dumps(data, default=self._default, option=self._OPTIONS)
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if orjson is None or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            if type(data) is SuccessEnvelope:
+                parts = [
+                    self._SUCCESS_PREFIX, self._dumps(data["data"]),
+                    self._MESSAGE_KEY, self._dumps(data["message"]),
+                ]
+                if "pagination" in data:
+                    parts += [self._PAGINATION_KEY, self._dumps(data["pagination"])]
+                parts.append(b'}')
+                return b''.join(parts)
+            return self._dumps(data)
+        except TypeError:
+            return super().render(data, accepted_media_type, renderer_context)
 
 
 class APIResponse:
@@ -16,11 +70,11 @@ class APIResponse:
         pagination: Optional[Dict] = None
     ) -> Response:
         """成功响应"""
-        response_data = {
-            "success": True,
-            "data": data,
-            "message": message
-        }
+        response_data = SuccessEnvelope(
+            success=True,
+            data=data,
+            message=message
+        )
         
         if pagination:
             response_data["pagination"] = pagination
@@ -33,11 +87,11 @@ class APIResponse:
         message: str = "创建成功"
     ) -> Response:
         """创建成功响应"""
-        return Response({
-            "success": True,
-            "data": data,
-            "message": message
-        }, status=status.HTTP_201_CREATED)
+        return Response(SuccessEnvelope(
+            success=True,
+            data=data,
+            message=message
+        ), status=status.HTTP_201_CREATED)
     
     @staticmethod
     def error(
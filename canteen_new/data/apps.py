@@ -1,6 +1,8 @@
 """
 数据模块应用配置
 """
+import time
+
 from django.apps import AppConfig
 
 
@@ -11,19 +13,13 @@ class DataConfig(AppConfig):
     
     def ready(self):
         """应用启动时执行"""
-        # 导入数据库初始化
+        # 检查数据库结构版本（已是最新时只需一次查询），示例数据通过 seed_sample_data 命令显式插入
         try:
-            from .database_init import initialize_database_on_startup, insert_sample_data_on_startup
+            from .database_init import initialize_database_on_startup
             
-            # 初始化数据库表
+            started = time.perf_counter()
             if initialize_database_on_startup():
-                print("数据库表初始化成功")
-                
-                # 插入示例数据
-                if insert_sample_data_on_startup():
-                    print("示例数据插入成功")
-                else:
-                    print("示例数据插入失败或已存在数据")
+                print(f"数据库结构检查完成，耗时 {(time.perf_counter() - started) * 1000:.1f} ms")
             else:
                 print("数据库表初始化失败")
                 
@@ -0,0 +1,51 @@
+"""
+带连接池的 MySQL 数据库后端
+在 Django 自带 MySQL 后端的基础上，将“建立连接/关闭连接”替换为从连接池借出/归还，
+事务、游标等行为与原后端一致。连接池配置见 DATABASES[alias]['POOL']。
+"""
+from django.db.backends.mysql import base
+
+from data.database import get_connection_pool
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """从 data.database 连接池获取连接的 MySQL 后端"""
+
+    def _pool(self, conn_params=None):
+        factory = lambda: super(DatabaseWrapper, self).get_new_connection(conn_params)
+        return get_connection_pool(self.alias, factory, self.settings_dict.get('POOL') or {})
+
+    def get_new_connection(self, conn_params):
+        pool_options = self.settings_dict.get('POOL') or {}
+        if not pool_options.get('ENABLED', True):
+            return super().get_new_connection(conn_params)
+        # 本包装对象被回收（如所在线程结束）而连接未归还时，由连接池回收
+        return self._pool(conn_params).checkout(owner=self)
+
+    def init_connection_state(self):
+        # 会话变量在连接的整个生命周期内有效，复用池中的连接时无需重复设置
+        if getattr(self.connection, '_pool_initialized', False):
+            return
+        super().init_connection_state()
+        self.connection._pool_initialized = True
+
+    def _close(self):
+        if self.connection is None:
+            return
+        pool_options = self.settings_dict.get('POOL') or {}
+        if not pool_options.get('ENABLED', True):
+            return super()._close()
+
+        pool = self._pool()
+        # 出过错或仍处于事务块中的连接状态不可信，直接丢弃
+        if self.errors_occurred or self.in_atomic_block:
+            pool.discard(self.connection)
+            return
+        if not self.autocommit:
+            try:
+                with self.wrap_database_errors:
+                    self.connection.rollback()
+            except Exception:
+                pool.discard(self.connection)
+                return
+        pool.checkin(self.connection)
@@ -0,0 +1,327 @@
+"""
+进程内菜品目录
+将在售菜品与商家食堂、实时等待时间一起加载为 NumPy 列，
+筛选和排序在内存中以向量化方式完成，避免每次请求都访问数据库。
+"""
+import logging
+import threading
+from typing import Dict, Any, List, Optional, Tuple
+
+from django.conf import settings
+
+from .database import query_all, query_rows
+from .projection import Projection
+from .records import Dish
+from .replication import use_primary
+from .versioning import version_counter, MENU_VERSION, TRAFFIC_VERSION
+from .pagination import ORDERINGS, resolve_ordering, encode_cursor, decode_cursor, build_pagination
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - numpy 为可选依赖
+    np = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WAIT_TIME = 15
+
+# 人流量等级编码，-1 表示商家没有客流记录（筛选时用 unknown 表示）
+CROWD_LEVEL_CODES = {
+    'unknown': -1,
+    'low': 0,
+    'medium': 1,
+    'high': 2,
+}
+
+# 目录中菜品的字段（不含等待时间，等待时间由实时状态单独维护）
+CATALOG_PROJECTION = Projection([
+    ("id", "d.id"),
+    ("merchant_id", "d.merchant_id"),
+    ("name", "d.name"),
+    ("description", "d.description"),
+    ("price", "d.price", float),
+    ("category", "d.category"),
+    ("taste", "d.taste"),
+    ("spice_level", "d.spice_level"),
+    ("image_url", "d.image_url"),
+    ("is_available", "d.is_available", bool),
+    ("stock_quantity", "d.stock_quantity"),
+    ("rating", "d.rating", float),
+    ("store_name", "m.store_name"),
+    ("merchant_name", "m.store_name"),
+    ("canteen", "m.canteen"),
+])
+
+
+class _CatalogSnapshot:
+    """某一版本的菜品目录快照（只读）"""
+
+    def __init__(self, rows: List[Dict[str, Any]]):
+        self.rows = rows
+        self.size = len(rows)
+
+        self.ids = np.array([row['id'] for row in rows], dtype=np.int64)
+        self.merchant_ids = np.array([row['merchant_id'] for row in rows], dtype=np.int64)
+        self.prices = np.array([row['price'] for row in rows], dtype=np.float64)
+        self.ratings = np.array([row['rating'] for row in rows], dtype=np.float64)
+        self.spice_levels = np.array([row['spice_level'] or 0 for row in rows], dtype=np.int64)
+
+        # 按菜品ID查找位置的索引
+        self.id_order = np.argsort(self.ids, kind='stable')
+        self.sorted_ids = self.ids[self.id_order]
+
+        # 商家维度索引，客流数据按商家写入后再广播到菜品
+        self.merchant_keys, self.merchant_index = np.unique(self.merchant_ids, return_inverse=True)
+
+        self.category_codes, self.category_vocab = self._encode([row['category'] for row in rows])
+        self.taste_codes, self.taste_vocab = self._encode([row['taste'] for row in rows])
+        self.canteen_codes, self.canteen_vocab = self._encode([row['canteen'] for row in rows])
+
+        # 模糊搜索使用的文本（与 LIKE 的大小写不敏感匹配保持一致）
+        self.texts = [
+            ((row['name'] or '') + '\n' + (row['description'] or '')).lower()
+            for row in rows
+        ]
+
+        # 客流列，由 apply_traffic 填充
+        self.wait_times = np.full(self.size, DEFAULT_WAIT_TIME, dtype=np.int64)
+        self.crowd_codes = np.full(self.size, -1, dtype=np.int8)
+
+    @staticmethod
+    def _encode(values: List[Any]):
+        """将字符串列编码为整数代码"""
+        vocab: Dict[Any, int] = {}
+        codes = np.empty(len(values), dtype=np.int32)
+        for i, value in enumerate(values):
+            codes[i] = vocab.setdefault(value, len(vocab))
+        return codes, vocab
+
+    def positions_of(self, dish_ids):
+        """将菜品ID转换为快照中的位置，返回 (位置数组, 对应ID是否存在的掩码)"""
+        dish_ids = np.asarray(dish_ids, dtype=np.int64)
+        k = np.searchsorted(self.sorted_ids, dish_ids)
+        k = np.minimum(k, max(self.size - 1, 0))
+        found = self.sorted_ids[k] == dish_ids if self.size else np.zeros(dish_ids.size, dtype=bool)
+        return self.id_order[k[found]], found
+
+    def apply_traffic(self, live_status: Dict[int, Tuple[Any, str]]) -> None:
+        """按商家写入实时等待时间和人流量等级"""
+        merchant_waits = np.full(self.merchant_keys.size, DEFAULT_WAIT_TIME, dtype=np.int64)
+        merchant_crowds = np.full(self.merchant_keys.size, -1, dtype=np.int8)
+        for merchant_id, (waiting_time, crowd_level) in live_status.items():
+            k = np.searchsorted(self.merchant_keys, merchant_id)
+            if k >= self.merchant_keys.size or self.merchant_keys[k] != merchant_id:
+                continue
+            merchant_crowds[k] = CROWD_LEVEL_CODES.get(crowd_level, -1)
+            if waiting_time:
+                merchant_waits[k] = int(waiting_time)
+
+        wait_times = merchant_waits[self.merchant_index]
+        crowd_codes = merchant_crowds[self.merchant_index]
+        self.wait_times = wait_times
+        self.crowd_codes = crowd_codes
+
+
+class DishCatalog:
+    """进程内菜品目录，按数据版本号自动失效"""
+
+    def __init__(self):
+        self._snapshot: Optional[_CatalogSnapshot] = None
+        self._menu_version: Optional[int] = None
+        self._traffic_version: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def is_enabled(self) -> bool:
+        """检查目录是否启用"""
+        return np is not None and settings.DISH_CATALOG.get('ENABLED', False)
+
+    def _get_snapshot(self) -> _CatalogSnapshot:
+        """获取最新快照，版本变化时重新加载"""
+        menu_version = version_counter.get(MENU_VERSION)
+        traffic_version = version_counter.get(TRAFFIC_VERSION)
+
+        snapshot = self._snapshot
+        if (snapshot is not None and menu_version == self._menu_version
+                and traffic_version == self._traffic_version):
+            return snapshot
+
+        # 按版本号重新加载时从主库读取，避免把副本上的旧数据标记为新版本
+        with self._lock, use_primary():
+            if self._snapshot is None or menu_version != self._menu_version:
+                snapshot = _CatalogSnapshot(self._load_dishes())
+                snapshot.apply_traffic(self._load_live_status())
+                self._snapshot = snapshot
+                self._menu_version = menu_version
+                self._traffic_version = traffic_version
+                logger.info(f"菜品目录已加载: {snapshot.size} 个菜品 (menu v{menu_version})")
+            elif traffic_version != self._traffic_version:
+                self._snapshot.apply_traffic(self._load_live_status())
+                self._traffic_version = traffic_version
+            return self._snapshot
+
+    def _load_dishes(self) -> List[Dict[str, Any]]:
+        """加载全部在售菜品"""
+        query = f"""
+            SELECT {CATALOG_PROJECTION.columns}
+            FROM dishes d
+            LEFT JOIN merchants m ON d.merchant_id = m.id
+            WHERE d.status = 'active'
+        """
+        return CATALOG_PROJECTION.decode(query_rows(query))
+
+    def _load_live_status(self) -> Dict[int, Tuple[Any, str]]:
+        """加载商家实时状态"""
+        query = "SELECT merchant_id, waiting_time, crowd_level FROM merchant_live_status"
+        return {
+            row['merchant_id']: (row['waiting_time'], row['crowd_level'])
+            for row in query_all(query)
+        }
+
+    def _build_mask(self, snapshot: _CatalogSnapshot, query: str, filters: Dict[str, Any], scores=None):
+        """根据搜索关键词和筛选条件构建布尔掩码"""
+        mask = np.ones(snapshot.size, dtype=bool)
+
+        if scores is not None:
+            # 全文索引已给出候选菜品
+            mask &= scores > 0
+        elif query:
+            needle = query.lower()
+            mask &= np.fromiter((needle in text for text in snapshot.texts), dtype=bool, count=snapshot.size)
+
+        if filters.get('ids'):
+            selected = np.zeros(snapshot.size, dtype=bool)
+            selected[snapshot.positions_of(filters['ids'])[0]] = True
+            mask &= selected
+
+        if filters.get('category'):
+            code = snapshot.category_vocab.get(filters['category'])
+            if code is None:
+                return np.zeros(snapshot.size, dtype=bool)
+            mask &= snapshot.category_codes == code
+
+        if filters.get('taste'):
+            tastes = filters['taste'].split(',') if isinstance(filters['taste'], str) else [filters['taste']]
+            if tastes and tastes[0]:
+                codes = [snapshot.taste_vocab[t] for t in tastes if t in snapshot.taste_vocab]
+                mask &= np.isin(snapshot.taste_codes, codes)
+
+        if filters.get('priceMin') is not None:
+            mask &= snapshot.prices >= float(filters['priceMin'])
+
+        if filters.get('priceMax') is not None:
+            mask &= snapshot.prices <= float(filters['priceMax'])
+
+        if filters.get('spice_level') is not None and filters.get('spice_level') != '':
+            mask &= snapshot.spice_levels <= int(filters['spice_level'])
+
+        if filters.get('hall'):
+            code = snapshot.canteen_vocab.get(filters['hall'])
+            if code is None:
+                return np.zeros(snapshot.size, dtype=bool)
+            mask &= snapshot.canteen_codes == code
+
+        crowd_level = filters.get('crowd_level')
+        if crowd_level and crowd_level != 'any':
+            codes = [CROWD_LEVEL_CODES[level] for level in str(crowd_level).split(',') if level in CROWD_LEVEL_CODES]
+            if codes:
+                mask &= np.isin(snapshot.crowd_codes, codes)
+            else:
+                mask &= snapshot.crowd_codes >= 0  # 没有客流记录的商家不参与人流量筛选
+
+        return mask
+
+    @staticmethod
+    def _sort_columns(snapshot: _CatalogSnapshot, positions, scores=None) -> Dict[str, Any]:
+        """取出排序字段对应的列"""
+        columns = {
+            'id': snapshot.ids[positions],
+            'price': snapshot.prices[positions],
+            'rating': snapshot.ratings[positions],
+        }
+        if scores is not None:
+            columns['relevance'] = scores[positions]
+        return columns
+
+    @staticmethod
+    def _relevance_scores(snapshot: _CatalogSnapshot, relevance: Dict[int, float]):
+        """将全文检索相关度展开为与快照对齐的列，未命中的菜品为 0"""
+        scores = np.zeros(snapshot.size, dtype=np.float64)
+        if relevance:
+            values = np.fromiter(relevance.values(), dtype=np.float64, count=len(relevance))
+            positions, found = snapshot.positions_of(list(relevance.keys()))
+            # BM25 得分恒为正，保证命中的菜品在掩码中可区分
+            scores[positions] = np.maximum(values[found], np.finfo(np.float64).tiny)
+        return scores
+
+    def _sort(self, snapshot: _CatalogSnapshot, positions, ordering: str, scores=None):
+        """按排序方式对候选位置排序（与SQL路径的 ORDER BY 保持一致）"""
+        columns = self._sort_columns(snapshot, positions, scores)
+        # np.lexsort 以最后一个键为主键
+        keys = [
+            -columns[field] if descending else columns[field]
+            for field, descending in reversed(ORDERINGS[ordering])
+        ]
+        return positions[np.lexsort(keys)]
+
+    def _after_cursor(self, snapshot: _CatalogSnapshot, positions, ordering: str, values, scores=None):
+        """筛选出排在游标之后的候选位置"""
+        columns = self._sort_columns(snapshot, positions, scores)
+        after = np.zeros(positions.size, dtype=bool)
+        equal = np.ones(positions.size, dtype=bool)
+        for (field, descending), value in zip(ORDERINGS[ordering], values):
+            column = columns[field]
+            value = float(value)
+            after |= equal & ((column < value) if descending else (column > value))
+            equal &= column == value
+        return positions[after]
+
+    def search(self, query: str, filters: Dict[str, Any],
+               relevance: Optional[Dict[int, float]] = None) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """
+        在内存目录中搜索菜品，返回格式与 DishRepository.search_dishes 一致
+
+        Args:
+            query: 搜索关键词
+            filters: 筛选条件
+            relevance: 全文索引命中的 {菜品ID: 相关度}，为 None 时按子串匹配关键词
+
+        Returns:
+            (菜品列表, 分页信息)
+        """
+        snapshot = self._get_snapshot()
+        ordering = resolve_ordering(filters.get('ordering', 'default'), has_relevance=bool(relevance))
+        page = filters.get('page', 1)
+        limit = filters.get('limit', 100)
+        cursor = filters.get('cursor')
+
+        scores = self._relevance_scores(snapshot, relevance) if relevance is not None else None
+
+        positions = np.flatnonzero(self._build_mask(snapshot, query, filters, scores))
+        total = int(positions.size)
+
+        if cursor:
+            positions = self._after_cursor(snapshot, positions, ordering, decode_cursor(cursor, ordering), scores)
+            offset = 0
+        else:
+            offset = (page - 1) * limit
+        positions = self._sort(snapshot, positions, ordering, scores)
+
+        dishes = [
+            Dish(**snapshot.rows[i], wait_time=int(snapshot.wait_times[i]))
+            for i in positions[offset:offset + limit]
+        ]
+        if ordering == 'relevance':
+            dishes = [
+                dish.with_relevance(float(scores[i]))
+                for dish, i in zip(dishes, positions[offset:offset + limit])
+            ]
+
+        has_more = positions.size > offset + limit
+        next_cursor = encode_cursor(ordering, dishes[-1]) if has_more else None
+        pagination = build_pagination(page, limit, total, has_more, next_cursor)
+
+        return dishes, pagination
+
+
+# 创建全局实例
+dish_catalog = DishCatalog()
@@ -1,24 +1,302 @@
 """
 数据库连接和工具函数
-使用Django的数据库连接
+使用Django的数据库连接；连接由 data.backends.mysql 后端从本模块的连接池中借出和归还。
+只读查询（query_one、query_all）可分发到只读副本，写操作始终走主库。
+
+Django 只在请求开始和结束时回收连接。在请求之外访问数据库的线程（后台刷新线程、
+定时线程等）必须在 db_connection_scope() 中访问数据库，自行回收本线程的连接；
+否则连接一直占用连接池的名额，直到线程结束后才由连接池回收。
 """
-from typing import Dict, Any, List, Optional
-from django.db import connection
+import logging
+import threading
+import time
+import weakref
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional, Callable
+from django.db import DEFAULT_DB_ALIAS, OperationalError, close_old_connections, connections
+
+from .replication import get_read_alias, mark_write
+
+logger = logging.getLogger(__name__)
+
 
+class PoolTimeoutError(Exception):
+    """等待连接池空闲连接超时"""
 
-def execute_raw_query(query: str, params: tuple = None) -> List[Dict[str, Any]]:
+
+class ConnectionPool:
+    """
+    线程安全的数据库连接池
+
+    - max_size: 同时借出的连接数上限，超过时等待，最多等待 timeout 秒
+    - idle_timeout: 空闲超过该时长的连接在下次借出时关闭
+    - max_lifetime: 连接创建超过该时长后不再复用
+    - pre_ping: 借出空闲超过 ping_interval 秒的连接前先 ping 检查，失效则重建
+
+    同步视图和异步视图（经 sync_to_async 在线程中执行）都通过 Django 的
+    每线程连接借出连接，因此只需保证池本身线程安全。
+
+    每次借出记录借出线程和持有连接的对象（Django 的连接包装对象）：持有对象被回收，
+    或连接池已满时发现借出线程已经结束，都视为连接未归还，关闭该连接并释放名额。
+    """
+
+    def __init__(self, factory: Callable[[], Any], max_size: int = 10, timeout: float = 10.0,
+                 idle_timeout: float = 300.0, max_lifetime: float = 3600.0,
+                 pre_ping: bool = True, ping_interval: float = 5.0):
+        self.factory = factory
+        self.max_size = max_size
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.max_lifetime = max_lifetime
+        self.pre_ping = pre_ping
+        self.ping_interval = ping_interval
+
+        # 空闲连接: (连接, 创建时间, 归还时间)，后进先出以便空闲过久的连接自然过期
+        self._idle: deque = deque()
+        self._created_at: Dict[int, float] = {}
+        # 借出中的连接: 连接ID -> (连接, 借出线程的弱引用, 持有对象的回收回调)
+        self._checkouts: Dict[int, tuple] = {}
+        self._in_use = 0
+        self._condition = threading.Condition()
+        self._stats = {
+            "checkouts": 0,
+            "created": 0,
+            "closed": 0,
+            "ping_failures": 0,
+            "timeouts": 0,
+            "reclaimed": 0,
+            "wait_time_total": 0.0,
+            "wait_time_max": 0.0,
+        }
+
+    def _close_raw(self, conn) -> None:
+        self._created_at.pop(id(conn), None)
+        self._stats["closed"] += 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _is_reusable(self, conn, created_at: float, returned_at: float, now: float) -> bool:
+        if now - returned_at > self.idle_timeout or now - created_at > self.max_lifetime:
+            return False
+        if self.pre_ping and now - returned_at > self.ping_interval:
+            try:
+                conn.ping()
+            except Exception:
+                with self._condition:
+                    self._stats["ping_failures"] += 1
+                return False
+        return True
+
+    def _reclaim(self, conn_id: int) -> None:
+        """回收未归还的连接（持有对象已被回收或借出线程已结束）"""
+        with self._condition:
+            entry = self._checkouts.pop(conn_id, None)
+            if entry is None:
+                return
+            entry[2].detach()
+            self._stats["reclaimed"] += 1
+            conn = entry[0]
+            # 持有者之后若仍归还该连接（checkin/discard），不再重复释放名额
+            try:
+                conn._pool_reclaimed = True
+            except AttributeError:
+                pass
+            self._close_raw(conn)
+        logger.warning("回收了未归还的数据库连接（借出线程已结束或连接对象已释放）")
+        self._release()
+
+    def _reclaim_dead_threads(self) -> None:
+        """回收借出线程已经结束的连接"""
+        with self._condition:
+            dead = [
+                conn_id for conn_id, (_, thread_ref, _) in self._checkouts.items()
+                if thread_ref() is None or not thread_ref().is_alive()
+            ]
+        for conn_id in dead:
+            self._reclaim(conn_id)
+
+    def _track(self, conn, owner) -> None:
+        if owner is None:
+            return
+        conn_id = id(conn)
+        finalizer = weakref.finalize(owner, self._reclaim, conn_id)
+        finalizer.atexit = False
+        with self._condition:
+            self._checkouts[conn_id] = (conn, weakref.ref(threading.current_thread()), finalizer)
+
+    def _untrack(self, conn) -> None:
+        """调用方持有 self._condition"""
+        entry = self._checkouts.pop(id(conn), None)
+        if entry is not None:
+            entry[2].detach()
+
+    def checkout(self, owner: Any = None):
+        """
+        借出一个连接
+
+        Args:
+            owner: 持有连接的对象，该对象被回收时连接视为未归还并被回收
+
+        Raises:
+            PoolTimeoutError: 等待超过 timeout 秒仍无可用连接
+        """
+        start = time.monotonic()
+        if self._in_use >= self.max_size:
+            self._reclaim_dead_threads()
+        with self._condition:
+            while self._in_use >= self.max_size:
+                remaining = self.timeout - (time.monotonic() - start)
+                if remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    raise PoolTimeoutError(f"等待数据库连接超时（{self.timeout}秒，连接池上限 {self.max_size}）")
+                self._condition.wait(remaining)
+            self._in_use += 1
+            waited = time.monotonic() - start
+            self._stats["checkouts"] += 1
+            self._stats["wait_time_total"] += waited
+            self._stats["wait_time_max"] = max(self._stats["wait_time_max"], waited)
+
+        try:
+            # 优先复用最近归还的空闲连接，ping 等网络操作在锁外进行
+            while True:
+                with self._condition:
+                    entry = self._idle.pop() if self._idle else None
+                if entry is None:
+                    break
+                conn, created_at, returned_at = entry
+                if self._is_reusable(conn, created_at, returned_at, time.monotonic()):
+                    self._track(conn, owner)
+                    return conn
+                with self._condition:
+                    self._close_raw(conn)
+
+            conn = self.factory()
+            with self._condition:
+                self._created_at[id(conn)] = time.monotonic()
+                self._stats["created"] += 1
+            self._track(conn, owner)
+            return conn
+        except Exception:
+            self._release()
+            raise
+
+    def checkin(self, conn) -> None:
+        """归还连接"""
+        if getattr(conn, '_pool_reclaimed', False):
+            return
+        with self._condition:
+            self._untrack(conn)
+            created_at = self._created_at.get(id(conn))
+            if created_at is None:
+                self._close_raw(conn)
+            else:
+                now = time.monotonic()
+                self._idle.append((conn, created_at, now))
+                # 顺带关闭队列另一端空闲过久的连接
+                while self._idle and now - self._idle[0][2] > self.idle_timeout:
+                    self._close_raw(self._idle.popleft()[0])
+        self._release()
+
+    def discard(self, conn) -> None:
+        """关闭并丢弃连接（连接出错或处于未完成的事务中时使用）"""
+        if getattr(conn, '_pool_reclaimed', False):
+            return
+        with self._condition:
+            self._untrack(conn)
+            self._close_raw(conn)
+        self._release()
+
+    def _release(self) -> None:
+        with self._condition:
+            self._in_use -= 1
+            self._condition.notify()
+
+    def stats(self) -> Dict[str, Any]:
+        """连接池指标"""
+        with self._condition:
+            stats = dict(self._stats)
+            stats.update({
+                "max_size": self.max_size,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "wait_time_avg": stats["wait_time_total"] / stats["checkouts"] if stats["checkouts"] else 0.0,
+            })
+            return stats
+
+
+# 数据库别名 -> 连接池
+_pools: Dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_connection_pool(alias: str, factory: Callable[[], Any], options: Dict[str, Any]) -> ConnectionPool:
+    """获取（首次调用时创建）指定数据库别名的连接池"""
+    pool = _pools.get(alias)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(alias)
+            if pool is None:
+                pool = ConnectionPool(
+                    factory,
+                    max_size=options.get('MAX_SIZE', 10),
+                    timeout=options.get('TIMEOUT', 10.0),
+                    idle_timeout=options.get('IDLE_TIMEOUT', 300.0),
+                    max_lifetime=options.get('MAX_LIFETIME', 3600.0),
+                    pre_ping=options.get('PRE_PING', True),
+                    ping_interval=options.get('PING_INTERVAL', 5.0),
+                )
+                _pools[alias] = pool
+                logger.info(f"数据库连接池已创建: {alias} (max_size={pool.max_size})")
+    return pool
+
+
+def get_pool_stats() -> Dict[str, Dict[str, Any]]:
+    """获取所有连接池的指标"""
+    return {alias: pool.stats() for alias, pool in _pools.items()}
+
+
+@contextmanager
+def db_connection_scope(release: bool = False):
+    """
+    在请求之外的线程中访问数据库
+
+    与 Django 的请求周期相同，进入和退出时调用 close_old_connections()，
+    关闭失效或超过 CONN_MAX_AGE 的连接（即归还连接池）。
+
+    Args:
+        release: 为 True 时退出时关闭本线程的全部连接（线程即将结束时使用）
+    """
+    close_old_connections()
+    try:
+        yield
+    finally:
+        if release:
+            connections.close_all()
+        else:
+            close_old_connections()
+
+
+def execute_raw_query(query: str, params: tuple = None, using: str = DEFAULT_DB_ALIAS,
+                      as_tuples: bool = False) -> List[Any]:
     """
     执行原始SQL查询
     
     Args:
         query: SQL查询语句
         params: 查询参数
+        using: 数据库别名，默认主库
+        as_tuples: 是否直接返回驱动的元组行（不构造字典，配合 Projection 解码）
         
     Returns:
         查询结果列表
     """
-    with connection.cursor() as cursor:
+    with connections[using].cursor() as cursor:
         cursor.execute(query, params or ())
+        if as_tuples:
+            return cursor.fetchall()
         columns = [col[0] for col in cursor.description]
         return [
             dict(zip(columns, row))
@@ -37,7 +315,8 @@ def execute_raw_update(query: str, params: tuple = None) -> int:
     Returns:
         受影响的行数
     """
-    with connection.cursor() as cursor:
+    mark_write()
+    with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
         cursor.execute(query, params or ())
         return cursor.rowcount
 
@@ -53,21 +332,58 @@ def execute_raw_insert(query: str, params: tuple = None) -> int:
     Returns:
         插入的ID
     """
-    with connection.cursor() as cursor:
+    mark_write()
+    with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
         cursor.execute(query, params or ())
         return cursor.lastrowid
 
 
+def execute_raw_many(query: str, params_list: List[tuple]) -> int:
+    """
+    用同一条SQL批量执行多组参数（executemany）
+    
+    MySQL 驱动会将 INSERT ... VALUES (%s, ...) [ON DUPLICATE KEY UPDATE ...] 改写为一条多行插入，
+    VALUES 中只能使用占位符。
+    
+    Args:
+        query: SQL语句
+        params_list: 参数列表
+        
+    Returns:
+        受影响的行数
+    """
+    mark_write()
+    with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+        cursor.executemany(query, params_list)
+        return cursor.rowcount
+
+
 # 便捷函数
 def query_one(query: str, params: tuple = None) -> Optional[Dict[str, Any]]:
     """查询单条记录"""
-    results = execute_raw_query(query, params)
+    results = query_all(query, params)
     return results[0] if results else None
 
 
 def query_all(query: str, params: tuple = None) -> List[Dict[str, Any]]:
-    """查询多条记录"""
-    return execute_raw_query(query, params)
+    """查询多条记录（可能由只读副本执行，副本不可用时回退到主库）"""
+    return _read(query, params, as_tuples=False)
+
+
+def query_rows(query: str, params: tuple = None) -> List[tuple]:
+    """查询多条记录，以元组行返回，列顺序与 SELECT 列表一致"""
+    return _read(query, params, as_tuples=True)
+
+
+def _read(query: str, params: tuple, as_tuples: bool) -> List[Any]:
+    alias = get_read_alias()
+    if alias == DEFAULT_DB_ALIAS:
+        return execute_raw_query(query, params, as_tuples=as_tuples)
+    try:
+        return execute_raw_query(query, params, using=alias, as_tuples=as_tuples)
+    except OperationalError as e:
+        logger.warning(f"只读副本 {alias} 查询失败，回退到主库: {e}")
+        return execute_raw_query(query, params, as_tuples=as_tuples)
 
 
 def execute_update(query: str, params: tuple = None) -> int:
@@ -78,3 +394,8 @@ def execute_update(query: str, params: tuple = None) -> int:
 def execute_insert(query: str, params: tuple = None) -> int:
     """执行插入操作并返回ID"""
     return execute_raw_insert(query, params)
+
+
+def execute_many(query: str, params_list: List[tuple]) -> int:
+    """批量执行写操作"""
+    return execute_raw_many(query, params_list)
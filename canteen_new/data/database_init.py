@@ -1,13 +1,23 @@
 """
 数据库初始化模块
-在启动服务时检查数据库表是否存在，如果不存在，自动创建
+在启动服务时检查数据库结构版本，版本落后时才检查并创建缺失的表。
+结构版本记录在 schema_versions 账本表中，结构已是最新时启动只需一次查询。
 """
 import logging
 from typing import List
+from django.db import DatabaseError
 from .database import execute_raw_query, execute_raw_update
 
 logger = logging.getLogger(__name__)
 
+# 当前代码要求的数据库结构版本
+# 新增表或修改表结构时：添加对应的创建方法、加入 required_tables，并将此版本号加一
+SCHEMA_VERSION = 4
+
+# 多个进程同时启动时，只允许一个进程执行建表（MySQL 命名锁）
+SCHEMA_LOCK_NAME = 'canteen_schema_migration'
+SCHEMA_LOCK_TIMEOUT = 60
+
 
 class DatabaseInitializer:
     """数据库初始化类"""
@@ -19,7 +29,16 @@ class DatabaseInitializer:
             'dishes',
             'orders',
             'favorites',
-            'traffic_data'
+            'traffic_data',
+            'merchant_live_status',
+            'data_versions',
+            'dish_popularity',
+            'user_profile_counters',
+            'user_profile_event_values',
+            'user_profile_versions',
+            'traffic_rollup_minute',
+            'traffic_rollup_hour',
+            'traffic_rollup_day'
         ]
     
     def check_table_exists(self, table_name: str) -> bool:
@@ -37,6 +56,30 @@ class DatabaseInitializer:
             logger.error(f"检查表 {table_name} 是否存在时出错: {e}")
             return False
     
+    def get_schema_version(self) -> int:
+        """读取已应用的数据库结构版本（一次查询），账本表不存在时返回 0"""
+        try:
+            result = execute_raw_query("SELECT MAX(version) AS version FROM schema_versions")
+        except DatabaseError:
+            return 0
+        return result[0]['version'] or 0
+    
+    def create_schema_versions_table(self) -> bool:
+        """创建数据库结构版本账本表"""
+        try:
+            query = """
+                CREATE TABLE IF NOT EXISTS schema_versions (
+                    version INT PRIMARY KEY,
+                    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+            """
+            execute_raw_update(query)
+            logger.info("数据库结构版本表创建成功")
+            return True
+        except Exception as e:
+            logger.error(f"创建数据库结构版本表失败: {e}")
+            return False
+    
     def create_users_table(self) -> bool:
         """创建用户表"""
         try:
@@ -202,6 +245,185 @@ class DatabaseInitializer:
             logger.error(f"创建客流量数据表失败: {e}")
             return False
     
+    def create_merchant_live_status_table(self) -> bool:
+        """创建商家实时状态表，并根据已有客流数据回填每个商家的最新状态"""
+        try:
+            query = """
+                CREATE TABLE IF NOT EXISTS merchant_live_status (
+                    merchant_id INT PRIMARY KEY,
+                    count INT NOT NULL,
+                    waiting_time INT NOT NULL,
+                    crowd_level ENUM('low', 'medium', 'high') NOT NULL,
+                    reported_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                    INDEX idx_crowd_level (crowd_level),
+                    FOREIGN KEY (merchant_id) REFERENCES merchants(id) ON DELETE CASCADE
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+            """
+            execute_raw_update(query)
+            
+            backfill_query = """
+                INSERT IGNORE INTO merchant_live_status (merchant_id, count, waiting_time, crowd_level, reported_at)
+                SELECT t.merchant_id, t.count, t.waiting_time,
+                       CASE WHEN t.count >= 60 THEN 'high' WHEN t.count >= 30 THEN 'medium' ELSE 'low' END,
+                       t.timestamp
+                FROM traffic_data t
+                JOIN (
+                    SELECT merchant_id, MAX(timestamp) AS latest
+                    FROM traffic_data
+                    GROUP BY merchant_id
+                ) x ON t.merchant_id = x.merchant_id AND t.timestamp = x.latest
+            """
+            execute_raw_update(backfill_query)
+            logger.info("商家实时状态表创建成功")
+            return True
+        except Exception as e:
+            logger.error(f"创建商家实时状态表失败: {e}")
+            return False
+    
+    def create_data_versions_table(self) -> bool:
+        """创建数据版本表"""
+        try:
+            query = """
+                CREATE TABLE IF NOT EXISTS data_versions (
+                    name VARCHAR(50) PRIMARY KEY,
+                    version BIGINT NOT NULL DEFAULT 0,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+            """
+            execute_raw_update(query)
+            logger.info("数据版本表创建成功")
+            return True
+        except Exception as e:
+            logger.error(f"创建数据版本表失败: {e}")
+            return False
+    
+    def create_dish_popularity_table(self) -> bool:
+        """创建菜品热度表，并根据已有订单和收藏按时间衰减回填热度"""
+        try:
+            query = """
+                CREATE TABLE IF NOT EXISTS dish_popularity (
+                    dish_id INT PRIMARY KEY,
+                    score DOUBLE NOT NULL DEFAULT 0,
+                    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (dish_id) REFERENCES dishes(id) ON DELETE CASCADE
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+            """
+            execute_raw_update(query)
+            
+            from django.conf import settings
+            from .popularity import decay_rate
+            
+            backfill_query = """
+                INSERT IGNORE INTO dish_popularity (dish_id, score, updated_at)
+                SELECT e.dish_id,
+                       SUM(e.weight * EXP(-%s * GREATEST(TIMESTAMPDIFF(SECOND, e.happened_at, NOW()), 0))),
+                       NOW()
+                FROM (
+                    SELECT dish_id, quantity * %s AS weight, created_at AS happened_at
+                    FROM orders WHERE status != 'cancelled'
+                    UNION ALL
+                    SELECT dish_id, %s AS weight, added_at AS happened_at
+                    FROM favorites
+                ) e
+                GROUP BY e.dish_id
+            """
+            execute_raw_update(backfill_query, (
+                decay_rate(),
+                settings.POPULARITY.get('ORDER_WEIGHT', 1.0),
+                settings.POPULARITY.get('FAVORITE_WEIGHT', 2.0)
+            ))
+            logger.info("菜品热度表创建成功")
+            return True
+        except Exception as e:
+            logger.error(f"创建菜品热度表失败: {e}")
+            return False
+    
+    def create_user_profile_counters_table(self) -> bool:
+        """创建用户画像计数表，并根据已有收藏和订单回填"""
+        try:
+            query = """
+                CREATE TABLE IF NOT EXISTS user_profile_counters (
+                    user_id INT NOT NULL,
+                    dimension VARCHAR(32) NOT NULL,
+                    value VARCHAR(100) NOT NULL,
+                    count DOUBLE NOT NULL DEFAULT 0,
+                    PRIMARY KEY (user_id, dimension, value),
+                    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+            """
+            execute_raw_update(query)
+            
+            from .user_profiles import rebuild_counters_sql
+            
+            _, (backfill_query, params) = rebuild_counters_sql()
+            execute_raw_update(backfill_query, params)
+            logger.info("用户画像计数表创建成功")
+            return True
+        except Exception as e:
+            logger.error(f"创建用户画像计数表失败: {e}")
+            return False
+    
+    def create_user_profile_event_values_table(self) -> bool:
+        """创建用户画像事件属性表（每次收藏/下单计入的菜品属性），并根据已有收藏和订单回填"""
+        try:
+            query = """
+                CREATE TABLE IF NOT EXISTS user_profile_event_values (
+                    event VARCHAR(16) NOT NULL,
+                    source_id INT NOT NULL,
+                    user_id INT NOT NULL,
+                    dimension VARCHAR(32) NOT NULL,
+                    value VARCHAR(100) NOT NULL,
+                    PRIMARY KEY (event, source_id, dimension),
+                    INDEX idx_user_id (user_id),
+                    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+            """
+            execute_raw_update(query)
+            
+            from .user_profiles import rebuild_event_values_sql, rebuild_counters_sql
+            
+            _, (backfill_query, params) = rebuild_event_values_sql()
+            execute_raw_update(backfill_query, params)
+            # 已有的计数按回填的属性重新计算，保证之后取消收藏时扣减的正是计入的值
+            for query, params in rebuild_counters_sql():
+                execute_raw_update(query, params)
+            logger.info("用户画像事件属性表创建成功")
+            return True
+        except Exception as e:
+            logger.error(f"创建用户画像事件属性表失败: {e}")
+            return False
+    
+    def create_user_profile_versions_table(self) -> bool:
+        """创建用户画像版本表（画像缓存键中的用户版本号）"""
+        try:
+            query = """
+                CREATE TABLE IF NOT EXISTS user_profile_versions (
+                    user_id INT PRIMARY KEY,
+                    version BIGINT NOT NULL DEFAULT 0,
+                    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+            """
+            execute_raw_update(query)
+            logger.info("用户画像版本表创建成功")
+            return True
+        except Exception as e:
+            logger.error(f"创建用户画像版本表失败: {e}")
+            return False
+    
+    def create_traffic_rollup_table(self, granularity: str) -> bool:
+        """创建客流量汇总表（分钟/小时/天），并根据已有原始上报回填"""
+        from .traffic_rollups import ROLLUP_TABLES, create_rollup_table_sql, backfill_rollup_sql
+        
+        table = ROLLUP_TABLES[granularity]
+        try:
+            execute_raw_update(create_rollup_table_sql(table))
+            execute_raw_update(backfill_rollup_sql(table, granularity))
+            logger.info(f"客流量汇总表 {table} 创建成功")
+            return True
+        except Exception as e:
+            logger.error(f"创建客流量汇总表 {table} 失败: {e}")
+            return False
+    
     def initialize_database(self) -> bool:
         """初始化数据库"""
         logger.info("开始检查数据库表结构...")
@@ -241,6 +463,29 @@ class DatabaseInitializer:
         if 'traffic_data' in missing_tables:
             creation_results['traffic_data'] = self.create_traffic_data_table()
         
+        if 'merchant_live_status' in missing_tables:
+            creation_results['merchant_live_status'] = self.create_merchant_live_status_table()
+        
+        if 'data_versions' in missing_tables:
+            creation_results['data_versions'] = self.create_data_versions_table()
+        
+        if 'dish_popularity' in missing_tables:
+            creation_results['dish_popularity'] = self.create_dish_popularity_table()
+        
+        if 'user_profile_counters' in missing_tables:
+            creation_results['user_profile_counters'] = self.create_user_profile_counters_table()
+        
+        if 'user_profile_event_values' in missing_tables:
+            creation_results['user_profile_event_values'] = self.create_user_profile_event_values_table()
+        
+        if 'user_profile_versions' in missing_tables:
+            creation_results['user_profile_versions'] = self.create_user_profile_versions_table()
+        
+        for granularity in ('minute', 'hour', 'day'):
+            table = f'traffic_rollup_{granularity}'
+            if table in missing_tables:
+                creation_results[table] = self.create_traffic_rollup_table(granularity)
+        
         # 检查创建结果
         failed_tables = [table for table, success in creation_results.items() if not success]
         
@@ -251,6 +496,44 @@ class DatabaseInitializer:
             logger.info("所有表创建成功")
             return True
     
+    def ensure_schema(self) -> bool:
+        """
+        确保数据库结构为当前版本
+        
+        结构已是最新时只执行一次版本查询；否则在命名锁内检查并创建缺失的表，
+        成功后在账本中记录当前版本。
+        
+        Returns:
+            数据库结构是否可用
+        """
+        if self.get_schema_version() >= SCHEMA_VERSION:
+            return True
+        
+        acquired = execute_raw_query(
+            "SELECT GET_LOCK(%s, %s) AS acquired", (SCHEMA_LOCK_NAME, SCHEMA_LOCK_TIMEOUT)
+        )[0]['acquired']
+        if not acquired:
+            logger.error("等待数据库结构锁超时")
+            return False
+        
+        try:
+            # 等锁期间其他进程可能已经完成了升级
+            current_version = self.get_schema_version()
+            if current_version >= SCHEMA_VERSION:
+                return True
+            
+            logger.info(f"数据库结构版本 {current_version} 落后于 {SCHEMA_VERSION}，开始升级")
+            if not self.initialize_database() or not self.create_schema_versions_table():
+                return False
+            
+            execute_raw_update(
+                "INSERT IGNORE INTO schema_versions (version) VALUES (%s)", (SCHEMA_VERSION,)
+            )
+            logger.info(f"数据库结构已升级到版本 {SCHEMA_VERSION}")
+            return True
+        finally:
+            execute_raw_query("SELECT RELEASE_LOCK(%s) AS released", (SCHEMA_LOCK_NAME,))
+    
     def insert_sample_data(self) -> bool:
         """插入示例数据"""
         try:
@@ -301,10 +584,10 @@ db_initializer = DatabaseInitializer()
 
 
 def initialize_database_on_startup():
-    """在启动时初始化数据库"""
-    return db_initializer.initialize_database()
+    """在启动时确保数据库结构为当前版本"""
+    return db_initializer.ensure_schema()
 
 
-def insert_sample_data_on_startup():
-    """在启动时插入示例数据"""
+def insert_sample_data():
+    """插入示例数据（通过 python manage.py seed_sample_data 显式执行）"""
     return db_initializer.insert_sample_data()
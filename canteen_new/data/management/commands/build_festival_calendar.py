@@ -0,0 +1,29 @@
+"""
+生成节日日历文件
+建议在部署时为当年和下一年生成: python manage.py build_festival_calendar
+生成后服务进程直接读取日历文件，不再导入 lunarcalendar 和 holidays
+"""
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ai.festival_calendar import festival_calendar
+
+
+class Command(BaseCommand):
+    help = "预先计算指定年份的节气、节日和法定假日标签并保存为日历文件"
+
+    def add_arguments(self, parser):
+        parser.add_argument('years', nargs='*', type=int, help='年份，默认当年和下一年')
+
+    def handle(self, *args, **options):
+        current_year = datetime.date.today().year
+        years = options['years'] or [current_year, current_year + 1]
+        for year in years:
+            days, complete = festival_calendar.build(year)
+            if not complete:
+                raise CommandError(f"{year} 年的节日日历计算不完整，请确认已安装 lunarcalendar 和 holidays")
+            path = festival_calendar.save(year, days)
+            tagged = sum(1 for tags in days if tags[0] not in ("周末", "普通工作日"))
+            self.stdout.write(f"{year} 年: {len(days)} 天，其中 {tagged} 天有节日标签 -> {path}")
+        self.stdout.write(self.style.SUCCESS("节日日历生成完成"))
@@ -0,0 +1,15 @@
+"""
+压缩菜品热度表
+建议通过定时任务每天执行一次: python manage.py compact_popularity
+"""
+from django.core.management.base import BaseCommand
+
+from data.popularity import popularity_board
+
+
+class Command(BaseCommand):
+    help = "将菜品热度衰减到当前时刻，并删除已衰减到可忽略的记录"
+
+    def handle(self, *args, **options):
+        removed = popularity_board.compact()
+        self.stdout.write(self.style.SUCCESS(f"菜品热度压缩完成，删除 {removed} 条记录"))
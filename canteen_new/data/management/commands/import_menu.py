@@ -0,0 +1,42 @@
+"""
+批量导入菜单
+    python manage.py import_menu dishes.csv
+    python manage.py import_menu dishes.ndjson --merchant-id 3 --dry-run
+文件按行流式读取，格式说明见 data/menu_import.py
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from data.menu_import import menu_importer, detect_format, IMPORT_FORMATS
+
+
+class Command(BaseCommand):
+    help = "从 CSV 或 NDJSON 文件批量导入菜品"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="导入文件路径")
+        parser.add_argument('--format', choices=IMPORT_FORMATS, help="文件格式，默认按扩展名判断")
+        parser.add_argument('--merchant-id', type=int, help="只为该商家导入")
+        parser.add_argument('--dry-run', action='store_true', help="只校验不写入")
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or detect_format(options['path'])
+        if fmt is None:
+            raise CommandError("无法根据扩展名判断文件格式，请使用 --format 指定")
+
+        try:
+            with open(options['path'], encoding='utf-8-sig', newline='') as stream:
+                report = menu_importer.run(stream, fmt, options['merchant_id'], options['dry_run'])
+        except OSError as e:
+            raise CommandError(f"无法读取文件: {e}")
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        for error in report['errors']:
+            self.stderr.write(f"第{error['line']}行: {error['error']}")
+        if report['failed'] > len(report['errors']):
+            self.stderr.write(f"……另有 {report['failed'] - len(report['errors'])} 行错误未列出")
+
+        action = "校验" if report['dry_run'] else "导入"
+        self.stdout.write(self.style.SUCCESS(
+            f"{action}完成: 共 {report['total']} 行，成功 {report['imported']} 行，失败 {report['failed']} 行"
+        ))
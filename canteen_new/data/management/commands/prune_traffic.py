@@ -0,0 +1,17 @@
+"""
+按保留策略清理客流量数据（原始上报和过期汇总）
+建议通过定时任务每天执行一次: python manage.py prune_traffic
+"""
+from django.core.management.base import BaseCommand
+
+from data.traffic_rollups import traffic_rollups
+
+
+class Command(BaseCommand):
+    help = "分小批删除超过保留期限的客流量原始上报和汇总数据"
+
+    def handle(self, *args, **options):
+        removed = traffic_rollups.prune()
+        for table, count in removed.items():
+            self.stdout.write(f"{table}: 删除 {count} 行")
+        self.stdout.write(self.style.SUCCESS("客流量数据清理完成"))
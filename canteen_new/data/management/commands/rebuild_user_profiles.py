@@ -0,0 +1,19 @@
+"""
+重建用户口味画像计数
+计数在收藏和下单时按增量维护；菜品修改了分类、口味或价格，或下架后，可执行
+python manage.py rebuild_user_profiles 根据收藏和订单重新计算
+"""
+from django.core.management.base import BaseCommand
+
+from data.user_profiles import user_profiles
+
+
+class Command(BaseCommand):
+    help = "根据收藏和订单重新计算用户画像计数，并使画像缓存失效"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, help='只重建该用户（默认全部用户）')
+
+    def handle(self, *args, **options):
+        written = user_profiles.rebuild(options['user'])
+        self.stdout.write(self.style.SUCCESS(f"用户画像计数重建完成，写入 {written} 行"))
@@ -0,0 +1,16 @@
+"""
+插入示例数据（用户和商家）
+仅在数据库中还没有用户时插入: python manage.py seed_sample_data
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from data.database_init import insert_sample_data
+
+
+class Command(BaseCommand):
+    help = "向空数据库插入示例用户和商家数据"
+
+    def handle(self, *args, **options):
+        if not insert_sample_data():
+            raise CommandError("示例数据插入失败，详见日志")
+        self.stdout.write(self.style.SUCCESS("示例数据检查完成"))
@@ -0,0 +1,23 @@
+"""
+训练等待时间预测模型
+建议通过定时任务每天凌晨执行一次: python manage.py train_wait_forecast
+首次执行或加 --full 时从历史汇总数据重新训练
+"""
+from django.core.management.base import BaseCommand
+
+from data.wait_forecast import wait_forecaster
+
+
+class Command(BaseCommand):
+    help = "根据客流量汇总数据增量训练商家和食堂的周内时段等待时间预测模型"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='忽略已有模型，从历史数据重新训练')
+
+    def handle(self, *args, **options):
+        summary = wait_forecaster.train(full=options['full'])
+        self.stdout.write(
+            f"模式: {summary['mode']}，商家: {summary['merchants']}，"
+            f"读取汇总 {summary['rows']} 行，训练截止: {summary['trained_until']}"
+        )
+        self.stdout.write(self.style.SUCCESS("等待时间预测模型训练完成"))
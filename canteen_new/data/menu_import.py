@@ -0,0 +1,191 @@
+"""
+菜单批量导入
+流式读取 CSV 或 NDJSON（每行一个 JSON 对象）格式的菜品数据，内存中只保留当前批次；
+逐行校验，每满一批用 executemany 写入并提交（每批一个事务，提交后菜单版本加一），并逐行报告错误。
+用于新食堂、新商家的菜单上线，以及大批量菜单更新。
+导入不是全有或全无的：写入出错时之前的批次已经提交，修正后重新导入即可。
+
+每行字段:
+    merchant 或 merchant_id: 商家用户名或商家ID（通过 API 为指定商家导入时可省略）
+    name, price, category, taste: 必填
+    description, spice_level, image_url, is_available, stock_quantity: 可选
+商家已有同名在售菜品时更新该菜品，因此重复导入同一文件是安全的。
+"""
+import csv
+import json
+import logging
+import os
+from typing import Any, Dict, Iterator, List, Optional, Set, TextIO, Tuple
+
+from django.conf import settings
+from django.db import transaction
+
+from .database import query_all
+from .replication import use_primary
+from .repositories import DishRepository
+from .services import parse_dish_fields, parse_int, DISH_CREATE_DEFAULTS
+from .versioning import version_counter, MENU_VERSION
+
+logger = logging.getLogger(__name__)
+
+IMPORT_FORMATS = ('csv', 'ndjson')
+
+REQUIRED_FIELDS = ('name', 'price', 'category', 'taste')
+
+
+def detect_format(filename: str) -> Optional[str]:
+    """根据文件扩展名判断导入格式"""
+    extension = os.path.splitext(filename or '')[1].lower()
+    if extension == '.csv':
+        return 'csv'
+    if extension in ('.ndjson', '.jsonl'):
+        return 'ndjson'
+    return None
+
+
+def iter_records(stream: TextIO, fmt: str) -> Iterator[Tuple[int, Optional[Dict[str, Any]], Optional[str]]]:
+    """
+    逐条读取记录
+
+    Args:
+        stream: 文本流
+        fmt: csv 或 ndjson
+
+    Returns:
+        (行号, 记录, 解析错误) 的迭代器，解析失败时记录为 None
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for record in reader:
+            yield reader.line_num, record, None
+        return
+
+    for line_no, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield line_no, None, f"JSON格式错误: {e.msg}"
+            continue
+        if not isinstance(record, dict):
+            yield line_no, None, "每行必须是JSON对象"
+            continue
+        yield line_no, record, None
+
+
+class MenuImporter:
+    """菜单导入器"""
+
+    def __init__(self):
+        self.dish_repo = DishRepository()
+
+    @staticmethod
+    def _load_merchants() -> Dict[str, int]:
+        """加载在营商家的 用户名 -> ID"""
+        with use_primary():
+            rows = query_all("SELECT id, username FROM merchants WHERE status = 'active'")
+        return {row['username']: row['id'] for row in rows}
+
+    @staticmethod
+    def _resolve_merchant(values: Dict[str, Any], merchants: Dict[str, int], merchant_ids: Set[int],
+                          merchant_id: Optional[int]) -> int:
+        """确定记录所属商家，失败时抛出 ValueError"""
+        owner = None
+        if 'merchant_id' in values:
+            owner = parse_int(values['merchant_id'], 'merchant_id')
+            if owner not in merchant_ids:
+                raise ValueError(f"商家{owner}不存在")
+        elif 'merchant' in values:
+            owner = merchants.get(str(values['merchant']).strip())
+            if owner is None:
+                raise ValueError(f"商家{values['merchant']}不存在")
+
+        if merchant_id is not None:
+            if owner is not None and owner != merchant_id:
+                raise ValueError("只能导入本商家的菜品")
+            return merchant_id
+        if owner is None:
+            raise ValueError("merchant或merchant_id不能为空")
+        return owner
+
+    def _to_row(self, record: Dict[str, Any], merchants: Dict[str, int], merchant_ids: Set[int],
+                merchant_id: Optional[int]) -> Dict[str, Any]:
+        """校验记录并转换为待写入的菜品行，失败时抛出 ValueError"""
+        # CSV 的空单元格视为未提供；多余的列（无表头）忽略
+        values = {
+            key.strip(): value for key, value in record.items()
+            if isinstance(key, str) and value is not None and value != ''
+        }
+        owner = self._resolve_merchant(values, merchants, merchant_ids, merchant_id)
+        fields = parse_dish_fields(values)
+        missing = [field for field in REQUIRED_FIELDS if field not in fields]
+        if missing:
+            raise ValueError(f"{', '.join(missing)}不能为空")
+        return {**DISH_CREATE_DEFAULTS, **fields, "merchant_id": owner}
+
+    def run(self, stream: TextIO, fmt: str, merchant_id: Optional[int] = None,
+            dry_run: bool = False) -> Dict[str, Any]:
+        """
+        执行导入
+
+        Args:
+            stream: 文本流（按行迭代，不会一次性读入内存）
+            fmt: csv 或 ndjson
+            merchant_id: 只为该商家导入（记录中的商家字段可省略，提供时必须一致）
+            dry_run: 只校验不写入
+
+        Returns:
+            导入报告: 总行数、成功数、失败数和错误行（最多 MAX_REPORTED_ERRORS 条）
+
+        Raises:
+            ValueError: 导入格式不支持或指定的商家不存在
+        """
+        if fmt not in IMPORT_FORMATS:
+            raise ValueError(f"不支持的导入格式: {fmt}")
+
+        config = settings.MENU_IMPORT
+        chunk_size = config.get('CHUNK_SIZE', 1000)
+        max_errors = config.get('MAX_REPORTED_ERRORS', 100)
+        report = {"total": 0, "imported": 0, "failed": 0, "errors": [], "dry_run": dry_run}
+
+        merchants = self._load_merchants()
+        merchant_ids = set(merchants.values())
+        if merchant_id is not None and merchant_id not in merchant_ids:
+            raise ValueError(f"商家{merchant_id}不存在")
+        batch: List[Dict[str, Any]] = []
+
+        for line_no, record, error in iter_records(stream, fmt):
+            report['total'] += 1
+            if error is None:
+                try:
+                    batch.append(self._to_row(record, merchants, merchant_ids, merchant_id))
+                except ValueError as e:
+                    error = str(e)
+
+            if error is not None:
+                report['failed'] += 1
+                if len(report['errors']) < max_errors:
+                    report['errors'].append({"line": line_no, "error": error})
+                continue
+
+            if len(batch) >= chunk_size:
+                report['imported'] += self._flush(batch, dry_run)
+                batch = []
+
+        report['imported'] += self._flush(batch, dry_run)
+
+        logger.info(f"菜单导入完成: 共 {report['total']} 行，成功 {report['imported']} 行，失败 {report['failed']} 行")
+        return report
+
+    def _flush(self, batch: List[Dict[str, Any]], dry_run: bool) -> int:
+        """写入并提交一批，提交后使菜单缓存失效（锁只持有一个批次的时间）"""
+        if batch and not dry_run:
+            with transaction.atomic():
+                self.dish_repo.import_dishes(batch)
+            version_counter.bump(MENU_VERSION)
+        return len(batch)
+
+
+# 创建全局实例
+menu_importer = MenuImporter()
@@ -0,0 +1,135 @@
+"""
+菜品搜索分页工具
+提供与排序方式对应的游标（keyset）分页，以及按筛选条件签名缓存的总数
+"""
+import base64
+import hashlib
+import json
+from decimal import Decimal, InvalidOperation
+from typing import Dict, Any, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+
+from core.exceptions import ValidationException
+
+# 排序方式 -> [(字段, 是否降序)]，最后一个字段均为 id，保证顺序唯一
+ORDERINGS = {
+    'default': [('rating', True), ('id', True)],
+    'price_asc': [('price', False), ('rating', True), ('id', True)],
+    'price_desc': [('price', True), ('rating', True), ('id', True)],
+    'rating': [('rating', True), ('price', False), ('id', True)],
+    'created_at': [('id', True)],
+    # 仅在有搜索关键词时可用，relevance 为全文索引计算的 BM25 相关度
+    'relevance': [('relevance', True), ('id', True)],
+}
+
+# 兼容前端和AI工具使用的排序别名
+ORDERING_ALIASES = {
+    'price': 'price_asc',
+    '-price': 'price_desc',
+    '-rating': 'rating',
+    'wait_time': 'default',
+}
+
+# 不参与总数缓存签名的参数
+_NON_FILTER_KEYS = {'page', 'limit', 'cursor', 'ordering', 'include_total', 'pickup_time'}
+
+
+def resolve_ordering(ordering: Optional[str], has_relevance: bool = False) -> str:
+    """将排序参数规范化为 ORDERINGS 中的键"""
+    ordering = ORDERING_ALIASES.get(ordering, ordering)
+    if ordering == 'relevance' and not has_relevance:
+        return 'default'
+    return ordering if ordering in ORDERINGS else 'default'
+
+
+def order_by_sql(ordering: str) -> str:
+    """生成 ORDER BY 子句"""
+    return ", ".join(
+        f"d.{field} {'DESC' if descending else 'ASC'}"
+        for field, descending in ORDERINGS[ordering]
+    )
+
+
+def encode_cursor(ordering: str, dish: Dict[str, Any]) -> str:
+    """根据当前页最后一个菜品生成不透明游标"""
+    payload = {
+        "o": ordering,
+        "k": [str(dish[field]) for field, _ in ORDERINGS[ordering]],
+    }
+    raw = json.dumps(payload, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str, ordering: str) -> List[Decimal]:
+    """
+    解析游标
+
+    Raises:
+        ValidationException: 游标无效或与排序方式不匹配
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        values = [Decimal(value) for value in payload['k']]
+    except (ValueError, KeyError, TypeError, InvalidOperation):
+        raise ValidationException("无效的分页游标")
+
+    if payload.get('o') != ordering or len(values) != len(ORDERINGS[ordering]):
+        raise ValidationException("分页游标与排序方式不匹配")
+    return values
+
+
+def keyset_sql(ordering: str, values: List[Decimal]) -> Tuple[str, List[Any]]:
+    """
+    生成“位于游标之后”的 WHERE 条件
+
+    例如 rating DESC, id DESC 生成:
+    (d.rating < %s OR (d.rating = %s AND (d.id < %s)))
+    """
+    clause = ""
+    params: List[Any] = []
+    for (field, descending), value in reversed(list(zip(ORDERINGS[ordering], values))):
+        op = '<' if descending else '>'
+        if clause:
+            clause = f"(d.{field} {op} %s OR (d.{field} = %s AND {clause}))"
+            params = [value, value] + params
+        else:
+            clause = f"(d.{field} {op} %s)"
+            params = [value]
+    return clause, params
+
+
+def filter_signature(query: str, filters: Dict[str, Any]) -> str:
+    """计算规范化筛选条件的签名，用于缓存总数"""
+    normalized = {
+        key: value for key, value in filters.items()
+        if key not in _NON_FILTER_KEYS and value not in ('', None)
+    }
+    raw = json.dumps([query or '', normalized], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def get_cached_total(signature: str, version: str) -> Optional[int]:
+    """读取缓存的总数"""
+    return cache.get(f"dish_total:{version}:{signature}")
+
+
+def set_cached_total(signature: str, version: str, total: int) -> None:
+    """缓存总数"""
+    timeout = settings.DISH_SEARCH.get('TOTAL_CACHE_TTL', 30)
+    cache.set(f"dish_total:{version}:{signature}", total, timeout)
+
+
+def build_pagination(page: int, limit: int, total: Optional[int],
+                     has_more: bool, next_cursor: Optional[str]) -> Dict[str, Any]:
+    """构建分页信息，未统计总数时 total 和 pages 为 None"""
+    return {
+        "page": page,
+        "limit": limit,
+        "total": total,
+        "pages": (total + limit - 1) // limit if total is not None else None,
+        "has_more": has_more,
+        "next_cursor": next_cursor
+    }
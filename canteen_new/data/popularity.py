@@ -0,0 +1,176 @@
+"""
+菜品热度排行
+根据订单和收藏按时间衰减累计每个菜品的热度分，持久化在 dish_popularity 表中。
+进程内维护按热度排好序的排行榜（全部、按食堂、按分类），读取前 k 名只需 O(k)。
+"""
+import bisect
+import logging
+import math
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+
+from .database import query_all, execute_update
+from .replication import use_primary
+from .versioning import version_counter, MENU_VERSION
+
+logger = logging.getLogger(__name__)
+
+BoardKey = Tuple[Optional[str], Optional[str]]
+
+
+def decay_rate() -> float:
+    """每秒的衰减系数，由半衰期换算"""
+    half_life = settings.POPULARITY.get('HALF_LIFE_HOURS', 72) * 3600
+    return math.log(2) / half_life
+
+
+def record_event_sql() -> str:
+    """累加热度的 SQL：先将已有分数衰减到当前时刻再加上新事件的权重"""
+    return """
+        INSERT INTO dish_popularity (dish_id, score, updated_at) VALUES (%s, %s, NOW())
+        ON DUPLICATE KEY UPDATE
+            score = score * EXP(-%s * GREATEST(TIMESTAMPDIFF(SECOND, updated_at, NOW()), 0)) + VALUES(score),
+            updated_at = NOW()
+    """
+
+
+class PopularityBoard:
+    """
+    进程内热度排行榜
+
+    内存中的排序键采用前向衰减：事件在 t 时刻的权重记为 w * e^(λ(t - base))，
+    所有菜品按同一速率衰减，因此排序键无需随时间更新，新事件只需调整一个菜品的位置。
+    本进程的事件立即生效，其他进程的事件在刷新间隔后生效。
+    """
+
+    def __init__(self):
+        # 排行榜键 -> [(-排序键, 菜品ID)] 升序，即热度从高到低
+        self._boards: Dict[BoardKey, List[Tuple[float, int]]] = {}
+        self._keys: Dict[int, float] = {}
+        self._dish_boards: Dict[int, List[BoardKey]] = {}
+        self._base = time.time()
+        self._loaded_at = 0.0
+        self._menu_version: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _load(self) -> None:
+        rows = query_all("""
+            SELECT p.dish_id, p.score,
+                   GREATEST(TIMESTAMPDIFF(SECOND, p.updated_at, NOW()), 0) AS age,
+                   d.category, m.canteen
+            FROM dish_popularity p
+            JOIN dishes d ON d.id = p.dish_id AND d.status = 'active'
+            LEFT JOIN merchants m ON d.merchant_id = m.id
+        """)
+        rate = decay_rate()
+        boards = defaultdict(list)
+        keys = {}
+        dish_boards = {}
+        for row in rows:
+            dish_id = row['dish_id']
+            keys[dish_id] = float(row['score']) * math.exp(-rate * row['age'])
+            dish_boards[dish_id] = [
+                (None, None), (row['canteen'], None),
+                (None, row['category']), (row['canteen'], row['category'])
+            ]
+            for board_key in dish_boards[dish_id]:
+                boards[board_key].append((-keys[dish_id], dish_id))
+        for board in boards.values():
+            board.sort()
+
+        self._boards = dict(boards)
+        self._keys = keys
+        self._dish_boards = dish_boards
+        self._base = time.time()
+
+    def _is_fresh(self, menu_version: int, refresh_interval: float) -> bool:
+        return (menu_version == self._menu_version
+                and time.monotonic() - self._loaded_at < refresh_interval)
+
+    def _refresh_if_needed(self) -> None:
+        menu_version = version_counter.get(MENU_VERSION)
+        refresh_interval = settings.POPULARITY.get('REFRESH_INTERVAL', 60)
+        if self._is_fresh(menu_version, refresh_interval):
+            return
+        with self._lock:
+            # 等待锁期间其他线程可能已经完成刷新
+            if self._is_fresh(menu_version, refresh_interval):
+                return
+            # 按版本号重新加载时从主库读取，避免把副本上的旧数据标记为新版本
+            with use_primary():
+                self._load()
+            self._menu_version = menu_version
+            self._loaded_at = time.monotonic()
+
+    def record(self, dish_id: int, weight: float) -> None:
+        """
+        记录一次热度事件（下单、收藏），失败时只记录日志，不影响业务操作
+
+        Args:
+            dish_id: 菜品ID
+            weight: 事件权重
+        """
+        try:
+            execute_update(record_event_sql(), (dish_id, weight, decay_rate()))
+        except Exception as e:
+            logger.warning(f"更新菜品 {dish_id} 热度失败: {e}")
+            return
+
+        with self._lock:
+            # 尚未进入排行榜的菜品在下次刷新时加入
+            if dish_id not in self._dish_boards:
+                return
+            old_key = self._keys[dish_id]
+            new_key = old_key + weight * math.exp(decay_rate() * (time.time() - self._base))
+            for board_key in self._dish_boards[dish_id]:
+                board = self._boards[board_key]
+                del board[bisect.bisect_left(board, (-old_key, dish_id))]
+                bisect.insort(board, (-new_key, dish_id))
+            self._keys[dish_id] = new_key
+
+    def top(self, limit: int, canteen: str = None, category: str = None) -> List[Tuple[int, float]]:
+        """
+        获取热度前 limit 名
+
+        Args:
+            limit: 数量
+            canteen: 食堂筛选
+            category: 分类筛选
+
+        Returns:
+            [(菜品ID, 当前热度分)]，按热度降序
+        """
+        self._refresh_if_needed()
+        board = self._boards.get((canteen or None, category or None), [])
+        scale = math.exp(-decay_rate() * (time.time() - self._base))
+        return [(dish_id, -neg_key * scale) for neg_key, dish_id in board[:limit]]
+
+    def compact(self) -> int:
+        """
+        压缩热度表：将所有分数衰减到当前时刻，删除已衰减到可忽略的记录
+
+        Returns:
+            删除的记录数
+        """
+        execute_update(
+            """
+            UPDATE dish_popularity
+            SET score = score * EXP(-%s * GREATEST(TIMESTAMPDIFF(SECOND, updated_at, NOW()), 0)),
+                updated_at = NOW()
+            """,
+            (decay_rate(),)
+        )
+        removed = execute_update(
+            "DELETE FROM dish_popularity WHERE score < %s",
+            (settings.POPULARITY.get('MIN_SCORE', 0.01),)
+        )
+        self._loaded_at = 0.0
+        return removed
+
+
+# 创建全局实例
+popularity_board = PopularityBoard()
@@ -0,0 +1,63 @@
+"""
+查询投影
+仓储层为每类查询声明一次“输出字段 -> SQL 列 -> 转换函数”，
+查询以元组行模式返回，再一次性解码为最终输出的字典，
+避免先构造中间字典、再逐字段复制和改名。
+"""
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# 字段声明: (输出键, SQL 表达式) 或 (输出键, SQL 表达式, 转换函数)
+FieldSpec = Tuple
+
+
+def optional_float(value: Any) -> Optional[float]:
+    """Decimal 转 float，NULL 保持为 None"""
+    return float(value) if value is not None else None
+
+
+class Projection:
+    """
+    查询投影
+
+    多个输出键可以引用同一个 SQL 表达式（例如 store_name 和 merchant_name），
+    该表达式只会出现在 SELECT 列表中一次。行解码函数在构造时按字段声明生成，
+    每行只构造一个输出字典，没有按字段的循环和多余的函数调用。
+    指定 record 时（例如 data.records.Dish），每行直接按位置构造该记录类型，字段顺序须与其一致
+    （记录末尾带默认值的字段可以不在投影中）。
+    """
+
+    def __init__(self, fields: Sequence[FieldSpec], record: Optional[type] = None):
+        self.fields = [tuple(field) + (None,) * (3 - len(field)) for field in fields]
+        self.keys = [key for key, _, _ in self.fields]
+        self.record = record
+        if record is not None and tuple(self.keys) != tuple(record._fields[:len(self.keys)]):
+            raise ValueError(f"投影字段与 {record.__name__} 的字段不一致")
+
+        expressions: List[str] = []
+        positions: Dict[str, int] = {}
+        for _, expression, _ in self.fields:
+            if expression not in positions:
+                positions[expression] = len(expressions)
+                expressions.append(expression)
+        self.expressions = expressions
+        self.columns = ", ".join(expressions)
+
+        namespace: Dict[str, Callable[[Any], Any]] = {}
+        items = []
+        for index, (key, expression, converter) in enumerate(self.fields):
+            value = f"row[{positions[expression]}]"
+            if converter is not None:
+                namespace[f"_convert_{index}"] = converter
+                value = f"_convert_{index}({value})"
+            items.append(value if record is not None else f"{key!r}: {value}")
+        # 字段声明在代码中固定，生成的只是一个字典字面量或一次记录构造
+        if record is not None:
+            namespace['_record'] = record
+            body = f"_record({', '.join(items)})"
+        else:
+            body = f"{{{', '.join(items)}}}"
+        self.decode_row: Callable[[Sequence[Any]], Any] = eval(f"lambda row: {body}", namespace)
+
+    def decode(self, rows: Iterable[Sequence[Any]]) -> List[Any]:
+        """将元组行解码为输出字典（或记录）列表"""
+        return list(map(self.decode_row, rows))
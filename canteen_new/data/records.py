@@ -0,0 +1,129 @@
+"""
+菜品记录类型
+列表类接口中的菜品使用紧凑的 slots 数据类代替 16 个键的字典：
+每个菜品只占一个固定布局的对象，快速 JSON 渲染器（core.response.FastJSONRenderer）
+可直接序列化；同时提供 dish['price']、dish.get('rating') 等映射访问方式，兼容原有代码。
+"""
+from dataclasses import dataclass, fields
+from operator import attrgetter
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+
+class RecordMapping:
+    """为数据类记录提供只读映射接口（字段名即键，_fields 由 _slotted 设置）"""
+    __slots__ = ()
+    _fields: Tuple[str, ...] = ()
+
+    def keys(self) -> Tuple[str, ...]:
+        return self._fields
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._fields)
+
+    def __len__(self) -> int:
+        return len(self._fields)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._fields
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in self._fields:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if key not in self._fields:
+            raise KeyError(f"{type(self).__name__} 没有字段 {key}")
+        setattr(self, key, value)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if key not in self._fields:
+            return default
+        return getattr(self, key)
+
+    def items(self):
+        return zip(self._fields, self.values())
+
+    def values(self) -> Tuple[Any, ...]:
+        return _record_values(self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(zip(self._fields, self.values()))
+
+
+def _record_values(record) -> Tuple[Any, ...]:
+    getter = _VALUE_GETTERS.get(type(record))
+    if getter is None:
+        getter = _VALUE_GETTERS[type(record)] = attrgetter(*type(record)._fields)
+    return getter(record)
+
+
+_VALUE_GETTERS: Dict[type, attrgetter] = {}
+
+
+def _slotted(cls: type) -> type:
+    """
+    为数据类添加 __slots__ 并记录字段顺序（_fields）
+
+    与 Python 3.10 的 dataclass(slots=True) 相同：以只含新增字段的 __slots__ 重新创建类，
+    字段默认值已保存在生成的 __init__ 中，不再作为类属性保留。用于兼容 Python 3.8/3.9。
+    """
+    names = tuple(field.name for field in fields(cls))
+    inherited = set()
+    for base in cls.__mro__[1:]:
+        inherited.update(getattr(base, '__slots__', ()))
+    namespace = {
+        key: value for key, value in cls.__dict__.items()
+        if key not in names and key not in ('__dict__', '__weakref__')
+    }
+    namespace['__slots__'] = tuple(name for name in names if name not in inherited)
+    namespace['_fields'] = names
+    slotted_cls = type(cls)(cls.__name__, cls.__bases__, namespace)
+    slotted_cls.__qualname__ = cls.__qualname__
+    return slotted_cls
+
+
+@_slotted
+@dataclass
+class Dish(RecordMapping):
+    """菜品（列表接口输出结构）"""
+    id: int
+    merchant_id: int
+    name: str
+    description: Optional[str]
+    price: float
+    category: Optional[str]
+    taste: Optional[str]
+    spice_level: Optional[int]
+    image_url: Optional[str]
+    is_available: bool
+    stock_quantity: Optional[int]
+    rating: float
+    store_name: Optional[str]
+    merchant_name: Optional[str]
+    canteen: Optional[str]
+    wait_time: int
+    # 按取餐时间预测的等待时间（分钟），仅在请求指定取餐时间时填写
+    expected_wait_time: Optional[float] = None
+
+    def with_relevance(self, relevance: float) -> 'RankedDish':
+        """附加全文检索相关度"""
+        return RankedDish(*_record_values(self), relevance=relevance)
+
+    def with_popularity(self, popularity: float) -> 'PopularDish':
+        """附加热度分"""
+        return PopularDish(*_record_values(self), popularity=popularity)
+
+
+@_slotted
+@dataclass
+class RankedDish(Dish):
+    """带相关度的菜品（按关键词搜索）"""
+    relevance: float = 0.0
+
+
+@_slotted
+@dataclass
+class PopularDish(Dish):
+    """带热度分的菜品（热门推荐）"""
+    popularity: float = 0.0
@@ -0,0 +1,88 @@
+"""
+读写分离
+只读查询分发到 READ_REPLICAS 中的只读副本，写操作始终走主库。
+发生写操作后，本次请求剩余的读取以及该客户端在一段时间内（通过 Cookie 记录）的读取都走主库，
+保证用户和商家能读到自己刚写入的数据。
+"""
+import contextvars
+import random
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class _RequestState:
+    """单个请求的读写状态"""
+    __slots__ = ('pinned', 'wrote')
+
+    def __init__(self, pinned: bool = False):
+        self.pinned = pinned
+        self.wrote = False
+
+
+_request_state: contextvars.ContextVar = contextvars.ContextVar('db_request_state', default=None)
+_force_primary: contextvars.ContextVar = contextvars.ContextVar('db_force_primary', default=False)
+
+
+@contextmanager
+def use_primary():
+    """在该上下文中的读取都走主库（例如按版本号加载进程内缓存时，避免读到副本的旧数据）"""
+    token = _force_primary.set(True)
+    try:
+        yield
+    finally:
+        _force_primary.reset(token)
+
+
+def mark_write() -> None:
+    """记录发生了写操作，之后本请求的读取都走主库"""
+    state = _request_state.get()
+    if state is not None:
+        state.wrote = True
+        state.pinned = True
+
+
+def get_read_alias() -> str:
+    """选择执行只读查询的数据库别名"""
+    replicas = getattr(settings, 'READ_REPLICAS', None)
+    if not replicas or _force_primary.get():
+        return DEFAULT_DB_ALIAS
+
+    # 主库上有未提交的事务时，读取必须在同一连接上进行
+    if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+        return DEFAULT_DB_ALIAS
+
+    state = _request_state.get()
+    if state is not None and state.pinned:
+        return DEFAULT_DB_ALIAS
+    return random.choice(replicas)
+
+
+class ReadYourWritesMiddleware:
+    """根据 Cookie 判断客户端是否处于写后读主库的窗口内，并在发生写操作后设置该 Cookie"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        config = settings.READ_WRITE_SPLIT
+        cookie_name = config.get('COOKIE_NAME', 'db_primary_until')
+        try:
+            pinned = float(request.COOKIES.get(cookie_name, 0)) > time.time()
+        except ValueError:
+            pinned = False
+
+        state = _RequestState(pinned)
+        token = _request_state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_state.reset(token)
+
+        if state.wrote:
+            window = config.get('READ_YOUR_WRITES_WINDOW', 5)
+            response.set_cookie(cookie_name, f"{time.time() + window:.3f}",
+                                max_age=int(window) + 1, httponly=True, samesite='Lax')
+        return response
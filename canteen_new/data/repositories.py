@@ -2,8 +2,40 @@
 数据访问层
 此模块中实现与数据库之间的交互。
 """
+import logging
+from datetime import datetime
 from typing import Dict, Any, Optional, List, Tuple
-from .database import query_one, query_all, execute_update, execute_insert
+from django.conf import settings
+from django.db import transaction
+from .database import query_one, query_all, query_rows, execute_update, execute_insert, execute_many
+from .projection import Projection
+from .replication import use_primary
+from .records import Dish
+from .versioning import version_counter, MENU_VERSION, TRAFFIC_VERSION
+from .suggestions import suggestion_index
+from .sampling import dish_sampler
+from .popularity import popularity_board
+from .user_profiles import user_profiles
+from .traffic_rollups import traffic_rollups
+from .pagination import (
+    resolve_ordering, order_by_sql, encode_cursor, decode_cursor, keyset_sql,
+    filter_signature, get_cached_total, set_cached_total, build_pagination
+)
+
+logger = logging.getLogger(__name__)
+
+# 人流量等级阈值: low: count < 30, medium: 30 <= count < 60, high: count >= 60
+CROWD_MEDIUM_THRESHOLD = 30
+CROWD_HIGH_THRESHOLD = 60
+
+
+def get_crowd_level(count: int) -> str:
+    """根据客流人数计算人流量等级"""
+    if count >= CROWD_HIGH_THRESHOLD:
+        return 'high'
+    if count >= CROWD_MEDIUM_THRESHOLD:
+        return 'medium'
+    return 'low'
 
 
 class UserRepository:
@@ -73,31 +105,16 @@ class UserRepository:
         affected = execute_update(query, (preferences_json, user_id))
         
         if affected > 0:
+            user_profiles.invalidate(user_id)
             return preferences
         return None
     
     def get_user_preferences(self, user_id: int) -> Optional[Dict[str, Any]]:
-        """获取用户偏好设置"""
-        # 检查用户是否存在
-        user = self.get_user_by_id(user_id)
-        if not user:
+        """获取用户偏好设置（从用户画像缓存读取，用户不存在时返回 None）"""
+        profile = user_profiles.get(user_id)
+        if not profile['exists']:
             return None
-        
-        # 获取用户偏好
-        query = """
-            SELECT preferences
-            FROM users 
-            WHERE id = %s
-        """
-        result = query_one(query, (user_id,))
-        
-        if result and result['preferences']:
-            import json
-            try:
-                return json.loads(result['preferences'])
-            except json.JSONDecodeError:
-                return {}
-        return {}
+        return profile['preferences']
 
 
 class MerchantRepository:
@@ -195,57 +212,180 @@ class MerchantRepository:
         return None
     
     def record_traffic(self, traffic_data: Dict[str, Any]) -> Dict[str, Any]:
-        """记录客流量"""
+        """记录客流量，并在同一事务中更新商家实时状态和分钟/小时/天汇总"""
         query = """
             INSERT INTO traffic_data (merchant_id, count, waiting_time, timestamp)
             VALUES (%s, %s, %s, %s)
         """
-        traffic_id = execute_insert(
-            query,
-            (
-                traffic_data['merchantId'],
-                traffic_data['count'],
-                traffic_data['waitingTime'],
-                traffic_data.get('timestamp', 'NOW()')
+        # 只有更新的上报才会覆盖实时状态，补报的历史数据不影响当前状态
+        live_status_query = """
+            INSERT INTO merchant_live_status (merchant_id, count, waiting_time, crowd_level, reported_at)
+            VALUES (%s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE
+                count = IF(VALUES(reported_at) >= reported_at, VALUES(count), count),
+                waiting_time = IF(VALUES(reported_at) >= reported_at, VALUES(waiting_time), waiting_time),
+                crowd_level = IF(VALUES(reported_at) >= reported_at, VALUES(crowd_level), crowd_level),
+                reported_at = GREATEST(reported_at, VALUES(reported_at))
+        """
+        timestamp = traffic_data.get('timestamp') or datetime.now()
+        if isinstance(timestamp, str):
+            timestamp = datetime.fromisoformat(timestamp)
+        
+        with transaction.atomic():
+            traffic_id = execute_insert(
+                query,
+                (
+                    traffic_data['merchantId'],
+                    traffic_data['count'],
+                    traffic_data['waitingTime'],
+                    timestamp
+                )
             )
-        )
+            
+            if traffic_id:
+                execute_update(
+                    live_status_query,
+                    (
+                        traffic_data['merchantId'],
+                        traffic_data['count'],
+                        traffic_data['waitingTime'],
+                        get_crowd_level(traffic_data['count']),
+                        timestamp
+                    )
+                )
+                traffic_rollups.record(
+                    traffic_data['merchantId'],
+                    traffic_data['count'],
+                    traffic_data['waitingTime'],
+                    timestamp
+                )
         
         if traffic_id:
+            version_counter.bump(TRAFFIC_VERSION)
             return {
                 "id": traffic_id,
                 "count": traffic_data['count'],
                 "waitingTime": traffic_data['waitingTime'],
-                "timestamp": traffic_data.get('timestamp', 'NOW()')
+                "timestamp": timestamp
             }
         return None
     
-    def get_traffic_statistics(self, filters: Dict[str, Any] = None) -> List[Dict[str, Any]]:
-        """获取客流量统计"""
+    def get_traffic_statistics(self, filters: Dict[str, Any] = None) -> Dict[str, Any]:
+        """
+        获取最近 N 分钟的客流量统计（每个商家、每个食堂和全部商家的均值、趋势和人流量等级）
+
+        Args:
+            filters: 可选筛选条件 window_minutes、canteen、merchant_id
+
+        Returns:
+            {window_minutes, generated_at, merchants, canteens, overall}
+        """
+        from .traffic_stats import traffic_statistics
+        
         if filters is None:
             filters = {}
         
-        # 这里需要根据实际的统计需求来实现
-        # 暂时返回空列表
-        return []
+        return traffic_statistics.get(
+            window_minutes=filters.get('window_minutes'),
+            canteen=filters.get('canteen'),
+            merchant_id=filters.get('merchant_id')
+        )
 
 
 class DishRepository:
     """菜品数据访问层"""
     
+    # 菜品列表（搜索、筛选、热门、随机、批量加载）输出字段
+    LIST_PROJECTION = Projection([
+        ("id", "d.id"),
+        ("merchant_id", "d.merchant_id"),
+        ("name", "d.name"),
+        ("description", "d.description"),
+        ("price", "d.price", float),
+        ("category", "d.category"),
+        ("taste", "d.taste"),
+        ("spice_level", "d.spice_level"),
+        ("image_url", "d.image_url"),
+        ("is_available", "d.is_available", bool),
+        ("stock_quantity", "d.stock_quantity"),
+        ("rating", "d.rating", float),
+        ("store_name", "m.store_name"),
+        ("merchant_name", "m.store_name"),
+        ("canteen", "m.canteen"),
+        ("wait_time", "COALESCE(ls.waiting_time, 15)", int),  # 等待时间（分钟），默认15分钟
+    ], record=Dish)
+    
+    # 菜品详情输出字段
+    DETAIL_PROJECTION = Projection([
+        field for field in LIST_PROJECTION.fields if field[0] != "merchant_name"
+    ])
+    
+    # 商家自己的菜品列表输出字段（不关联商家和实时状态）
+    MERCHANT_PROJECTION = Projection([
+        ("id", "id"),
+        ("merchant_id", "merchant_id"),
+        ("name", "name"),
+        ("description", "description"),
+        ("price", "price", float),
+        ("category", "category"),
+        ("taste", "taste"),
+        ("spice_level", "spice_level"),
+        ("image_url", "image_url"),
+        ("is_available", "is_available", bool),
+        ("stock_quantity", "stock_quantity"),
+        ("rating", "rating", float),
+    ])
+    
     def search_dishes(self, query: str, filters: Dict[str, Any] = None) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
         """搜索菜品"""
         if filters is None:
             filters = {}
         
+        # 关键词优先通过全文索引匹配，得到候选菜品及相关度
+        relevance = self._match_keyword(query) if query else None
+        
+        # 优先使用进程内菜品目录，失败时回退到SQL查询
+        from .catalog import dish_catalog
+        if dish_catalog.is_enabled():
+            try:
+                return dish_catalog.search(query, filters, relevance)
+            except Exception as e:
+                logger.warning(f"菜品目录查询失败，回退到数据库查询: {e}")
+        
+        return self._search_dishes_sql(query, filters, relevance)
+    
+    def _match_keyword(self, query: str) -> Optional[Dict[int, float]]:
+        """通过全文索引匹配关键词，索引不可用时返回 None（回退到 LIKE）"""
+        from .search_index import dish_search_index
+        if not dish_search_index.is_enabled():
+            return None
+        try:
+            return dish_search_index.search(query)
+        except Exception as e:
+            logger.warning(f"全文索引检索失败，回退到模糊匹配: {e}")
+            return None
+    
+    def _search_dishes_sql(self, query: str, filters: Dict[str, Any],
+                           relevance: Optional[Dict[int, float]] = None) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """通过SQL搜索菜品"""
         # 构建搜索条件
         conditions = ["d.status = 'active'"]
         params = []
         
-        if query:
+        if relevance is not None:
+            if not relevance:
+                return [], build_pagination(filters.get('page', 1), filters.get('limit', 100), 0, False, None)
+            conditions.append(f"d.id IN ({', '.join(['%s'] * len(relevance))})")
+            params.extend(relevance.keys())
+        elif query:
             conditions.append("(d.name LIKE %s OR d.description LIKE %s)")
             params.extend([f"%{query}%", f"%{query}%"])
         
         # 添加筛选条件
+        if filters.get('ids'):
+            conditions.append(f"d.id IN ({', '.join(['%s'] * len(filters['ids']))})")
+            params.extend(filters['ids'])
+        
         if filters.get('category'):
             conditions.append("d.category = %s")
             params.append(filters['category'])
@@ -276,121 +416,132 @@ class DishRepository:
             conditions.append("m.canteen = %s")
             params.append(filters['hall'])
         
-        # 人流量筛选（基于食堂的最新客流量数据）
+        # 人流量筛选（基于商家实时状态表中的最新客流等级，多个等级逗号分隔，unknown 表示没有客流记录）
         if filters.get('crowd_level') and filters.get('crowd_level') != 'any':
-            crowd_level = filters['crowd_level']
-            # 根据人流量等级筛选食堂
-            # low: count < 30, medium: 30 <= count < 60, high: count >= 60
-            subquery = """
-                SELECT DISTINCT t.merchant_id
-                FROM traffic_data t
-                WHERE t.timestamp = (
-                    SELECT MAX(t2.timestamp)
-                    FROM traffic_data t2
-                    WHERE t2.merchant_id = t.merchant_id
-                )
-            """
-            
-            if crowd_level == 'low':
-                subquery += " AND t.count < 30"
-            elif crowd_level == 'medium':
-                subquery += " AND t.count >= 30 AND t.count < 60"
-            elif crowd_level == 'high':
-                subquery += " AND t.count >= 60"
-            
-            conditions.append(f"d.merchant_id IN ({subquery})")
+            requested = str(filters['crowd_level']).split(',')
+            levels = [level for level in requested if level in ('low', 'medium', 'high')]
+            crowd_conditions = []
+            if levels:
+                crowd_conditions.append(f"ls.crowd_level IN ({', '.join(['%s'] * len(levels))})")
+                params.extend(levels)
+            if 'unknown' in requested:
+                crowd_conditions.append("ls.crowd_level IS NULL")
+            if crowd_conditions:
+                conditions.append(f"({' OR '.join(crowd_conditions)})")
+            else:
+                conditions.append("ls.merchant_id IS NOT NULL")
         
         where_clause = " AND ".join(conditions)
         
-        # 获取总数（需要 LEFT JOIN merchants，因为可能有食堂筛选条件）
-        count_query = f"""
-            SELECT COUNT(*) as total
-            FROM dishes d
-            LEFT JOIN merchants m ON d.merchant_id = m.id
-            WHERE {where_clause}
-        """
-        total_result = query_one(count_query, tuple(params))
-        total = total_result['total'] if total_result else 0
-        
         # 分页参数
         page = filters.get('page', 1)
         limit = filters.get('limit', 100)  # 增加默认limit，便于筛选
-        offset = (page - 1) * limit
-        
-        # 构建排序条件
-        ordering = filters.get('ordering', 'default')
-        order_clause = "d.rating DESC, d.id DESC"  # 默认排序
-        
-        if ordering == 'price' or ordering == 'price_asc':
-            order_clause = "d.price ASC, d.rating DESC"
-        elif ordering == '-price' or ordering == 'price_desc':
-            order_clause = "d.price DESC, d.rating DESC"
-        elif ordering == '-rating' or ordering == 'rating':
-            order_clause = "d.rating DESC, d.price ASC"
-        elif ordering == 'created_at':
-            order_clause = "d.id DESC"  # 按创建顺序（ID）降序
-        elif ordering == 'wait_time':
-            # 这里可以根据等待时间排序，暂时使用rating
-            order_clause = "d.rating DESC, d.id DESC"
+        cursor = filters.get('cursor')
+        ordering = resolve_ordering(filters.get('ordering', 'default'), has_relevance=bool(relevance))
+        
+        # 按相关度排序时，排序和分页在内存中完成
+        if ordering == 'relevance':
+            return self._search_dishes_by_relevance(where_clause, params, relevance, page, limit, cursor)
+        
+        # 获取总数：游标翻页默认不统计；统计结果按筛选条件签名和数据版本缓存
+        total = None
+        if filters.get('include_total', not cursor):
+            version = f"{version_counter.get(MENU_VERSION)}.{version_counter.get(TRAFFIC_VERSION)}"
+            signature = filter_signature(query, filters)
+            total = get_cached_total(signature, version)
+            if total is None:
+                # 需要 LEFT JOIN merchants 和实时状态表，因为可能有食堂、人流量筛选条件
+                count_query = f"""
+                    SELECT COUNT(*) as total
+                    FROM dishes d
+                    LEFT JOIN merchants m ON d.merchant_id = m.id
+                    LEFT JOIN merchant_live_status ls ON ls.merchant_id = d.merchant_id
+                    WHERE {where_clause}
+                """
+                total_result = query_one(count_query, tuple(params))
+                total = total_result['total'] if total_result else 0
+                set_cached_total(signature, version, total)
+        
+        # 游标分页：从上一页最后一条记录之后继续读取，不再使用 OFFSET
+        if cursor:
+            keyset_clause, keyset_params = keyset_sql(ordering, decode_cursor(cursor, ordering))
+            where_clause = f"{where_clause} AND {keyset_clause}"
+            params.extend(keyset_params)
+            offset = 0
+        else:
+            offset = (page - 1) * limit
         
         # 获取菜品数据（包含等待时间）
         query_sql = f"""
-            SELECT d.id, d.merchant_id, d.name, d.description, d.price, d.category, 
-                   d.taste, d.spice_level, d.image_url, d.is_available, d.stock_quantity, d.rating,
-                   m.store_name, m.canteen,
-                   COALESCE((
-                       SELECT waiting_time 
-                       FROM traffic_data 
-                       WHERE merchant_id = d.merchant_id 
-                       ORDER BY timestamp DESC 
-                       LIMIT 1
-                   ), 15) as wait_time
+            SELECT {self.LIST_PROJECTION.columns}
             FROM dishes d
             LEFT JOIN merchants m ON d.merchant_id = m.id
+            LEFT JOIN merchant_live_status ls ON ls.merchant_id = d.merchant_id
             WHERE {where_clause}
-            ORDER BY {order_clause}
+            ORDER BY {order_by_sql(ordering)}
             LIMIT %s OFFSET %s
         """
-        params.extend([limit, offset])
+        # 多取一条用于判断是否还有下一页
+        params.extend([limit + 1, offset])
         
-        dishes = query_all(query_sql, tuple(params))
+        rows = query_rows(query_sql, tuple(params))
+        has_more = len(rows) > limit
         
-        # 格式化结果
-        formatted_dishes = [
-            {
-                "id": dish['id'],
-                "merchant_id": dish['merchant_id'],
-                "name": dish['name'],
-                "description": dish['description'],
-                "price": float(dish['price']),
-                "category": dish['category'],
-                "taste": dish['taste'],
-                "spice_level": dish['spice_level'],
-                "image_url": dish['image_url'],
-                "is_available": bool(dish['is_available']),
-                "stock_quantity": dish['stock_quantity'],
-                "rating": float(dish['rating']),
-                "store_name": dish['store_name'],
-                "merchant_name": dish['store_name'],  # 添加merchant_name字段
-                "canteen": dish['canteen'],
-                "wait_time": int(dish['wait_time']) if dish['wait_time'] else 15  # 等待时间（分钟），默认15分钟
-            }
-            for dish in dishes
-        ]
+        # 只解码当前页
+        formatted_dishes = self.LIST_PROJECTION.decode(rows[:limit])
         
-        pagination = {
-            "page": page,
-            "limit": limit,
-            "total": total,
-            "pages": (total + limit - 1) // limit
-        }
+        next_cursor = encode_cursor(ordering, formatted_dishes[-1]) if has_more else None
+        pagination = build_pagination(page, limit, total, has_more, next_cursor)
         
         return formatted_dishes, pagination
     
+    def _search_dishes_by_relevance(self, where_clause: str, params: List[Any], relevance: Dict[int, float],
+                                    page: int, limit: int, cursor: Optional[str]) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """按全文检索相关度排序分页：先取满足筛选条件的ID，再只加载当前页的菜品"""
+        id_query = f"""
+            SELECT d.id
+            FROM dishes d
+            LEFT JOIN merchants m ON d.merchant_id = m.id
+            LEFT JOIN merchant_live_status ls ON ls.merchant_id = d.merchant_id
+            WHERE {where_clause}
+        """
+        ranked = sorted(
+            (row['id'] for row in query_all(id_query, tuple(params))),
+            key=lambda dish_id: (-relevance[dish_id], -dish_id)
+        )
+        total = len(ranked)
+        
+        if cursor:
+            last_score, last_id = (float(value) for value in decode_cursor(cursor, 'relevance'))
+            ranked = [
+                dish_id for dish_id in ranked
+                if relevance[dish_id] < last_score or (relevance[dish_id] == last_score and dish_id < last_id)
+            ]
+            offset = 0
+        else:
+            offset = (page - 1) * limit
+        
+        page_ids = ranked[offset:offset + limit]
+        has_more = len(ranked) > offset + limit
+        
+        dishes = []
+        if page_ids:
+            rows = {
+                dish['id']: dish
+                for dish in self._search_dishes_sql("", {'ids': page_ids, 'limit': limit, 'include_total': False})[0]
+            }
+            dishes = [
+                rows[dish_id].with_relevance(relevance[dish_id])
+                for dish_id in page_ids if dish_id in rows
+            ]
+        
+        next_cursor = encode_cursor('relevance', dishes[-1]) if has_more and dishes else None
+        return dishes, build_pagination(page, limit, total, has_more, next_cursor)
+    
     def filter_dishes(self, criteria: Dict[str, Any]) -> List[Dict[str, Any]]:
         """筛选菜品"""
-        # 使用search_dishes方法进行筛选
-        dishes, _ = self.search_dishes("", criteria)
+        # 使用search_dishes方法进行筛选，不需要分页总数
+        dishes, _ = self.search_dishes("", {**criteria, 'include_total': False})
         return dishes
     
     def get_search_suggestions(self, query: str) -> List[str]:
@@ -398,6 +549,15 @@ class DishRepository:
         if not query or len(query) < 2:
             return []
         
+        # 优先使用内存建议索引（支持拼音首字母，按热度排序），输入联想不访问数据库
+        if suggestion_index.is_enabled():
+            try:
+                suggestions = suggestion_index.suggest(query)
+                if suggestions is not None:
+                    return suggestions or self._common_suggestions(query)
+            except Exception as e:
+                logger.warning(f"搜索建议索引查询失败，回退到数据库: {e}")
+        
         # 查询菜品名称中包含关键词的建议
         query_sql = """
             SELECT DISTINCT d.name
@@ -415,80 +575,41 @@ class DishRepository:
         
         # 如果没有找到建议，返回一些通用建议
         if not suggestions:
-            common_suggestions = [
-                "麻辣香锅", "重庆小面", "黄焖鸡米饭", "扬州炒饭", 
-                "番茄牛肉面", "宫保鸡丁", "红烧肉", "糖醋里脊"
-            ]
-            # 返回包含查询关键词的建议
-            suggestions = [s for s in common_suggestions if query in s]
+            suggestions = self._common_suggestions(query)
         
         return suggestions
     
+    def _common_suggestions(self, query: str) -> List[str]:
+        """返回包含查询关键词的通用建议"""
+        common_suggestions = [
+            "麻辣香锅", "重庆小面", "黄焖鸡米饭", "扬州炒饭", 
+            "番茄牛肉面", "宫保鸡丁", "红烧肉", "糖醋里脊"
+        ]
+        return [s for s in common_suggestions if query in s]
+    
     def get_dish_by_id(self, dish_id: int) -> Optional[Dict[str, Any]]:
         """根据ID获取菜品"""
-        query = """
-            SELECT d.id, d.merchant_id, d.name, d.description, d.price, d.category, 
-                   d.taste, d.spice_level, d.image_url, d.is_available, d.stock_quantity, d.rating,
-                   m.store_name, m.canteen,
-                   COALESCE((
-                       SELECT waiting_time 
-                       FROM traffic_data 
-                       WHERE merchant_id = d.merchant_id 
-                       ORDER BY timestamp DESC 
-                       LIMIT 1
-                   ), 15) as wait_time
+        query = f"""
+            SELECT {self.DETAIL_PROJECTION.columns}
             FROM dishes d
             LEFT JOIN merchants m ON d.merchant_id = m.id
+            LEFT JOIN merchant_live_status ls ON ls.merchant_id = d.merchant_id
             WHERE d.id = %s AND d.status = 'active'
         """
-        dish = query_one(query, (dish_id,))
-        if dish:
-            return {
-                "id": dish['id'],
-                "merchant_id": dish['merchant_id'],
-                "name": dish['name'],
-                "description": dish['description'],
-                "price": float(dish['price']),
-                "category": dish['category'],
-                "taste": dish['taste'],
-                "spice_level": dish['spice_level'],
-                "image_url": dish['image_url'],
-                "is_available": bool(dish['is_available']),
-                "stock_quantity": dish['stock_quantity'],
-                "rating": float(dish['rating']),
-                "store_name": dish['store_name'],
-                "canteen": dish['canteen'],
-                "wait_time": int(dish['wait_time']) if dish['wait_time'] else 15
-            }
+        rows = query_rows(query, (dish_id,))
+        if rows:
+            return self.DETAIL_PROJECTION.decode_row(rows[0])
         return None
     
     def get_dishes_by_merchant(self, merchant_id: int) -> List[Dict[str, Any]]:
         """根据商家获取菜品列表"""
-        query = """
-            SELECT id, merchant_id, name, description, price, category, taste, 
-                   spice_level, image_url, is_available, stock_quantity, rating
+        query = f"""
+            SELECT {self.MERCHANT_PROJECTION.columns}
             FROM dishes 
             WHERE merchant_id = %s AND status = 'active'
             ORDER BY rating DESC, id DESC
         """
-        dishes = query_all(query, (merchant_id,))
-        return [
-            {
-                "id": dish['id'],
-                "merchant_id": dish['merchant_id'],
-                "name": dish['name'],
-                "description": dish['description'],
-                "price": float(dish['price']),
-                "category": dish['category'],
-                "taste": dish['taste'],
-                "spice_level": dish['spice_level'],
-                "image_url": dish['image_url'],
-                "is_available": bool(dish['is_available']),
-                "stock_quantity": dish['stock_quantity'],
-                "rating": float(dish['rating'])
-            }
-            for dish in dishes
-        ]
+        return self.MERCHANT_PROJECTION.decode(query_rows(query, (merchant_id,)))
     
     def create_dish(self, dish_data: Dict[str, Any]) -> Dict[str, Any]:
         """创建菜品"""
@@ -515,6 +636,7 @@ class DishRepository:
         )
         
         if dish_id:
+            version_counter.bump(MENU_VERSION)
             return {
                 "id": dish_id,
                 "name": dish_data['name'],
@@ -545,6 +667,7 @@ class DishRepository:
         
         affected = execute_update(query, tuple(params))
         if affected > 0:
+            version_counter.bump(MENU_VERSION)
             return self.get_dish_by_id(dish_id)
         return None
     
@@ -552,115 +675,222 @@ class DishRepository:
         """删除菜品（软删除）"""
         query = "UPDATE dishes SET status = 'deleted' WHERE id = %s"
         affected = execute_update(query, (dish_id,))
+        if affected > 0:
+            version_counter.bump(MENU_VERSION)
         return affected > 0
-    
-    def get_popular_dishes(self) -> List[Dict[str, Any]]:
-        """获取热门菜品"""
-        query = """
-            SELECT d.id, d.merchant_id, d.name, d.description, d.price, d.category, 
-                   d.taste, d.spice_level, d.image_url, d.is_available, d.stock_quantity, d.rating,
-                   m.store_name, m.canteen,
-                   COALESCE((
-                       SELECT waiting_time 
-                       FROM traffic_data 
-                       WHERE merchant_id = d.merchant_id 
-                       ORDER BY timestamp DESC 
-                       LIMIT 1
-                   ), 15) as wait_time
-            FROM dishes d
-            LEFT JOIN merchants m ON d.merchant_id = m.id
-            WHERE d.status = 'active'
-            ORDER BY d.rating DESC, d.id DESC
-            LIMIT 10
+
+    # 批量写入菜品的列（id 为 None 时新建）
+    BULK_COLUMNS = ("id", "merchant_id", "name", "description", "price", "category", "taste",
+                    "spice_level", "image_url", "is_available", "stock_quantity")
+
+    def bulk_apply(self, merchant_id: int, rows: List[Dict[str, Any]], delete_ids: List[int]) -> Dict[str, int]:
         """
-        dishes = query_all(query)
-        return [
-            {
-                "id": dish['id'],
-                "merchant_id": dish['merchant_id'],
-                "name": dish['name'],
-                "description": dish['description'],
-                "price": float(dish['price']),
-                "category": dish['category'],
-                "taste": dish['taste'],
-                "spice_level": dish['spice_level'],
-                "image_url": dish['image_url'],
-                "is_available": bool(dish['is_available']),
-                "stock_quantity": dish['stock_quantity'],
-                "rating": float(dish['rating']),
-                "store_name": dish['store_name'],
-                "merchant_name": dish['store_name'],  # 添加merchant_name字段
-                "canteen": dish['canteen'],
-                "wait_time": int(dish['wait_time']) if dish['wait_time'] else 15
-            }
-            for dish in dishes
-        ]
+        在一个事务中批量写入商家菜品，菜单版本只递增一次
+
+        Args:
+            merchant_id: 商家ID
+            rows: 完整的菜品行（含 BULK_COLUMNS 中的所有键），id 为 None 的行新建，其余按主键更新
+            delete_ids: 需要软删除的菜品ID
+
+        Returns:
+            新建菜品的 {名称: ID}
+        """
+        created_names = [row['name'] for row in rows if row['id'] is None]
+        created_ids: Dict[str, int] = {}
+
+        with transaction.atomic():
+            # 先删除，释放被删除菜品占用的名称
+            if delete_ids:
+                id_placeholders = ', '.join(['%s'] * len(delete_ids))
+                # 唯一键包含状态，以前删除过的同名菜品会与本次软删除冲突：
+                # 给以前删除的同名菜品加上 "#ID" 后缀，释放已删除状态下的名称
+                execute_update(
+                    f"""
+                    UPDATE dishes old
+                    JOIN dishes cur ON cur.merchant_id = old.merchant_id AND cur.name = old.name
+                    SET old.name = CONCAT(LEFT(old.name, 100 - CHAR_LENGTH(old.id) - 1), '#', old.id)
+                    WHERE cur.merchant_id = %s AND cur.status = 'active' AND cur.id IN ({id_placeholders})
+                      AND old.status = 'deleted'
+                    """,
+                    (merchant_id, *delete_ids)
+                )
+                execute_update(
+                    f"""
+                    UPDATE dishes SET status = 'deleted'
+                    WHERE merchant_id = %s AND status = 'active' AND id IN ({id_placeholders})
+                    """,
+                    (merchant_id, *delete_ids)
+                )
+
+            if rows:
+                row_placeholder = f"({', '.join(['%s'] * len(self.BULK_COLUMNS))}, 'active')"
+                updates = ", ".join(
+                    f"{column} = VALUES({column})" for column in self.BULK_COLUMNS if column not in ("id", "merchant_id")
+                )
+                execute_update(
+                    f"""
+                    INSERT INTO dishes ({', '.join(self.BULK_COLUMNS)}, status)
+                    VALUES {', '.join([row_placeholder] * len(rows))}
+                    ON DUPLICATE KEY UPDATE {updates}
+                    """,
+                    tuple(row[column] for row in rows for column in self.BULK_COLUMNS)
+                )
+
+            if created_names:
+                created_ids = {
+                    row['name']: row['id']
+                    for row in query_all(
+                        f"""
+                        SELECT id, name FROM dishes
+                        WHERE merchant_id = %s AND status = 'active' AND name IN ({', '.join(['%s'] * len(created_names))})
+                        """,
+                        (merchant_id, *created_names)
+                    )
+                }
+
+        if rows or delete_ids:
+            version_counter.bump(MENU_VERSION)
+        return created_ids
+
+    def import_dishes(self, rows: List[Dict[str, Any]]) -> None:
+        """
+        批量导入菜品（executemany 合并为多行插入），商家已有同名在售菜品时更新该菜品
+        
+        调用方负责事务和菜单版本更新（导入结束后只递增一次）
+        
+        Args:
+            rows: 菜品行，含 BULK_COLUMNS 中除 id 外的所有键
+        """
+        columns = self.BULK_COLUMNS[1:]
+        updates = ", ".join(f"{column} = VALUES({column})" for column in columns if column != "merchant_id")
+        query = (
+            f"INSERT INTO dishes ({', '.join(columns)}, status) "
+            f"VALUES ({', '.join(['%s'] * (len(columns) + 1))}) "
+            f"ON DUPLICATE KEY UPDATE {updates}"
+        )
+        execute_many(query, [tuple(row[column] for column in columns) + ('active',) for row in rows])
+
+    def get_popular_dishes(self, limit: int = 10, canteen: str = None,
+                           category: str = None) -> List[Dict[str, Any]]:
+        """获取热门菜品（按订单和收藏的时间衰减热度排序，热度数据不足时按评分补齐）"""
+        ranked = popularity_board.top(limit, canteen, category)
+        dishes = self.get_dishes_by_ids([dish_id for dish_id, _ in ranked])
+        scores = dict(ranked)
+        dishes = [dish.with_popularity(round(scores[dish.id], 2)) for dish in dishes]
+        
+        if len(dishes) < limit:
+            conditions = ["d.status = 'active'"]
+            params = []
+            if canteen:
+                conditions.append("m.canteen = %s")
+                params.append(canteen)
+            if category:
+                conditions.append("d.category = %s")
+                params.append(category)
+            if dishes:
+                conditions.append(f"d.id NOT IN ({', '.join(['%s'] * len(dishes))})")
+                params.extend(dish['id'] for dish in dishes)
+            
+            query = f"""
+                SELECT d.id
+                FROM dishes d
+                LEFT JOIN merchants m ON d.merchant_id = m.id
+                WHERE {' AND '.join(conditions)}
+                ORDER BY d.rating DESC, d.id DESC
+                LIMIT %s
+            """
+            params.append(limit - len(dishes))
+            extra_ids = [row['id'] for row in query_all(query, tuple(params))]
+            dishes.extend(dish.with_popularity(0.0) for dish in self.get_dishes_by_ids(extra_ids))
+        
+        return dishes
     
-    def get_random_dishes(self, limit: int = 5) -> List[Dict[str, Any]]:
-        """获取随机菜品"""
-        query = """
-            SELECT d.id, d.merchant_id, d.name, d.description, d.price, d.category, 
-                   d.taste, d.spice_level, d.image_url, d.is_available, d.stock_quantity, d.rating,
-                   m.store_name, m.canteen,
-                   COALESCE((
-                       SELECT waiting_time 
-                       FROM traffic_data 
-                       WHERE merchant_id = d.merchant_id 
-                       ORDER BY timestamp DESC 
-                       LIMIT 1
-                   ), 15) as wait_time
+    def get_random_dishes(self, limit: int = 5, canteen: str = None,
+                          category: str = None) -> List[Dict[str, Any]]:
+        """获取随机菜品（在内存ID中抽样，再批量查询抽中的菜品）"""
+        return self.get_dishes_by_ids(dish_sampler.sample(limit, canteen, category))
+    
+    def get_dishes_by_ids(self, dish_ids: List[int]) -> List[Dict[str, Any]]:
+        """按ID批量查询在售菜品（一次查询），保持传入顺序，跳过不存在或已下架的菜品"""
+        if not dish_ids:
+            return []
+        
+        placeholders = ", ".join(["%s"] * len(dish_ids))
+        query = f"""
+            SELECT {self.LIST_PROJECTION.columns}
             FROM dishes d
             LEFT JOIN merchants m ON d.merchant_id = m.id
-            WHERE d.status = 'active'
-            ORDER BY RAND()
-            LIMIT %s
+            LEFT JOIN merchant_live_status ls ON ls.merchant_id = d.merchant_id
+            WHERE d.id IN ({placeholders}) AND d.status = 'active'
         """
-        dishes = query_all(query, (limit,))
-        return [
-            {
-                "id": dish['id'],
-                "merchant_id": dish['merchant_id'],
-                "name": dish['name'],
-                "description": dish['description'],
-                "price": float(dish['price']),
-                "category": dish['category'],
-                "taste": dish['taste'],
-                "spice_level": dish['spice_level'],
-                "image_url": dish['image_url'],
-                "is_available": bool(dish['is_available']),
-                "stock_quantity": dish['stock_quantity'],
-                "rating": float(dish['rating']),
-                "store_name": dish['store_name'],
-                "merchant_name": dish['store_name'],
-                "canteen": dish['canteen'],
-                "wait_time": int(dish['wait_time']) if dish['wait_time'] else 15
-            }
-            for dish in dishes
-        ]
+        # 第一列为 d.id
+        rows = {row[0]: row for row in query_rows(query, tuple(dish_ids))}
+        return self.LIST_PROJECTION.decode(rows[dish_id] for dish_id in dish_ids if dish_id in rows)
 
 
 class OrderRepository:
     """订单数据访问层"""
     
+    ORDER_PROJECTION = Projection([
+        ("id", "o.id"),
+        ("user_id", "o.user_id"),
+        ("dish_id", "o.dish_id"),
+        ("quantity", "o.quantity"),
+        ("total_price", "o.total_price", float),
+        ("status", "o.status"),
+        ("special_instructions", "o.special_instructions"),
+        ("pickup_time", "o.pickup_time"),
+        ("created_at", "o.created_at"),
+        ("dish_name", "d.name"),
+        ("dish_price", "d.price", float),
+        ("image_url", "d.image_url"),
+        ("store_name", "m.store_name"),
+        ("canteen", "m.canteen"),
+    ])
+    
+    FAVORITE_PROJECTION = Projection([
+        ("id", "f.id"),
+        ("user_id", "f.user_id"),
+        ("dish_id", "f.dish_id"),
+        ("added_at", "f.added_at"),
+        ("dish_name", "d.name"),
+        ("description", "d.description"),
+        ("price", "d.price", float),
+        ("image_url", "d.image_url"),
+        ("category", "d.category"),
+        ("taste", "d.taste"),
+        ("store_name", "m.store_name"),
+        ("canteen", "m.canteen"),
+    ])
+    
     def create_order(self, order_data: Dict[str, Any]) -> Dict[str, Any]:
         """创建订单"""
         query = """
             INSERT INTO orders (user_id, dish_id, quantity, total_price, status, special_instructions, pickup_time)
             VALUES (%s, %s, %s, %s, 'pending', %s, %s)
         """
-        order_id = execute_insert(
-            query,
-            (
-                order_data['userId'],
-                order_data['dishId'],
-                order_data.get('quantity', 1),
-                order_data.get('totalPrice', 0),
-                order_data.get('specialInstructions', ''),
-                order_data.get('pickupTime', None)
+        with transaction.atomic():
+            order_id = execute_insert(
+                query,
+                (
+                    order_data['userId'],
+                    order_data['dishId'],
+                    order_data.get('quantity', 1),
+                    order_data.get('totalPrice', 0),
+                    order_data.get('specialInstructions', ''),
+                    order_data.get('pickupTime', None)
+                )
             )
-        )
+            if order_id:
+                user_profiles.record(
+                    order_data['userId'], 'order', order_id, order_data['dishId'], order_data.get('quantity', 1)
+                )
         
         if order_id:
+            popularity_board.record(
+                order_data['dishId'],
+                settings.POPULARITY.get('ORDER_WEIGHT', 1.0) * order_data.get('quantity', 1)
+            )
             return {
                 "id": order_id,
                 "user_id": order_data['userId'],
@@ -671,37 +901,15 @@ class OrderRepository:
     
     def get_user_orders(self, user_id: int) -> List[Dict[str, Any]]:
         """获取用户订单列表"""
-        query = """
-            SELECT o.id, o.user_id, o.dish_id, o.quantity, o.total_price, o.status, 
-                   o.special_instructions, o.pickup_time, o.created_at,
-                   d.name as dish_name, d.price as dish_price, d.image_url,
-                   m.store_name, m.canteen
+        query = f"""
+            SELECT {self.ORDER_PROJECTION.columns}
             FROM orders o
             LEFT JOIN dishes d ON o.dish_id = d.id
             LEFT JOIN merchants m ON d.merchant_id = m.id
             WHERE o.user_id = %s
             ORDER BY o.created_at DESC
         """
-        orders = query_all(query, (user_id,))
-        return [
-            {
-                "id": order['id'],
-                "user_id": order['user_id'],
-                "dish_id": order['dish_id'],
-                "quantity": order['quantity'],
-                "total_price": float(order['total_price']),
-                "status": order['status'],
-                "special_instructions": order['special_instructions'],
-                "pickup_time": order['pickup_time'],
-                "created_at": order['created_at'],
-                "dish_name": order['dish_name'],
-                "dish_price": float(order['dish_price']),
-                "image_url": order['image_url'],
-                "store_name": order['store_name'],
-                "canteen": order['canteen']
-            }
-            for order in orders
-        ]
+        return self.ORDER_PROJECTION.decode(query_rows(query, (user_id,)))
     
     def add_favorite(self, user_id: int, dish_id: int) -> Dict[str, Any]:
         """添加收藏"""
@@ -716,9 +924,13 @@ class OrderRepository:
             INSERT INTO favorites (user_id, dish_id)
             VALUES (%s, %s)
         """
-        favorite_id = execute_insert(query, (user_id, dish_id))
+        with transaction.atomic():
+            favorite_id = execute_insert(query, (user_id, dish_id))
+            if favorite_id:
+                user_profiles.record(user_id, 'favorite', favorite_id, dish_id)
         
         if favorite_id:
+            popularity_board.record(dish_id, settings.POPULARITY.get('FAVORITE_WEIGHT', 2.0))
             return {
                 "id": favorite_id,
                 "user_id": user_id,
@@ -728,37 +940,27 @@ class OrderRepository:
     
     def get_user_favorites(self, user_id: int) -> List[Dict[str, Any]]:
         """获取用户收藏列表"""
-        query = """
-            SELECT f.id, f.user_id, f.dish_id, f.added_at,
-                   d.name as dish_name, d.description, d.price, d.image_url, d.category, d.taste,
-                   m.store_name, m.canteen
+        query = f"""
+            SELECT {self.FAVORITE_PROJECTION.columns}
             FROM favorites f
             LEFT JOIN dishes d ON f.dish_id = d.id
             LEFT JOIN merchants m ON d.merchant_id = m.id
             WHERE f.user_id = %s AND d.status = 'active'
             ORDER BY f.added_at DESC
         """
-        favorites = query_all(query, (user_id,))
-        return [
-            {
-                "id": favorite['id'],
-                "user_id": favorite['user_id'],
-                "dish_id": favorite['dish_id'],
-                "added_at": favorite['added_at'],
-                "dish_name": favorite['dish_name'],
-                "description": favorite['description'],
-                "price": float(favorite['price']),
-                "image_url": favorite['image_url'],
-                "category": favorite['category'],
-                "taste": favorite['taste'],
-                "store_name": favorite['store_name'],
-                "canteen": favorite['canteen']
-            }
-            for favorite in favorites
-        ]
+        return self.FAVORITE_PROJECTION.decode(query_rows(query, (user_id,)))
     
     def remove_favorite(self, user_id: int, favorite_id: int) -> bool:
         """移除收藏"""
-        query = "DELETE FROM favorites WHERE id = %s AND user_id = %s"
-        affected = execute_update(query, (favorite_id, user_id))
+        # 先在主库锁定收藏记录，避免并发取消时重复扣减用户画像
+        with transaction.atomic(), use_primary():
+            favorite = query_one(
+                "SELECT id FROM favorites WHERE id = %s AND user_id = %s FOR UPDATE", (favorite_id, user_id)
+            )
+            if not favorite:
+                return False
+            query = "DELETE FROM favorites WHERE id = %s AND user_id = %s"
+            affected = execute_update(query, (favorite_id, user_id))
+            if affected > 0:
+                user_profiles.retract(user_id, 'favorite', favorite_id)
         return affected > 0
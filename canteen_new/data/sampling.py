@@ -0,0 +1,69 @@
+"""
+随机菜品抽样
+在内存中按（食堂, 分类）分组维护在售菜品ID，抽样只需 O(k)，
+再按抽中的ID批量查询菜品，避免 ORDER BY RAND() 对全表排序。
+"""
+import logging
+import random
+import threading
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from .database import query_all
+from .replication import use_primary
+from .versioning import version_counter, MENU_VERSION
+
+logger = logging.getLogger(__name__)
+
+
+class DishSampler:
+    """在售菜品ID抽样器，菜单版本变化时重新加载ID"""
+
+    def __init__(self):
+        # (食堂, 分类) -> 菜品ID列表，None 表示不限
+        self._groups: Dict[Tuple[Optional[str], Optional[str]], List[int]] = {}
+        self._menu_version: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _load(self) -> Dict[Tuple[Optional[str], Optional[str]], List[int]]:
+        rows = query_all("""
+            SELECT d.id, d.category, m.canteen
+            FROM dishes d
+            LEFT JOIN merchants m ON d.merchant_id = m.id
+            WHERE d.status = 'active'
+        """)
+        groups = defaultdict(list)
+        for row in rows:
+            canteen, category = row['canteen'], row['category']
+            for key in ((None, None), (canteen, None), (None, category), (canteen, category)):
+                groups[key].append(row['id'])
+        return dict(groups)
+
+    def _get_groups(self) -> Dict[Tuple[Optional[str], Optional[str]], List[int]]:
+        menu_version = version_counter.get(MENU_VERSION)
+        if menu_version != self._menu_version:
+            with self._lock, use_primary():
+                if menu_version != self._menu_version:
+                    self._groups = self._load()
+                    self._menu_version = menu_version
+                    logger.info(f"随机抽样ID已加载: {len(self._groups.get((None, None), []))} 个菜品")
+        return self._groups
+
+    def sample(self, limit: int, canteen: str = None, category: str = None) -> List[int]:
+        """
+        随机抽取菜品ID
+
+        Args:
+            limit: 抽取数量
+            canteen: 食堂筛选
+            category: 分类筛选
+
+        Returns:
+            不重复的菜品ID列表，数量不足时返回全部
+        """
+        ids = self._get_groups().get((canteen or None, category or None), [])
+        return random.sample(ids, min(limit, len(ids)))
+
+
+# 创建全局实例
+dish_sampler = DishSampler()
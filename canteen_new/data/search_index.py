@@ -0,0 +1,196 @@
+"""
+菜品全文检索索引
+对菜品名称和描述建立中文二元组（bigram）倒排索引，按 BM25 计算相关度。
+字母数字按整词和词的前缀索引，输入词的开头部分（如 "chick"）即可匹配完整的词。
+索引在进程内维护，菜单版本变化时重新构建（与菜品目录快照相同），不再依赖前置通配符的 LIKE 全表扫描。
+不按 updated_at 增量同步：updated_at 是语句执行时间而非提交时间，长事务中的修改可能早于已同步的水位而被漏掉。
+"""
+import logging
+import math
+import re
+import threading
+from collections import Counter, defaultdict
+from typing import Dict, Any, List, Optional
+
+from django.conf import settings
+
+from .database import query_all
+from .replication import use_primary
+from .versioning import version_counter, MENU_VERSION
+
+logger = logging.getLogger(__name__)
+
+# 连续的中日韩字符，或连续的字母数字
+_TOKEN_RUN = re.compile(r'[㐀-鿿豈-﫿]+|[a-z0-9]+')
+_CJK_CHAR = re.compile(r'[㐀-鿿豈-﫿]')
+
+# 各字段在相关度中的权重
+FIELD_WEIGHTS = {
+    'name': 2.0,
+    'description': 1.0,
+}
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# 字母数字词索引的最短前缀长度
+MIN_PREFIX_LENGTH = 2
+
+
+def tokenize(text: str, with_unigrams: bool = True, with_prefixes: bool = True) -> List[str]:
+    """
+    分词：中文按二元组切分，字母数字按整词切分
+
+    Args:
+        text: 待分词文本
+        with_unigrams: 是否同时输出中文单字（建索引时需要，以支持单字查询）
+        with_prefixes: 是否同时输出字母数字词的前缀（建索引时需要，以支持前缀查询）
+    """
+    tokens = []
+    for run in _TOKEN_RUN.findall((text or '').lower()):
+        if not _CJK_CHAR.match(run):
+            if with_prefixes:
+                tokens.extend(run[:i] for i in range(MIN_PREFIX_LENGTH, len(run)))
+            tokens.append(run)
+            continue
+        if with_unigrams or len(run) == 1:
+            tokens.extend(run)
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def tokenize_query(query: str) -> List[str]:
+    """查询分词：多字中文只使用二元组，字母数字词按输入匹配（索引中含前缀），去重"""
+    return list(dict.fromkeys(tokenize(query, with_unigrams=False, with_prefixes=False)))
+
+
+class _FieldIndex:
+    """单个字段的倒排索引"""
+
+    def __init__(self):
+        self.postings: Dict[str, Dict[int, int]] = defaultdict(dict)
+        self.lengths: Dict[int, int] = {}
+        self.total_length = 0
+
+    def add(self, dish_id: int, text: str) -> None:
+        tokens = tokenize(text)
+        for token, tf in Counter(tokens).items():
+            self.postings[token][dish_id] = tf
+        self.lengths[dish_id] = len(tokens)
+        self.total_length += len(tokens)
+
+    def remove(self, dish_id: int, text: str) -> None:
+        for token in set(tokenize(text)):
+            posting = self.postings.get(token)
+            if posting is not None:
+                posting.pop(dish_id, None)
+                if not posting:
+                    del self.postings[token]
+        self.total_length -= self.lengths.pop(dish_id, 0)
+
+    def score(self, token: str, doc_count: int, scores: Dict[int, float], weight: float) -> None:
+        """将该词在本字段上的 BM25 得分累加到 scores"""
+        posting = self.postings.get(token)
+        if not posting:
+            return
+        avgdl = self.total_length / doc_count if doc_count else 1.0
+        idf = math.log(1 + (doc_count - len(posting) + 0.5) / (len(posting) + 0.5))
+        for dish_id, tf in posting.items():
+            if dish_id not in scores:
+                continue
+            norm = 1 - BM25_B + BM25_B * self.lengths[dish_id] / (avgdl or 1.0)
+            scores[dish_id] += weight * idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * norm)
+
+
+class DishSearchIndex:
+    """菜品全文检索索引"""
+
+    def __init__(self):
+        self._fields = {field: _FieldIndex() for field in FIELD_WEIGHTS}
+        self._documents: Dict[int, Dict[str, str]] = {}
+        self._menu_version: Optional[int] = None
+        self._lock = threading.RLock()
+
+    def is_enabled(self) -> bool:
+        """检查索引是否启用"""
+        return settings.DISH_SEARCH.get('INDEX_ENABLED', False)
+
+    def _build(self, rows: List[Dict[str, Any]]) -> None:
+        """由在售菜品构建索引，构建完成后替换旧索引"""
+        fields = {field: _FieldIndex() for field in FIELD_WEIGHTS}
+        documents = {}
+        for row in rows:
+            document = {
+                'name': row['name'] or '',
+                'description': row['description'] or '',
+            }
+            for field, index in fields.items():
+                index.add(row['id'], document[field])
+            documents[row['id']] = document
+        self._fields = fields
+        self._documents = documents
+
+    def _sync(self) -> None:
+        """菜单版本变化时重新构建索引"""
+        menu_version = version_counter.get(MENU_VERSION)
+        if menu_version == self._menu_version:
+            return
+
+        # 按版本号重新构建时从主库读取，避免把副本上的旧数据标记为新版本
+        with use_primary():
+            rows = query_all("SELECT id, name, description FROM dishes WHERE status = 'active'")
+        self._build(rows)
+        logger.info(f"菜品全文索引已构建: {len(self._documents)} 个菜品 (menu v{menu_version})")
+        self._menu_version = menu_version
+
+    def _contains_runs(self, dish_id: int, runs: List[str]) -> bool:
+        """查询中每段连续的中文或字母数字都完整出现在名称或描述中（二元组分别出现不算匹配）"""
+        document = self._documents[dish_id]
+        texts = [document[field].lower() for field in FIELD_WEIGHTS]
+        return all(any(run in text for text in texts) for run in runs)
+
+    def search(self, query: str) -> Optional[Dict[int, float]]:
+        """
+        检索包含查询中每段连续文字的菜品（字母数字词可只输入开头部分）
+
+        Args:
+            query: 搜索关键词
+
+        Returns:
+            {菜品ID: BM25 相关度}；查询中没有可索引的词（或字母数字词短于最短前缀）时返回 None
+        """
+        tokens = tokenize_query(query)
+        if not tokens:
+            return None
+        if any(len(token) < MIN_PREFIX_LENGTH and not _CJK_CHAR.match(token) for token in tokens):
+            return None
+
+        with self._lock:
+            self._sync()
+
+            # 每个查询词至少要在某个字段中出现
+            candidates = None
+            for token in tokens:
+                matched = set()
+                for index in self._fields.values():
+                    matched.update(index.postings.get(token, ()))
+                candidates = matched if candidates is None else candidates & matched
+                if not candidates:
+                    return {}
+
+            # 倒排索引只保证每个二元组都出现，再确认查询文字连续出现（与 LIKE 的匹配语义一致）
+            runs = _TOKEN_RUN.findall(query.lower())
+            candidates = {dish_id for dish_id in candidates if self._contains_runs(dish_id, runs)}
+            if not candidates:
+                return {}
+
+            scores = {dish_id: 0.0 for dish_id in candidates}
+            doc_count = len(self._documents)
+            for token in tokens:
+                for field, index in self._fields.items():
+                    index.score(token, doc_count, scores, FIELD_WEIGHTS[field])
+            return scores
+
+
+# 创建全局实例
+dish_search_index = DishSearchIndex()
@@ -4,9 +4,90 @@
 """
 from typing import Dict, Any, Optional, List
 from .repositories import UserRepository, MerchantRepository, DishRepository, OrderRepository
+from .replication import use_primary
 from core.exceptions import ValidationException, AuthenticationException, BusinessException
 from core.security import hash_password, verify_password
 
+# 批量菜品操作单次请求的最大操作数
+BULK_DISH_MAX_OPERATIONS = 200
+
+# 菜品文本字段的最大长度（与 dishes 表定义一致）
+DISH_TEXT_LIMITS = {'name': 100, 'category': 50, 'taste': 50, 'image_url': 255}
+
+# 批量新建菜品时未提供字段的默认值
+DISH_CREATE_DEFAULTS = {
+    "description": "",
+    "spice_level": 0,
+    "image_url": "",
+    "is_available": True,
+    "stock_quantity": 0,
+}
+
+
+def crowd_level_label(avg_count: float) -> str:
+    """根据平均人数得到情景数据中使用的客流等级：低、中等、高"""
+    if avg_count > 30:
+        return "高"
+    elif avg_count > 15:
+        return "中等"
+    return "低"
+
+
+def parse_int(value: Any, field: str, minimum: int = None) -> int:
+    """转换整数字段，失败时抛出 ValueError"""
+    if isinstance(value, bool):
+        raise ValueError(f"{field}必须是整数")
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{field}必须是整数")
+    if minimum is not None and number < minimum:
+        raise ValueError(f"{field}不能小于{minimum}")
+    return number
+
+
+def parse_dish_fields(data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    校验并转换菜品的可写字段（只处理 data 中出现的字段）
+    
+    Raises:
+        ValueError: 字段值无效
+    """
+    fields = {}
+    for field in ('name', 'category', 'taste'):
+        if field in data:
+            value = str(data[field] or '').strip()
+            if not value:
+                raise ValueError(f"{field}不能为空")
+            fields[field] = value
+    for field in ('description', 'image_url'):
+        if field in data:
+            fields[field] = str(data[field] or '')
+    for field, limit in DISH_TEXT_LIMITS.items():
+        if field in fields and len(fields[field]) > limit:
+            raise ValueError(f"{field}不能超过{limit}个字符")
+    
+    if 'price' in data:
+        try:
+            price = round(float(data['price']), 2)
+        except (TypeError, ValueError):
+            raise ValueError("price必须是数字")
+        if price < 0:
+            raise ValueError("price不能为负数")
+        fields['price'] = price
+    if 'spice_level' in data:
+        fields['spice_level'] = parse_int(data['spice_level'], 'spice_level', 0)
+    if 'stock_quantity' in data:
+        fields['stock_quantity'] = parse_int(data['stock_quantity'], 'stock_quantity', 0)
+    if 'is_available' in data:
+        value = data['is_available']
+        if isinstance(value, str):
+            if value.lower() not in ('true', 'false', '1', '0'):
+                raise ValueError("is_available必须是布尔值")
+            value = value.lower() in ('true', '1')
+        fields['is_available'] = bool(value)
+    return fields
+
 
 class AuthService:
     """认证服务"""
@@ -187,7 +268,7 @@ class DishService:
         
         Args:
             query: 搜索关键词
-            filters: 筛选条件
+            filters: 筛选条件（pickup_time 为取餐时间时，为每个菜品填写预计等待时间）
             
         Returns:
             搜索结果和分页信息
@@ -198,6 +279,10 @@ class DishService:
         # 调用数据访问层进行搜索
         dishes, pagination = self.dish_repo.search_dishes(query, filters)
         
+        if filters.get('pickup_time'):
+            from .wait_forecast import wait_forecaster
+            wait_forecaster.annotate(dishes, filters['pickup_time'])
+        
         return {
             "dishes": dishes,
             "pagination": pagination
@@ -221,26 +306,35 @@ class DishService:
             "filters": criteria
         }
     
-    def get_popular_dishes(self) -> List[Dict[str, Any]]:
+    def get_popular_dishes(self, limit: int = 10, canteen: str = None,
+                           category: str = None) -> List[Dict[str, Any]]:
         """
         获取热门菜品
         
+        Args:
+            limit: 返回菜品数量，默认10个
+            canteen: 食堂筛选（可选）
+            category: 分类筛选（可选）
+        
         Returns:
-            热门菜品列表
+            热门菜品列表，按时间衰减热度降序
         """
-        return self.dish_repo.get_popular_dishes()
+        return self.dish_repo.get_popular_dishes(limit, canteen, category)
     
-    def get_random_dishes(self, limit: int = 5) -> List[Dict[str, Any]]:
+    def get_random_dishes(self, limit: int = 5, canteen: str = None,
+                          category: str = None) -> List[Dict[str, Any]]:
         """
         获取随机菜品
         
         Args:
             limit: 返回菜品数量，默认5个
+            canteen: 食堂筛选（可选）
+            category: 分类筛选（可选）
             
         Returns:
             随机菜品列表
         """
-        return self.dish_repo.get_random_dishes(limit)
+        return self.dish_repo.get_random_dishes(limit, canteen, category)
     
     def get_search_suggestions(self, query: str) -> List[str]:
         """
@@ -323,80 +417,14 @@ class DishService:
             user_id: 用户ID
             
         Returns:
-            收藏分析结果，包含类别偏好和口味偏好
-        """
-        from .repositories import OrderRepository
-        order_repo = OrderRepository()
-        
-        # 获取收藏列表
-        favorites = order_repo.get_user_favorites(user_id)
-        
-        # 分析收藏偏好
-        category_count = {}
-        taste_count = {}
-        
-        for favorite in favorites:
-            dish = self.dish_repo.get_dish_by_id(favorite['dish_id'])
-            if dish:
-                # 统计类别偏好
-                category = dish.get('category', '其他')
-                category_count[category] = category_count.get(category, 0) + 1
-                
-                # 统计口味偏好
-                taste = dish.get('taste', '咸')
-                taste_count[taste] = taste_count.get(taste, 0) + 1
-        
-        # 按频率排序
-        preferred_categories = sorted(category_count.keys(), 
-                                    key=lambda x: category_count[x], reverse=True)
-        preferred_tastes = sorted(taste_count.keys(), 
-                                 key=lambda x: taste_count[x], reverse=True)
-        
-        # 计算预算范围（基于收藏菜品价格）
-        prices = []
-        for favorite in favorites:
-            dish = self.dish_repo.get_dish_by_id(favorite['dish_id'])
-            if dish and dish.get('price'):
-                prices.append(dish['price'])
-        
-        if prices:
-            budget_range = [min(prices), max(prices)]
-        else:
-            budget_range = [15, 30]  # 默认预算范围
-        
-        return {
-            "preferred_categories": preferred_categories[:3],  # 取前3个
-            "preferred_tastes": preferred_tastes[:2],  # 取前2个
-            "budget_range": budget_range,
-            "spice_tolerance": self._infer_spice_tolerance(taste_count),
-            "favorite_dishes": [favorite['dish_name'] for favorite in favorites[:5]],  # 取前5个菜品名称
-            "total_favorites": len(favorites)
-        }
-    
-    def _infer_spice_tolerance(self, taste_count: Dict[str, int]) -> str:
-        """
-        根据口味偏好推断辣度耐受度
-        
-        Args:
-            taste_count: 口味统计
-            
-        Returns:
-            辣度耐受度描述
+            收藏分析结果，包含类别偏好和口味偏好（由按增量维护的用户画像得到，见 data.user_profiles）
         """
-        spicy_count = taste_count.get('辣', 0)
-        total_count = sum(taste_count.values())
-        
-        if total_count == 0:
-            return "中等"
-        
-        spicy_ratio = spicy_count / total_count
+        from .user_profiles import user_profiles, build_favorites_summary
         
-        if spicy_ratio > 0.7:
-            return "高"
-        elif spicy_ratio > 0.3:
-            return "中等"
-        else:
-            return "低"
+        profile = user_profiles.get(user_id)
+        if not profile['exists']:
+            return build_favorites_summary({}, [])
+        return profile['favorites_summary']
     
     def get_crowd_statistics(self, date: str = None, hour: int = None) -> Dict[str, Any]:
         """
@@ -417,30 +445,21 @@ class DishService:
             if hour is None:
                 hour = datetime.datetime.now().hour
             
-            # 从数据库获取客流数据
-            # 这里简化处理，实际项目中应该从客流记录表中查询
+            # 从最近窗口的客流汇总获取全部商家的统计
             from .repositories import MerchantRepository
             merchant_repo = MerchantRepository()
             
-            # 获取指定日期和小时的客流数据
-            traffic_data = merchant_repo.get_traffic_statistics()
+            traffic_data = merchant_repo.get_traffic_statistics()['overall']
             
-            if traffic_data:
+            if traffic_data['samples']:
                 # 计算平均等待时间和客流等级
-                avg_wait_time = traffic_data.get('avg_waiting_time', 15)
-                avg_count = traffic_data.get('avg_count', 10)
-                
-                # 根据平均人数确定客流等级
-                if avg_count > 30:
-                    crowd_level = "高"
-                elif avg_count > 15:
-                    crowd_level = "中等"
-                else:
-                    crowd_level = "低"
+                avg_wait_time = traffic_data['avg_waiting_time']
+                avg_count = traffic_data['avg_count']
                 
                 return {
-                    "crowd_level": crowd_level,
+                    "crowd_level": crowd_level_label(avg_count),
                     "avg_wait_time": avg_wait_time,
+                    "trend": traffic_data['trend'],
                     "peak_hours": [11, 12, 13, 17, 18, 19]
                 }
             else:
@@ -602,6 +621,120 @@ class MerchantService:
         else:
             raise ValidationException(f"不支持的操作类型: {action}")
     
+    def bulk_manage_dishes_service(self, merchant_id: int, operations: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        批量管理菜品
+        
+        先校验全部操作（字段、菜品归属、名称冲突），全部通过后在一个事务中写入，
+        菜单缓存只失效一次。
+        
+        Args:
+            merchant_id: 商家ID
+            operations: 操作列表，每项为 {"op": "create"|"update"|"delete", "id": 菜品ID, ...菜品字段}
+            
+        Returns:
+            新建、更新和删除的菜品
+            
+        Raises:
+            ValidationException: 任一操作校验失败（错误信息包含所有失败项）
+        """
+        if not merchant_id:
+            raise ValidationException("商家ID不能为空")
+        try:
+            merchant_id = parse_int(merchant_id, 'merchant_id')
+        except ValueError as e:
+            raise ValidationException(str(e))
+        if not isinstance(operations, list) or not operations:
+            raise ValidationException("operations不能为空")
+        if len(operations) > BULK_DISH_MAX_OPERATIONS:
+            raise ValidationException(f"单次最多提交{BULK_DISH_MAX_OPERATIONS}个操作")
+        
+        # 名称冲突按主库中的当前菜单校验，副本延迟时校验通过的请求仍可能在写入时冲突
+        with use_primary():
+            current = {dish['id']: dish for dish in self.dish_repo.get_dishes_by_merchant(merchant_id)}
+        rows: List[Dict[str, Any]] = []
+        delete_ids: List[int] = []
+        seen_ids = set()
+        errors = []
+        
+        for index, operation in enumerate(operations, start=1):
+            try:
+                if not isinstance(operation, dict):
+                    raise ValueError("操作必须是对象")
+                action = operation.get('op')
+                
+                if action == 'create':
+                    fields = parse_dish_fields(operation)
+                    missing = [field for field in ('name', 'price', 'category', 'taste') if field not in fields]
+                    if missing:
+                        raise ValueError(f"{', '.join(missing)}不能为空")
+                    rows.append({**DISH_CREATE_DEFAULTS, **fields, "id": None, "merchant_id": merchant_id})
+                
+                elif action in ('update', 'delete'):
+                    dish_id = parse_int(operation.get('id'), 'id')
+                    if dish_id not in current:
+                        raise ValueError(f"菜品{dish_id}不存在或不属于该商家")
+                    if dish_id in seen_ids:
+                        raise ValueError(f"菜品{dish_id}在本次请求中重复出现")
+                    seen_ids.add(dish_id)
+                    
+                    if action == 'delete':
+                        delete_ids.append(dish_id)
+                    else:
+                        fields = parse_dish_fields(operation)
+                        if not fields:
+                            raise ValueError("没有需要更新的字段")
+                        rows.append({**current[dish_id], **fields})
+                
+                else:
+                    raise ValueError(f"不支持的操作类型: {action}")
+            except ValueError as e:
+                errors.append(f"第{index}项: {e}")
+        
+        if not errors:
+            errors = self._check_dish_names(current, rows, delete_ids)
+        if errors:
+            raise ValidationException("；".join(errors))
+        
+        created_ids = self.dish_repo.bulk_apply(merchant_id, rows, delete_ids)
+        return {
+            "created": [
+                {"id": created_ids.get(row['name']), "name": row['name'], "price": row['price']}
+                for row in rows if row['id'] is None
+            ],
+            "updated": [row['id'] for row in rows if row['id'] is not None],
+            "deleted": delete_ids
+        }
+    
+    @staticmethod
+    def _check_dish_names(current: Dict[int, Dict[str, Any]], rows: List[Dict[str, Any]],
+                          delete_ids: List[int]) -> List[str]:
+        """
+        检查写入后商家的在售菜品名称不重复
+        
+        名称比较不区分大小写（与数据库排序规则一致）。不允许使用本次未删除的其他菜品的当前名称：
+        批量写入逐行更新，互换名称或依次改名时中间状态会违反唯一约束，需要分两次提交。
+        """
+        deleted = set(delete_ids)
+        owners = {dish['name'].casefold(): dish_id for dish_id, dish in current.items() if dish_id not in deleted}
+        renamed = {
+            row['id'] for row in rows
+            if row['id'] is not None and row['name'].casefold() != current[row['id']]['name'].casefold()
+        }
+        errors = []
+        batch_names = set()
+        for row in rows:
+            key = row['name'].casefold()
+            owner = owners.get(key, row['id'])
+            if key in batch_names:
+                errors.append(f"菜品名称“{row['name']}”在本次请求中重复")
+            elif owner != row['id'] and owner in renamed:
+                errors.append(f"菜品名称“{row['name']}”是菜品{owner}的当前名称，互换或依次改名需要分两次提交")
+            elif owner != row['id']:
+                errors.append(f"菜品名称“{row['name']}”已被其他菜品使用")
+            batch_names.add(key)
+        return errors
+    
     def report_traffic_service(self, merchant_id: int, traffic_data: Dict[str, Any]) -> Dict[str, Any]:
         """
         客流量上报服务
@@ -628,10 +761,20 @@ class MerchantService:
         # 添加商家ID
         traffic_data['merchantId'] = merchant_id
         
-        # 如果没有提供时间戳，使用当前时间
-        if not traffic_data.get('timestamp'):
-            from datetime import datetime
-            traffic_data['timestamp'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        # 如果没有提供时间戳，使用当前时间；提供的时间戳统一转换为本地时间
+        from datetime import datetime
+        timestamp = traffic_data.get('timestamp')
+        if not timestamp:
+            timestamp = datetime.now()
+        elif not isinstance(timestamp, datetime):
+            try:
+                timestamp = datetime.fromisoformat(str(timestamp).replace('Z', '+00:00'))
+            except ValueError:
+                raise ValidationException("时间戳格式无效")
+        if timestamp.tzinfo is not None:
+            from django.utils import timezone
+            timestamp = timezone.localtime(timestamp).replace(tzinfo=None)
+        traffic_data['timestamp'] = timestamp.replace(microsecond=0)
         
         # 记录客流量
         traffic_record = self.merchant_repo.record_traffic(traffic_data)
@@ -641,7 +784,7 @@ class MerchantService:
                 "trafficId": traffic_record['id'],
                 "currentTraffic": traffic_record['count'],
                 "avgWaitTime": traffic_record['waitingTime'],
-                "updatedAt": traffic_record['timestamp']
+                "updatedAt": traffic_record['timestamp'].strftime('%Y-%m-%d %H:%M:%S')
             }
         else:
             raise BusinessException("客流量上报失败")
@@ -0,0 +1,204 @@
+"""
+搜索建议索引
+在内存中维护菜品名称的前缀树（含拼音全拼和首字母）与单字/二元组子串索引，
+按订单数和收藏数排序，输入联想请求不再访问数据库。
+"""
+import logging
+import threading
+import time
+from collections import defaultdict
+from functools import lru_cache
+from typing import Dict, Any, List, Optional, Set
+
+from django.conf import settings
+
+from .database import query_all, db_connection_scope
+from .replication import use_primary
+from .versioning import version_counter, MENU_VERSION
+
+logger = logging.getLogger(__name__)
+
+SUGGESTION_LIMIT = 10
+
+
+class _TrieNode:
+    """前缀树节点，top 保存经过该节点的排名最高的建议"""
+    __slots__ = ('children', 'top')
+
+    def __init__(self):
+        self.children: Dict[str, '_TrieNode'] = {}
+        self.top: List[int] = []
+
+
+@lru_cache(maxsize=None)
+def _get_lazy_pinyin():
+    """拼音库导入需要数百毫秒，首次构建建议索引时才导入"""
+    try:
+        from pypinyin import lazy_pinyin
+    except ImportError:  # pragma: no cover - pypinyin 为可选依赖，缺失时不支持拼音联想
+        return None
+    return lazy_pinyin
+
+
+def pinyin_keys(name: str) -> List[str]:
+    """生成菜品名称的拼音全拼和首字母，例如 麻辣香锅 -> malaxiangguo, mlxg"""
+    lazy_pinyin = _get_lazy_pinyin()
+    if lazy_pinyin is None:
+        return []
+    syllables = [s.lower() for s in lazy_pinyin(name) if s.strip()]
+    if not syllables:
+        return []
+    return [''.join(syllables), ''.join(s[0] for s in syllables)]
+
+
+class _SuggestionSnapshot:
+    """某一时刻的建议索引（只读）"""
+
+    def __init__(self, entries: List[Dict[str, Any]], limit: int):
+        # 按热度降序、名称升序排列，插入顺序即排名
+        entries.sort(key=lambda e: (-e['popularity'], e['name']))
+        self.names = [entry['name'] for entry in entries]
+        self.lowered = [name.lower() for name in self.names]
+        self.limit = limit
+        self.root = _TrieNode()
+        self.grams: Dict[str, Set[int]] = defaultdict(set)
+
+        for rank, name in enumerate(self.lowered):
+            for key in [name] + pinyin_keys(self.names[rank]):
+                self._insert(key, rank)
+            for i, char in enumerate(name):
+                self.grams[char].add(rank)
+                self.grams[name[i:i + 2]].add(rank)
+
+    def _insert(self, key: str, rank: int) -> None:
+        node = self.root
+        for char in key:
+            node = node.children.setdefault(char, _TrieNode())
+            if len(node.top) < self.limit and rank not in node.top:
+                node.top.append(rank)
+
+    def _prefix(self, query: str) -> List[int]:
+        node = self.root
+        for char in query:
+            node = node.children.get(char)
+            if node is None:
+                return []
+        return node.top
+
+    def _infix(self, query: str) -> List[int]:
+        if len(query) == 1:
+            return sorted(self.grams.get(query, ()))
+        candidates = None
+        for i in range(len(query) - 1):
+            posting = self.grams.get(query[i:i + 2])
+            if not posting:
+                return []
+            candidates = set(posting) if candidates is None else candidates & posting
+        return sorted(rank for rank in candidates if query in self.lowered[rank])
+
+    def suggest(self, query: str) -> List[str]:
+        """前缀匹配（含拼音）优先，其次是名称中间的子串匹配"""
+        query = query.strip().lower()
+        if not query:
+            return []
+        ranks = list(self._prefix(query))
+        if len(ranks) < self.limit:
+            for rank in self._infix(query):
+                if rank not in ranks:
+                    ranks.append(rank)
+                    if len(ranks) >= self.limit:
+                        break
+        return [self.names[rank] for rank in ranks[:self.limit]]
+
+
+class SuggestionIndex:
+    """搜索建议索引，菜单变化或热度过期时在后台线程重建"""
+
+    def __init__(self):
+        self._snapshot: Optional[_SuggestionSnapshot] = None
+        self._menu_version: Optional[int] = None
+        self._built_at = 0.0
+        self._rebuilding = False
+        self._lock = threading.Lock()
+
+    def is_enabled(self) -> bool:
+        """检查建议索引是否启用"""
+        return settings.DISH_SEARCH.get('SUGGEST_ENABLED', False)
+
+    def _load_entries(self) -> List[Dict[str, Any]]:
+        """加载在售菜品名称及其热度（订单数 + 收藏数）"""
+        query = """
+            SELECT d.name,
+                   COALESCE(SUM(o.order_count), 0) + COALESCE(SUM(f.favorite_count), 0) AS popularity
+            FROM dishes d
+            LEFT JOIN (
+                SELECT dish_id, COUNT(*) AS order_count FROM orders GROUP BY dish_id
+            ) o ON o.dish_id = d.id
+            LEFT JOIN (
+                SELECT dish_id, COUNT(*) AS favorite_count FROM favorites GROUP BY dish_id
+            ) f ON f.dish_id = d.id
+            WHERE d.status = 'active'
+            GROUP BY d.name
+        """
+        return [
+            {"name": row['name'], "popularity": int(row['popularity'])}
+            for row in query_all(query)
+        ]
+
+    def _rebuild(self, menu_version: int, background: bool = False) -> None:
+        try:
+            if background:
+                # 后台线程结束前关闭它的数据库连接，归还连接池
+                with db_connection_scope(release=True), use_primary():
+                    entries = self._load_entries()
+            else:
+                with use_primary():
+                    entries = self._load_entries()
+            snapshot = _SuggestionSnapshot(entries, SUGGESTION_LIMIT)
+            with self._lock:
+                self._snapshot = snapshot
+                self._menu_version = menu_version
+                self._built_at = time.monotonic()
+            logger.info(f"搜索建议索引已重建: {len(snapshot.names)} 个菜品名称")
+        except Exception as e:
+            logger.warning(f"搜索建议索引重建失败: {e}")
+        finally:
+            self._rebuilding = False
+
+    def _get_snapshot(self) -> Optional[_SuggestionSnapshot]:
+        """获取索引；已有索引过期时在后台重建，请求继续使用旧索引"""
+        menu_version = version_counter.get(MENU_VERSION)
+        refresh_interval = settings.DISH_SEARCH.get('SUGGEST_REFRESH_INTERVAL', 300)
+
+        if self._snapshot is None:
+            self._rebuild(menu_version)
+            return self._snapshot
+
+        stale = (menu_version != self._menu_version
+                 or time.monotonic() - self._built_at > refresh_interval)
+        if stale:
+            with self._lock:
+                start = not self._rebuilding
+                self._rebuilding = True
+            if start:
+                threading.Thread(target=self._rebuild, args=(menu_version, True), daemon=True).start()
+        return self._snapshot
+
+    def suggest(self, query: str) -> Optional[List[str]]:
+        """
+        获取搜索建议
+
+        Args:
+            query: 用户输入
+
+        Returns:
+            建议列表；索引不可用时返回 None
+        """
+        snapshot = self._get_snapshot()
+        if snapshot is None:
+            return None
+        return snapshot.suggest(query)
+
+
+# 创建全局实例
+suggestion_index = SuggestionIndex()
@@ -0,0 +1,248 @@
+"""
+客流量时间序列汇总
+商家每次上报客流量时，在同一事务中增量更新分钟、小时、天三个粒度的汇总表：
+上报次数、人数之和与最大值、等待时间之和与最大值，以及等待时间的固定分箱直方图
+（用于估算 p50/p95，分箱计数可以直接相加，因此支持增量更新）。
+分析类查询读取汇总表；原始上报和过期的细粒度汇总按保留策略分小批删除。
+"""
+import bisect
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Sequence
+
+from django.conf import settings
+
+from .database import query_all, execute_update
+
+logger = logging.getLogger(__name__)
+
+# 等待时间分箱上界（分钟），最后一箱为超过 120 分钟
+WAIT_BIN_BOUNDS = (1, 2, 3, 4, 5, 6, 8, 10, 12, 15, 20, 25, 30, 40, 50, 60, 90, 120)
+WAIT_BIN_COUNT = len(WAIT_BIN_BOUNDS) + 1
+WAIT_BIN_COLUMNS = tuple(f"wait_h{i}" for i in range(WAIT_BIN_COUNT))
+
+# 粒度 -> 汇总表
+ROLLUP_TABLES = {
+    'minute': 'traffic_rollup_minute',
+    'hour': 'traffic_rollup_hour',
+    'day': 'traffic_rollup_day',
+}
+
+
+def bucket_start(timestamp: datetime, granularity: str) -> datetime:
+    """计算时间点所在汇总桶的起始时间"""
+    if granularity == 'minute':
+        return timestamp.replace(second=0, microsecond=0)
+    if granularity == 'hour':
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def wait_bin(waiting_time: float) -> int:
+    """等待时间所在的分箱序号"""
+    return bisect.bisect_left(WAIT_BIN_BOUNDS, waiting_time)
+
+
+def wait_percentile(histogram: Sequence[int], q: float) -> Optional[float]:
+    """
+    根据分箱直方图估算等待时间分位数（在分箱内线性插值）
+
+    Args:
+        histogram: 各分箱计数
+        q: 分位点，0~1
+
+    Returns:
+        分位数估计值（分钟），没有样本时为 None
+    """
+    total = sum(histogram)
+    if total == 0:
+        return None
+
+    target = q * total
+    cumulative = 0
+    for index, count in enumerate(histogram):
+        if count and cumulative + count >= target:
+            lower = WAIT_BIN_BOUNDS[index - 1] if index > 0 else 0
+            if index == len(WAIT_BIN_BOUNDS):
+                return float(lower)
+            upper = WAIT_BIN_BOUNDS[index]
+            return round(lower + (upper - lower) * (target - cumulative) / count, 1)
+        cumulative += count
+    return float(WAIT_BIN_BOUNDS[-1])
+
+
+def create_rollup_table_sql(table: str) -> str:
+    """汇总表建表语句"""
+    bins = ",\n".join(f"    {column} INT NOT NULL DEFAULT 0" for column in WAIT_BIN_COLUMNS)
+    return f"""
+        CREATE TABLE IF NOT EXISTS {table} (
+            merchant_id INT NOT NULL,
+            bucket_start DATETIME NOT NULL,
+            samples INT NOT NULL DEFAULT 0,
+            count_sum BIGINT NOT NULL DEFAULT 0,
+            count_max INT NOT NULL DEFAULT 0,
+            wait_sum DOUBLE NOT NULL DEFAULT 0,
+            wait_max DOUBLE NOT NULL DEFAULT 0,
+        {bins},
+            PRIMARY KEY (merchant_id, bucket_start),
+            INDEX idx_bucket_start (bucket_start),
+            FOREIGN KEY (merchant_id) REFERENCES merchants(id) ON DELETE CASCADE
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+    """
+
+
+def backfill_rollup_sql(table: str, granularity: str) -> str:
+    """根据 traffic_data 中已有的原始上报回填汇总表"""
+    bucket = {
+        'minute': "DATE_FORMAT(timestamp, '%%Y-%%m-%%d %%H:%%i:00')",
+        'hour': "DATE_FORMAT(timestamp, '%%Y-%%m-%%d %%H:00:00')",
+        'day': "DATE(timestamp)",
+    }[granularity]
+    conditions = []
+    lower = None
+    for upper in WAIT_BIN_BOUNDS:
+        conditions.append(f"waiting_time <= {upper}" if lower is None
+                          else f"waiting_time > {lower} AND waiting_time <= {upper}")
+        lower = upper
+    conditions.append(f"waiting_time > {lower}")
+    bins = ", ".join(f"SUM({condition})" for condition in conditions)
+    return f"""
+        INSERT IGNORE INTO {table}
+            (merchant_id, bucket_start, samples, count_sum, count_max, wait_sum, wait_max, {', '.join(WAIT_BIN_COLUMNS)})
+        SELECT merchant_id, {bucket}, COUNT(*), SUM(count), MAX(count), SUM(waiting_time), MAX(waiting_time), {bins}
+        FROM traffic_data
+        GROUP BY merchant_id, {bucket}
+    """
+
+
+class TrafficRollups:
+    """客流量汇总的写入、查询与保留策略"""
+
+    def __init__(self):
+        columns = ("merchant_id", "bucket_start", "samples", "count_sum", "count_max",
+                   "wait_sum", "wait_max") + WAIT_BIN_COLUMNS
+        updates = [
+            "samples = samples + VALUES(samples)",
+            "count_sum = count_sum + VALUES(count_sum)",
+            "count_max = GREATEST(count_max, VALUES(count_max))",
+            "wait_sum = wait_sum + VALUES(wait_sum)",
+            "wait_max = GREATEST(wait_max, VALUES(wait_max))",
+        ] + [f"{column} = {column} + VALUES({column})" for column in WAIT_BIN_COLUMNS]
+        self._upsert_sql = {
+            granularity: (
+                f"INSERT INTO {table} ({', '.join(columns)}) "
+                f"VALUES ({', '.join(['%s'] * len(columns))}) "
+                f"ON DUPLICATE KEY UPDATE {', '.join(updates)}"
+            )
+            for granularity, table in ROLLUP_TABLES.items()
+        }
+
+    def record(self, merchant_id: int, count: int, waiting_time: float, timestamp: datetime) -> None:
+        """
+        将一次上报计入三个粒度的汇总（调用方负责事务，与原始上报在同一事务中写入）
+
+        Args:
+            merchant_id: 商家ID
+            count: 客流人数
+            waiting_time: 等待时间（分钟）
+            timestamp: 上报时间
+        """
+        histogram = [0] * WAIT_BIN_COUNT
+        histogram[wait_bin(waiting_time)] = 1
+        for granularity, query in self._upsert_sql.items():
+            execute_update(
+                query,
+                (merchant_id, bucket_start(timestamp, granularity), 1, count, count,
+                 waiting_time, waiting_time, *histogram)
+            )
+
+    def query(self, granularity: str, start: datetime, end: datetime = None,
+              merchant_ids: List[int] = None) -> List[Dict[str, Any]]:
+        """
+        查询汇总数据
+
+        Args:
+            granularity: minute、hour 或 day
+            start: 起始时间（含）
+            end: 结束时间（不含），默认不限
+            merchant_ids: 商家ID列表，默认全部商家
+
+        Returns:
+            按商家、时间排序的汇总记录，含人数均值/最大值和等待时间均值/最大值/p50/p95
+        """
+        conditions = ["bucket_start >= %s"]
+        params: List[Any] = [start]
+        if end is not None:
+            conditions.append("bucket_start < %s")
+            params.append(end)
+        if merchant_ids:
+            conditions.append(f"merchant_id IN ({', '.join(['%s'] * len(merchant_ids))})")
+            params.extend(merchant_ids)
+
+        rows = query_all(
+            f"""
+            SELECT merchant_id, bucket_start, samples, count_sum, count_max, wait_sum, wait_max,
+                   {', '.join(WAIT_BIN_COLUMNS)}
+            FROM {ROLLUP_TABLES[granularity]}
+            WHERE {' AND '.join(conditions)}
+            ORDER BY merchant_id, bucket_start
+            """,
+            tuple(params)
+        )
+        return [self.decode(row) for row in rows]
+
+    @staticmethod
+    def decode(row: Dict[str, Any]) -> Dict[str, Any]:
+        """将汇总行转换为统计值"""
+        samples = row['samples'] or 0
+        histogram = [row[column] for column in WAIT_BIN_COLUMNS]
+        return {
+            "merchant_id": row['merchant_id'],
+            "bucket_start": row['bucket_start'],
+            "samples": samples,
+            "avg_count": round(float(row['count_sum']) / samples, 1) if samples else 0.0,
+            "max_count": row['count_max'],
+            "avg_wait_time": round(float(row['wait_sum']) / samples, 1) if samples else 0.0,
+            "max_wait_time": float(row['wait_max']),
+            "wait_p50": wait_percentile(histogram, 0.5),
+            "wait_p95": wait_percentile(histogram, 0.95),
+        }
+
+    def prune(self) -> Dict[str, int]:
+        """
+        按保留策略分小批删除过期的原始上报和汇总数据，避免长时间锁表
+
+        Returns:
+            各表删除的行数
+        """
+        config = settings.TRAFFIC_RETENTION
+        batch_size = config.get('BATCH_SIZE', 1000)
+        pause = config.get('BATCH_PAUSE', 0.05)
+        targets = [
+            ('traffic_data', 'timestamp', config.get('RAW_DAYS')),
+            (ROLLUP_TABLES['minute'], 'bucket_start', config.get('MINUTE_DAYS')),
+            (ROLLUP_TABLES['hour'], 'bucket_start', config.get('HOUR_DAYS')),
+            (ROLLUP_TABLES['day'], 'bucket_start', config.get('DAY_DAYS')),
+        ]
+
+        removed = {}
+        for table, column, days in targets:
+            removed[table] = 0
+            if not days:
+                continue
+            cutoff = datetime.now() - timedelta(days=days)
+            while True:
+                affected = execute_update(
+                    f"DELETE FROM {table} WHERE {column} < %s LIMIT %s", (cutoff, batch_size)
+                )
+                removed[table] += affected
+                if affected < batch_size:
+                    break
+                time.sleep(pause)
+            logger.info(f"{table} 删除 {days} 天前的数据 {removed[table]} 行")
+        return removed
+
+
+# 创建全局实例
+traffic_rollups = TrafficRollups()
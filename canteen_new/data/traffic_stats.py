@@ -0,0 +1,163 @@
+"""
+客流量统计
+基于分钟汇总表（traffic_rollup_minute）计算每个商家和每个食堂最近 N 分钟的客流统计：
+平均人数、平均等待时间、与上一个等长窗口相比的趋势，以及当前人流量等级。
+所有商家的统计由一条分组查询得到，结果按较短的有效期缓存。
+"""
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .database import query_all
+from .repositories import get_crowd_level
+from .traffic_rollups import ROLLUP_TABLES
+
+
+class TrafficStatistics:
+    """窗口化客流统计"""
+
+    def _query(self, window_minutes: int) -> List[Dict[str, Any]]:
+        """一次分组查询所有商家当前窗口和上一个窗口的汇总，以及最新上报"""
+        now = datetime.now()
+        current_start = now - timedelta(minutes=window_minutes)
+        previous_start = current_start - timedelta(minutes=window_minutes)
+        return query_all(
+            f"""
+            SELECT r.merchant_id, m.store_name, m.canteen,
+                   SUM(IF(r.bucket_start >= %s, r.samples, 0)) AS samples,
+                   SUM(IF(r.bucket_start >= %s, r.count_sum, 0)) AS count_sum,
+                   MAX(IF(r.bucket_start >= %s, r.count_max, NULL)) AS count_max,
+                   SUM(IF(r.bucket_start >= %s, r.wait_sum, 0)) AS wait_sum,
+                   SUM(IF(r.bucket_start < %s, r.samples, 0)) AS previous_samples,
+                   SUM(IF(r.bucket_start < %s, r.count_sum, 0)) AS previous_count_sum,
+                   MAX(ls.count) AS latest_count,
+                   MAX(ls.reported_at) AS latest_reported_at
+            FROM {ROLLUP_TABLES['minute']} r
+            JOIN merchants m ON m.id = r.merchant_id
+            LEFT JOIN merchant_live_status ls ON ls.merchant_id = r.merchant_id
+            WHERE r.bucket_start >= %s
+            GROUP BY r.merchant_id, m.store_name, m.canteen
+            """,
+            (current_start, current_start, current_start, current_start, current_start, current_start,
+             previous_start)
+        )
+
+    @staticmethod
+    def _summarize(samples: int, count_sum: float, wait_sum: float, previous_samples: int,
+                   previous_count_sum: float, threshold: float) -> Dict[str, Any]:
+        """计算窗口均值和趋势"""
+        avg_count = count_sum / samples if samples else 0.0
+        previous_avg = previous_count_sum / previous_samples if previous_samples else None
+        if not samples or previous_avg is None:
+            trend = 'unknown'
+        elif avg_count > previous_avg * (1 + threshold):
+            trend = 'rising'
+        elif avg_count < previous_avg * (1 - threshold):
+            trend = 'falling'
+        else:
+            trend = 'stable'
+        return {
+            "samples": samples,
+            "avg_count": round(avg_count, 1),
+            "avg_waiting_time": round(wait_sum / samples, 1) if samples else None,
+            "previous_avg_count": round(previous_avg, 1) if previous_avg is not None else None,
+            "trend": trend,
+        }
+
+    def _compute(self, window_minutes: int) -> Dict[str, Any]:
+        """按商家、食堂和全部商家计算统计（食堂和全局按上报次数加权）"""
+        threshold = settings.TRAFFIC_STATS.get('TREND_THRESHOLD', 0.15)
+        window_start = datetime.now() - timedelta(minutes=window_minutes)
+
+        merchants = []
+        canteens: Dict[str, Dict[str, float]] = {}
+        overall = dict.fromkeys(('samples', 'count_sum', 'wait_sum', 'previous_samples', 'previous_count_sum'), 0)
+
+        for row in self._query(window_minutes):
+            totals = {
+                "samples": int(row['samples'] or 0),
+                "count_sum": float(row['count_sum'] or 0),
+                "wait_sum": float(row['wait_sum'] or 0),
+                "previous_samples": int(row['previous_samples'] or 0),
+                "previous_count_sum": float(row['previous_count_sum'] or 0),
+            }
+            stats = self._summarize(**totals, threshold=threshold)
+
+            # 窗口内有最新上报时以其为当前人流量，否则用窗口均值
+            reported_at = row['latest_reported_at']
+            if row['latest_count'] is not None and reported_at is not None and reported_at >= window_start:
+                current_count = int(row['latest_count'])
+            else:
+                current_count = stats['avg_count']
+            merchants.append({
+                "merchant_id": row['merchant_id'],
+                "store_name": row['store_name'],
+                "canteen": row['canteen'],
+                **stats,
+                "max_count": row['count_max'],
+                "current_count": current_count,
+                "crowd_level": get_crowd_level(current_count) if stats['samples'] else None,
+            })
+
+            group = canteens.setdefault(row['canteen'], dict.fromkeys(overall, 0))
+            for key, value in totals.items():
+                group[key] += value
+                overall[key] += value
+
+        canteen_stats = []
+        for canteen, totals in canteens.items():
+            stats = self._summarize(**totals, threshold=threshold)
+            stats['crowd_level'] = get_crowd_level(stats['avg_count']) if stats['samples'] else None
+            canteen_stats.append({"canteen": canteen, **stats})
+
+        overall_stats = self._summarize(**overall, threshold=threshold)
+        overall_stats['crowd_level'] = get_crowd_level(overall_stats['avg_count']) if overall_stats['samples'] else None
+
+        return {
+            "window_minutes": window_minutes,
+            "generated_at": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            "merchants": merchants,
+            "canteens": canteen_stats,
+            "overall": overall_stats,
+        }
+
+    def get(self, window_minutes: int = None, canteen: str = None,
+            merchant_id: int = None) -> Dict[str, Any]:
+        """
+        获取客流统计（按窗口长度缓存，筛选在缓存结果上进行）
+
+        Args:
+            window_minutes: 统计窗口（分钟），默认 TRAFFIC_STATS['WINDOW_MINUTES']
+            canteen: 只返回该食堂的商家和食堂统计
+            merchant_id: 只返回该商家的统计
+
+        Returns:
+            {window_minutes, generated_at, merchants, canteens, overall}；
+            趋势为 rising/falling/stable/unknown，人流量等级为 low/medium/high（无数据时为 None）
+        """
+        config = settings.TRAFFIC_STATS
+        window_minutes = int(window_minutes or config.get('WINDOW_MINUTES', 15))
+        cache_key = f"traffic_stats:{window_minutes}"
+
+        result = cache.get(cache_key)
+        if result is None:
+            result = self._compute(window_minutes)
+            cache.set(cache_key, result, config.get('CACHE_TTL', 15))
+
+        if canteen or merchant_id:
+            result = {
+                **result,
+                "merchants": [
+                    item for item in result['merchants']
+                    if (not canteen or item['canteen'] == canteen)
+                    and (not merchant_id or item['merchant_id'] == int(merchant_id))
+                ],
+                "canteens": [item for item in result['canteens'] if not canteen or item['canteen'] == canteen],
+            }
+        return result
+
+
+# 创建全局实例
+traffic_statistics = TrafficStatistics()
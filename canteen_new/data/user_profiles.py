@@ -0,0 +1,332 @@
+"""
+用户口味画像
+每个用户的收藏类别/口味计数、收藏价格直方图（按价格计数）和下单类别/口味计数
+保存在 user_profile_counters 表中，收藏、取消收藏和下单时按增量更新。
+每次收藏/下单计入的菜品属性保存在 user_profile_event_values 表中，取消收藏时按保存的属性扣减，
+菜品之后修改了分类、口味或价格也不会扣错计数。
+读取时将计数、最近收藏和用户明确设置的偏好组装为画像，连同由此得到的收藏偏好汇总一起
+放入缓存。缓存键包含保存在数据库中的用户画像版本号（与画像变化在同一事务中递增），
+因此所有进程的缓存都会在画像变化后失效，不依赖共享缓存。
+计数与收藏、订单出现偏差时可用 python manage.py rebuild_user_profiles 重建。
+"""
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .database import query_one, query_all, execute_update
+from .replication import use_primary
+from .versioning import version_counter, USER_PROFILE_VERSION
+
+# 事件 -> 计入的菜品属性（维度名为 "事件_属性"）
+EVENT_FIELDS = {
+    'favorite': ('category', 'taste', 'price'),
+    'order': ('category', 'taste'),
+}
+
+DEFAULT_BUDGET_RANGE = [15, 30]
+
+
+def _event_values_sql(event: str) -> str:
+    """事件计入的 (维度, 取值)，参数为对应数量的菜品ID"""
+    return " UNION ALL ".join(
+        f"SELECT '{event}_{field}' AS dimension, CAST({field} AS CHAR) AS value FROM dishes WHERE id = %s"
+        for field in EVENT_FIELDS[event]
+    )
+
+
+def snapshot_event_sql(event: str) -> str:
+    """保存事件计入的菜品属性的 SQL，参数为 (事件来源ID, 用户ID, 菜品ID...)"""
+    return f"""
+        INSERT INTO user_profile_event_values (event, source_id, user_id, dimension, value)
+        SELECT '{event}', %s, %s, e.dimension, e.value FROM ({_event_values_sql(event)}) e
+        WHERE e.value IS NOT NULL
+        ON DUPLICATE KEY UPDATE value = VALUES(value)
+    """
+
+
+def record_event_sql() -> str:
+    """按保存的属性增加计数的 SQL，参数为 (用户ID, 增量, 事件, 事件来源ID)"""
+    return """
+        INSERT INTO user_profile_counters (user_id, dimension, value, count)
+        SELECT %s, v.dimension, v.value, %s FROM user_profile_event_values v
+        WHERE v.event = %s AND v.source_id = %s
+        ON DUPLICATE KEY UPDATE count = count + VALUES(count)
+    """
+
+
+def retract_event_sql() -> str:
+    """按保存的属性减少计数的 SQL，参数为 (减少量, 用户ID, 事件, 事件来源ID)，计数不会小于 0"""
+    return """
+        UPDATE user_profile_counters c
+        JOIN user_profile_event_values v ON c.dimension = v.dimension AND c.value = v.value
+        SET c.count = GREATEST(c.count - %s, 0)
+        WHERE c.user_id = %s AND v.event = %s AND v.source_id = %s
+    """
+
+
+def _event_sources_sql(user_id: Optional[int]) -> Tuple[List[str], List[str]]:
+    """
+    参与画像的收藏和订单及其计入的菜品属性
+
+    Returns:
+        (收藏部分的 SELECT 列表, 订单部分的 SELECT 列表)，列为 source_id, user_id, dimension, value, weight
+    """
+    user_filter = "AND {alias}.user_id = %s" if user_id is not None else ""
+    favorite_parts = [
+        f"""SELECT f.id AS source_id, f.user_id, 'favorite_{field}' AS dimension, CAST(d.{field} AS CHAR) AS value,
+                   1 AS weight
+            FROM favorites f JOIN dishes d ON d.id = f.dish_id AND d.status = 'active'
+            WHERE d.{field} IS NOT NULL {user_filter.format(alias='f')}"""
+        for field in EVENT_FIELDS['favorite']
+    ]
+    order_parts = [
+        f"""SELECT o.id AS source_id, o.user_id, 'order_{field}' AS dimension, CAST(d.{field} AS CHAR) AS value,
+                   o.quantity AS weight
+            FROM orders o JOIN dishes d ON d.id = o.dish_id
+            WHERE o.status != 'cancelled' AND d.{field} IS NOT NULL {user_filter.format(alias='o')}"""
+        for field in EVENT_FIELDS['order']
+    ]
+    return favorite_parts, order_parts
+
+
+def rebuild_event_values_sql(user_id: Optional[int] = None) -> tuple:
+    """
+    根据收藏和订单重新保存事件属性的 SQL
+
+    Returns:
+        (删除旧属性的 SQL 与参数, 写入新属性的 SQL 与参数)
+    """
+    favorite_parts, order_parts = _event_sources_sql(user_id)
+    insert = f"""
+        INSERT INTO user_profile_event_values (event, source_id, user_id, dimension, value)
+        SELECT 'favorite', s.source_id, s.user_id, s.dimension, s.value FROM ({" UNION ALL ".join(favorite_parts)}) s
+        UNION ALL
+        SELECT 'order', s.source_id, s.user_id, s.dimension, s.value FROM ({" UNION ALL ".join(order_parts)}) s
+    """
+    if user_id is None:
+        return ("DELETE FROM user_profile_event_values", ()), (insert, ())
+    return (
+        ("DELETE FROM user_profile_event_values WHERE user_id = %s", (user_id,)),
+        (insert, (user_id,) * (len(favorite_parts) + len(order_parts))),
+    )
+
+
+def rebuild_counters_sql(user_id: Optional[int] = None) -> tuple:
+    """
+    根据收藏和订单重新计算计数的 SQL
+
+    Returns:
+        (删除旧计数的 SQL 与参数, 写入新计数的 SQL 与参数)
+    """
+    favorite_parts, order_parts = _event_sources_sql(user_id)
+    parts = favorite_parts + order_parts
+    insert = f"""
+        INSERT INTO user_profile_counters (user_id, dimension, value, count)
+        SELECT s.user_id, s.dimension, s.value, SUM(s.weight) FROM ({" UNION ALL ".join(parts)}) s
+        GROUP BY s.user_id, s.dimension, s.value
+        ON DUPLICATE KEY UPDATE count = VALUES(count)
+    """
+    if user_id is None:
+        return ("DELETE FROM user_profile_counters", ()), (insert, ())
+    return (
+        ("DELETE FROM user_profile_counters WHERE user_id = %s", (user_id,)),
+        (insert, (user_id,) * len(parts)),
+    )
+
+
+def infer_spice_tolerance(taste_count: Dict[str, float]) -> str:
+    """
+    根据口味偏好推断辣度耐受度
+
+    Args:
+        taste_count: 口味统计
+
+    Returns:
+        辣度耐受度描述
+    """
+    spicy_count = taste_count.get('辣', 0)
+    total_count = sum(taste_count.values())
+
+    if total_count == 0:
+        return "中等"
+
+    spicy_ratio = spicy_count / total_count
+
+    if spicy_ratio > 0.7:
+        return "高"
+    elif spicy_ratio > 0.3:
+        return "中等"
+    else:
+        return "低"
+
+
+def _ranked(counts: Dict[str, float]) -> List[str]:
+    return sorted(counts, key=lambda key: counts[key], reverse=True)
+
+
+def build_favorites_summary(counters: Dict[str, Dict[str, float]], recent_favorites: List[str]) -> Dict[str, Any]:
+    """由计数得到收藏偏好汇总（与 DishService.get_user_favorites_summary 的返回格式一致）"""
+    category_count = counters.get('favorite_category', {})
+    taste_count = counters.get('favorite_taste', {})
+    prices = [float(price) for price in counters.get('favorite_price', {})]
+    order_category_count = counters.get('order_category', {})
+
+    return {
+        "preferred_categories": _ranked(category_count)[:3],  # 取前3个
+        "preferred_tastes": _ranked(taste_count)[:2],  # 取前2个
+        "budget_range": [min(prices), max(prices)] if prices else list(DEFAULT_BUDGET_RANGE),
+        "spice_tolerance": infer_spice_tolerance(taste_count),
+        "favorite_dishes": recent_favorites[:5],  # 最近收藏的5个菜品名称
+        "total_favorites": int(sum(category_count.values())),
+        "ordered_categories": _ranked(order_category_count)[:3],
+        "total_orders": int(sum(order_category_count.values())),
+    }
+
+
+class UserProfileStore:
+    """按增量维护、通过缓存读取的用户口味画像"""
+
+    # 画像缓存键包含全局代数（data_versions 表）和用户版本号（user_profile_versions 表）：
+    # 失效时在数据库中增加版本号，而不是删除缓存，各进程的缓存在下次读取时都会换用新键；
+    # 与失效同时进行的读取即使写入了旧画像，也只会写到旧版本的键上
+    def _cache_key(self, user_id: int) -> str:
+        with use_primary():
+            versions = query_one(
+                """
+                SELECT (SELECT version FROM data_versions WHERE name = %s) AS generation,
+                       (SELECT version FROM user_profile_versions WHERE user_id = %s) AS version
+                """,
+                (USER_PROFILE_VERSION, user_id)
+            )
+        return f"user_profile:{user_id}:{versions['generation'] or 0}:{versions['version'] or 0}"
+
+    def invalidate(self, user_id: int) -> None:
+        """使用户画像缓存失效（在事务中调用时与画像的修改一起提交）"""
+        execute_update(
+            """
+            INSERT INTO user_profile_versions (user_id, version) VALUES (%s, 1)
+            ON DUPLICATE KEY UPDATE version = version + 1
+            """,
+            (user_id,)
+        )
+
+    def record(self, user_id: int, event: str, source_id: int, dish_id: int, delta: float = 1) -> None:
+        """
+        记录一次画像事件，保存计入的菜品属性并增加计数（应与收藏/订单的写入在同一事务中）
+
+        Args:
+            user_id: 用户ID
+            event: favorite（收藏）或 order（下单）
+            source_id: 收藏ID或订单ID
+            dish_id: 菜品ID
+            delta: 计数增量（下单时为份数）
+        """
+        dish_ids = [dish_id] * len(EVENT_FIELDS[event])
+        execute_update(snapshot_event_sql(event), (source_id, user_id, *dish_ids))
+        execute_update(record_event_sql(), (user_id, delta, event, source_id))
+        self.invalidate(user_id)
+
+    def retract(self, user_id: int, event: str, source_id: int, delta: float = 1) -> None:
+        """
+        撤销一次画像事件（如取消收藏），按记录时保存的菜品属性减少计数
+
+        Args:
+            user_id: 用户ID
+            event: favorite 或 order
+            source_id: 收藏ID或订单ID
+            delta: 计数减少量
+        """
+        execute_update(retract_event_sql(), (delta, user_id, event, source_id))
+        execute_update(
+            "DELETE FROM user_profile_event_values WHERE event = %s AND source_id = %s", (event, source_id)
+        )
+        self.invalidate(user_id)
+
+    def rebuild(self, user_id: Optional[int] = None) -> int:
+        """
+        根据收藏和订单重建计数（及计入的菜品属性）
+
+        Args:
+            user_id: 只重建该用户，默认全部用户
+
+        Returns:
+            写入的计数行数
+        """
+        (delete_values_sql, delete_values_params), (insert_values_sql, insert_values_params) = \
+            rebuild_event_values_sql(user_id)
+        (delete_sql, delete_params), (insert_sql, insert_params) = rebuild_counters_sql(user_id)
+        with transaction.atomic():
+            execute_update(delete_values_sql, delete_values_params)
+            execute_update(insert_values_sql, insert_values_params)
+            execute_update(delete_sql, delete_params)
+            written = execute_update(insert_sql, insert_params)
+            if user_id is not None:
+                self.invalidate(user_id)
+        if user_id is None:
+            version_counter.bump(USER_PROFILE_VERSION)
+        return written
+
+    def _load(self, user_id: int) -> Dict[str, Any]:
+        user = query_one(
+            "SELECT preferences FROM users WHERE id = %s AND status = 'active'", (user_id,)
+        )
+        if not user:
+            return {"exists": False}
+
+        preferences = {}
+        if user['preferences']:
+            try:
+                preferences = json.loads(user['preferences'])
+            except json.JSONDecodeError:
+                preferences = {}
+
+        counters: Dict[str, Dict[str, float]] = {}
+        for row in query_all(
+            "SELECT dimension, value, count FROM user_profile_counters WHERE user_id = %s AND count > 0",
+            (user_id,)
+        ):
+            counters.setdefault(row['dimension'], {})[row['value']] = float(row['count'])
+
+        recent_favorites = [
+            row['name'] for row in query_all(
+                """
+                SELECT d.name FROM favorites f
+                JOIN dishes d ON f.dish_id = d.id AND d.status = 'active'
+                WHERE f.user_id = %s
+                ORDER BY f.id DESC
+                LIMIT 5
+                """,
+                (user_id,)
+            )
+        ]
+
+        return {
+            "exists": True,
+            "preferences": preferences,
+            "counters": counters,
+            "favorites_summary": build_favorites_summary(counters, recent_favorites),
+        }
+
+    def get(self, user_id: int) -> Dict[str, Any]:
+        """
+        读取用户画像
+
+        Returns:
+            {exists, preferences, counters, favorites_summary}；用户不存在时只有 exists=False
+        """
+        # 先取得缓存键（版本号）再读取数据库
+        key = self._cache_key(user_id)
+        profile = cache.get(key)
+        if profile is None:
+            # 按新版本号加载时从主库读取，避免把副本上的旧数据缓存到新版本的键上
+            with use_primary():
+                profile = self._load(user_id)
+            cache.set(key, profile, settings.USER_PROFILES.get('CACHE_TTL', 3600))
+        return profile
+
+
+# 创建全局实例
+user_profiles = UserProfileStore()
@@ -0,0 +1,79 @@
+"""
+数据版本计数器
+菜单、客流量等数据发生变化时递增版本号，进程内缓存据此判断是否需要重新加载
+"""
+import logging
+import threading
+import time
+from typing import Dict
+
+from django.conf import settings
+
+from .database import query_one, execute_update
+from .replication import use_primary
+
+logger = logging.getLogger(__name__)
+
+# 版本名称
+MENU_VERSION = 'menu'
+TRAFFIC_VERSION = 'traffic'
+USER_PROFILE_VERSION = 'user_profiles'
+
+
+class VersionCounter:
+    """
+    基于 data_versions 表的版本计数器
+
+    本进程的写操作会立即更新本地版本号；其他进程的写操作
+    最多在 check_interval 秒后被感知。
+    """
+
+    def __init__(self, check_interval: float = None):
+        if check_interval is None:
+            check_interval = getattr(settings, 'DATA_VERSION_CHECK_INTERVAL', 1.0)
+        self.check_interval = check_interval
+        self._versions: Dict[str, int] = {}
+        self._checked_at: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> int:
+        """获取版本号（按检查间隔节流读取数据库）"""
+        now = time.monotonic()
+        if now - self._checked_at.get(name, 0.0) < self.check_interval:
+            return self._versions.get(name, 0)
+
+        try:
+            # 版本号决定进程内缓存是否重新加载，必须从主库读取
+            with use_primary():
+                result = query_one("SELECT version FROM data_versions WHERE name = %s", (name,))
+            version = int(result['version']) if result else 0
+        except Exception as e:
+            logger.warning(f"读取数据版本 {name} 失败: {e}")
+            version = self._versions.get(name, 0)
+
+        with self._lock:
+            self._versions[name] = version
+            self._checked_at[name] = now
+        return version
+
+    def bump(self, name: str) -> None:
+        """递增版本号"""
+        try:
+            execute_update(
+                """
+                INSERT INTO data_versions (name, version) VALUES (%s, 1)
+                ON DUPLICATE KEY UPDATE version = version + 1
+                """,
+                (name,)
+            )
+        except Exception as e:
+            logger.warning(f"更新数据版本 {name} 失败: {e}")
+
+        # 无论数据库是否更新成功，都让本进程的缓存在下次访问时重新检查
+        with self._lock:
+            self._versions[name] = self._versions.get(name, 0) + 1
+            self._checked_at.pop(name, None)
+
+
+# 创建全局实例
+version_counter = VersionCounter()
@@ -0,0 +1,377 @@
+"""
+等待时间与客流预测
+根据客流量汇总表为每个商家拟合"周内时段"画像：一周按 15 分钟划分为 672 个时段，
+每个时段记录按时间衰减加权的上报次数、人数之和与等待时间之和。
+商家样本不足的时段向所在食堂的画像收缩，食堂再向全部商家收缩，
+因此新商家和冷门时段也能得到合理的估计。
+
+模型由 python manage.py train_wait_forecast 每晚增量训练（已有状态按衰减系数折算后
+累加新一天的数据）并保存为 .npz 文件；各进程加载后将预测结果保存在 NumPy 数组中，
+查询"某商家在某时刻的预计等待时间"只需一次数组索引。
+"""
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional
+
+from django.conf import settings
+from django.utils import timezone
+
+from .database import query_all
+from .replication import use_primary
+from .traffic_rollups import ROLLUP_TABLES
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - numpy 为可选依赖
+    np = None
+
+logger = logging.getLogger(__name__)
+
+SLOT_MINUTES = 15
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+SLOTS_PER_WEEK = 7 * SLOTS_PER_DAY
+
+# 训练状态中累加的量
+STATE_FIELDS = ('samples', 'count_sum', 'wait_sum')
+
+
+def slot_of(at: datetime) -> int:
+    """时刻所在的周内时段（周一 0:00 为 0）"""
+    return at.weekday() * SLOTS_PER_DAY + (at.hour * 60 + at.minute) // SLOT_MINUTES
+
+
+def slots_of(timestamps: 'np.ndarray') -> 'np.ndarray':
+    """向量化计算一组时刻（datetime64）所在的周内时段"""
+    minutes = timestamps.astype('datetime64[m]').astype(np.int64)
+    # 1970-01-01 是星期四（weekday 3）
+    weekdays = (minutes // 1440 + 3) % 7
+    return weekdays * SLOTS_PER_DAY + (minutes % 1440) // SLOT_MINUTES
+
+
+def parse_pickup_time(value: Any) -> datetime:
+    """
+    解析取餐时间
+
+    Args:
+        value: datetime、ISO 格式时间字符串，或表示今天某时刻的 "HH:MM"
+
+    Returns:
+        本地时间（不带时区）
+
+    Raises:
+        ValueError: 格式无效
+    """
+    if isinstance(value, datetime):
+        at = value
+    else:
+        text = str(value).strip()
+        try:
+            if len(text) <= 5 and ':' in text:
+                hour, minute = (int(part) for part in text.split(':'))
+                at = datetime.now().replace(hour=hour, minute=minute, second=0, microsecond=0)
+            else:
+                at = datetime.fromisoformat(text)
+        except ValueError:
+            raise ValueError(f"取餐时间格式无效: {value}")
+    if timezone.is_aware(at):
+        at = timezone.make_naive(timezone.localtime(at))
+    return at
+
+
+class _ForecastModel:
+    """某次训练结果的预测数组（只读）"""
+
+    def __init__(self, state: Dict[str, Any], prior_strength: float):
+        self.merchant_ids = state['merchant_ids']
+        self.canteens = state['canteens']
+        self.trained_until = state['trained_until']
+        self.index = {int(merchant_id): i for i, merchant_id in enumerate(self.merchant_ids)}
+
+        canteen_names, canteen_index = np.unique(self.canteens, return_inverse=True)
+        self.canteen_index = {str(name): i for i, name in enumerate(canteen_names)}
+
+        samples = state['samples']
+        self.has_data = bool(samples.sum() > 0)
+        if not self.has_data:
+            return
+
+        for name, field in (('wait', 'wait_sum'), ('count', 'count_sum')):
+            totals = state[field]
+            # 全部商家：时段样本不足时向整体均值收缩
+            overall_samples = samples.sum(axis=0)
+            overall_totals = totals.sum(axis=0)
+            overall_mean = overall_totals.sum() / overall_samples.sum()
+            overall = (overall_totals + prior_strength * overall_mean) / (overall_samples + prior_strength)
+
+            # 食堂：向全部商家收缩
+            canteen_samples = np.zeros((len(canteen_names), SLOTS_PER_WEEK))
+            canteen_totals = np.zeros((len(canteen_names), SLOTS_PER_WEEK))
+            np.add.at(canteen_samples, canteen_index, samples)
+            np.add.at(canteen_totals, canteen_index, totals)
+            canteen = (canteen_totals + prior_strength * overall) / (canteen_samples + prior_strength)
+
+            # 商家：向所在食堂收缩
+            merchant = (totals + prior_strength * canteen[canteen_index]) / (samples + prior_strength)
+
+            setattr(self, f'overall_{name}', overall.astype(np.float32))
+            setattr(self, f'canteen_{name}', canteen.astype(np.float32))
+            setattr(self, f'merchant_{name}', merchant.astype(np.float32))
+
+
+class WaitForecaster:
+    """等待时间预测：训练、保存、加载与查询"""
+
+    def __init__(self):
+        self._model: Optional[_ForecastModel] = None
+        self._model_mtime: Optional[float] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _config() -> Dict[str, Any]:
+        return settings.WAIT_FORECAST
+
+    def is_enabled(self) -> bool:
+        return np is not None and self._config().get('ENABLED', True)
+
+    # ---- 训练 ----
+
+    def _load_state(self) -> Optional[Dict[str, Any]]:
+        path = self._config()['MODEL_PATH']
+        if not os.path.exists(path):
+            return None
+        with np.load(path, allow_pickle=False) as data:
+            state = {key: data[key] for key in data.files}
+        state['trained_until'] = state['trained_until'].astype('datetime64[m]').item()
+        return state
+
+    def _save_state(self, state: Dict[str, Any]) -> None:
+        path = self._config()['MODEL_PATH']
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 先写临时文件再替换，服务进程不会读到写了一半的模型
+        temp_path = f"{path}.tmp.npz"
+        np.savez_compressed(
+            temp_path,
+            **{key: value for key, value in state.items() if key != 'trained_until'},
+            trained_until=np.datetime64(state['trained_until'], 'm')
+        )
+        os.replace(temp_path, path)
+
+    @staticmethod
+    def _align(state: Optional[Dict[str, Any]], merchants: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """按当前商家列表重排训练状态（新商家从零开始，已删除的商家丢弃）"""
+        merchant_ids = np.array([row['id'] for row in merchants], dtype=np.int64)
+        aligned = {
+            "merchant_ids": merchant_ids,
+            "canteens": np.array([row['canteen'] or '' for row in merchants], dtype=str),
+            **{field: np.zeros((len(merchants), SLOTS_PER_WEEK)) for field in STATE_FIELDS},
+        }
+        if state is not None and len(state['merchant_ids']):
+            previous = {int(merchant_id): i for i, merchant_id in enumerate(state['merchant_ids'])}
+            pairs = [(i, previous[int(merchant_id)]) for i, merchant_id in enumerate(merchant_ids)
+                     if int(merchant_id) in previous]
+            if pairs:
+                target, source = (np.array(side) for side in zip(*pairs))
+                for field in STATE_FIELDS:
+                    aligned[field][target] = state[field][source]
+        return aligned
+
+    def _accumulate(self, state: Dict[str, Any], start: datetime, end: datetime) -> int:
+        """将 [start, end) 的汇总数据按衰减权重累加到训练状态，返回读取的行数"""
+        config = self._config()
+        minute_days = settings.TRAFFIC_RETENTION.get('MINUTE_DAYS') or 0
+        # 分钟汇总只保留几天，更早的数据读取小时汇总并平均分到小时内的各时段
+        if start >= datetime.now() - timedelta(days=minute_days) + timedelta(hours=1):
+            table, spread = ROLLUP_TABLES['minute'], 1
+        else:
+            table, spread = ROLLUP_TABLES['hour'], 60 // SLOT_MINUTES
+
+        with use_primary():
+            rows = query_all(
+                f"""
+                SELECT merchant_id, bucket_start, samples, count_sum, wait_sum
+                FROM {table}
+                WHERE bucket_start >= %s AND bucket_start < %s
+                """,
+                (start, end)
+            )
+        if not rows:
+            return 0
+
+        index = {int(merchant_id): i for i, merchant_id in enumerate(state['merchant_ids'])}
+        positions = np.array([index.get(row['merchant_id'], -1) for row in rows], dtype=np.int64)
+        timestamps = np.array([row['bucket_start'] for row in rows], dtype='datetime64[m]')
+        values = {
+            field: np.array([float(row[field]) for row in rows]) for field in STATE_FIELDS
+        }
+
+        known = positions >= 0
+        positions, timestamps = positions[known], timestamps[known]
+        age_weeks = (np.datetime64(end, 'm') - timestamps).astype(np.float64) / (7 * 1440)
+        weights = config.get('WEEKLY_DECAY', 0.8) ** age_weeks / spread
+        slots = slots_of(timestamps)
+
+        for offset in range(spread):
+            for field in STATE_FIELDS:
+                np.add.at(state[field], (positions, slots + offset), values[field][known] * weights)
+        return len(rows)
+
+    def train(self, full: bool = False) -> Dict[str, Any]:
+        """
+        训练模型：默认在已有状态上增量累加上次训练之后的数据，full 为 True 时从历史数据重新训练
+
+        Args:
+            full: 是否忽略已有状态，从 HISTORY_DAYS 天的汇总数据重新训练
+
+        Returns:
+            训练摘要：模式、商家数、读取行数、训练截止时间
+        """
+        if np is None:
+            raise RuntimeError("等待时间预测需要安装 numpy")
+
+        config = self._config()
+        now = datetime.now()
+        # 训练截止到当前小时的起点（与小时汇总对齐，避免重复计入），未结束的小时留到下次训练
+        end = now.replace(minute=0, second=0, microsecond=0)
+
+        previous = None if full else self._load_state()
+        with use_primary():
+            merchants = query_all("SELECT id, canteen FROM merchants ORDER BY id")
+        state = self._align(previous, merchants)
+
+        if previous is None:
+            start = end - timedelta(days=config.get('HISTORY_DAYS', 56))
+        else:
+            start = previous['trained_until']
+            # 已有状态先衰减到新的截止时间
+            elapsed_weeks = (end - start).total_seconds() / (7 * 86400)
+            for field in STATE_FIELDS:
+                state[field] *= config.get('WEEKLY_DECAY', 0.8) ** elapsed_weeks
+
+        rows = self._accumulate(state, start, end) if start < end else 0
+        state['trained_until'] = end
+        self._save_state(state)
+        self._checked_at = 0.0
+
+        summary = {
+            "mode": "full" if previous is None else "incremental",
+            "merchants": len(merchants),
+            "rows": rows,
+            "trained_until": end.strftime('%Y-%m-%d %H:%M'),
+        }
+        logger.info(f"等待时间预测模型训练完成: {summary}")
+        return summary
+
+    # ---- 查询 ----
+
+    def _get_model(self) -> Optional[_ForecastModel]:
+        """返回当前模型，模型文件更新后在刷新间隔内重新加载"""
+        if not self.is_enabled():
+            return None
+        config = self._config()
+        if time.monotonic() - self._checked_at < config.get('REFRESH_INTERVAL', 300):
+            return self._model
+
+        with self._lock:
+            self._checked_at = time.monotonic()
+            path = config['MODEL_PATH']
+            try:
+                mtime = os.path.getmtime(path)
+            except OSError:
+                return self._model
+            if mtime != self._model_mtime:
+                try:
+                    state = self._load_state()
+                    self._model = _ForecastModel(state, config.get('PRIOR_STRENGTH', 5.0))
+                    self._model_mtime = mtime
+                except Exception as e:
+                    logger.warning(f"加载等待时间预测模型失败: {e}")
+        return self._model
+
+    def expected_wait(self, merchant_id: int, at: datetime = None) -> Optional[float]:
+        """
+        商家在某时刻的预计等待时间
+
+        Args:
+            merchant_id: 商家ID
+            at: 取餐时间，默认当前时间
+
+        Returns:
+            预计等待时间（分钟），模型不可用时为 None
+        """
+        return self.expected_waits([merchant_id], at).get(merchant_id)
+
+    def expected_waits(self, merchant_ids: Iterable[int], at: datetime = None) -> Dict[int, float]:
+        """
+        一组商家在某时刻的预计等待时间（模型中没有的商家使用全部商家的估计）
+
+        Returns:
+            商家ID -> 预计等待时间（分钟），模型不可用时为空字典
+        """
+        model = self._get_model()
+        if model is None or not model.has_data:
+            return {}
+        slot = slot_of(at or datetime.now())
+        overall = float(model.overall_wait[slot])
+        result = {}
+        for merchant_id in merchant_ids:
+            position = model.index.get(merchant_id)
+            wait = model.merchant_wait[position, slot] if position is not None else overall
+            result[merchant_id] = round(float(wait), 1)
+        return result
+
+    def forecast(self, at: datetime = None, canteen: str = None) -> Optional[Dict[str, float]]:
+        """
+        食堂（默认全部商家）在某时刻的预计平均人数和等待时间
+
+        Returns:
+            {avg_count, avg_wait_time}，模型不可用时为 None
+        """
+        model = self._get_model()
+        if model is None or not model.has_data:
+            return None
+        slot = slot_of(at or datetime.now())
+        position = model.canteen_index.get(canteen) if canteen else None
+        if position is not None:
+            count, wait = model.canteen_count[position, slot], model.canteen_wait[position, slot]
+        else:
+            count, wait = model.overall_count[slot], model.overall_wait[slot]
+        return {"avg_count": round(float(count), 1), "avg_wait_time": round(float(wait), 1)}
+
+    def peak_hours(self, weekday: int, canteen: str = None, top: int = 6) -> List[int]:
+        """
+        某一天预计人数最多的几个小时（客流高峰）
+
+        Args:
+            weekday: 星期（周一为 0）
+            canteen: 食堂，默认全部商家
+            top: 返回的小时数
+
+        Returns:
+            按时间排序的小时列表，模型不可用时为空列表
+        """
+        model = self._get_model()
+        if model is None or not model.has_data:
+            return []
+        position = model.canteen_index.get(canteen) if canteen else None
+        counts = model.canteen_count[position] if position is not None else model.overall_count
+        day = counts[weekday * SLOTS_PER_DAY:(weekday + 1) * SLOTS_PER_DAY]
+        hourly = day.reshape(24, -1).mean(axis=1)
+        # 只返回高于当天平均水平的小时
+        busiest = np.argsort(-hourly, kind='stable')[:top]
+        return sorted(int(hour) for hour in busiest if hourly[hour] > hourly.mean())
+
+    def annotate(self, dishes: List[Any], at: datetime) -> List[Any]:
+        """为菜品列表填写取餐时刻的预计等待时间（expected_wait_time），模型不可用时保持为空"""
+        waits = self.expected_waits({dish['merchant_id'] for dish in dishes}, at)
+        if waits:
+            for dish in dishes:
+                dish['expected_wait_time'] = waits.get(dish['merchant_id'])
+        return dishes
+
+
+# 创建全局实例
+wait_forecaster = WaitForecaster()
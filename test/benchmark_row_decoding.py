@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+"""
+查询结果解码基准测试
+对比 1000 行菜品列表结果的两种解码方式：
+  - 旧方式: dict(zip(columns, row)) 构造中间字典，再逐字段复制为输出字典
+  - 投影方式: 元组行经 DishRepository.LIST_PROJECTION 一次解码为菜品记录（data.records.Dish）
+不需要数据库，使用模拟的驱动元组行。
+
+用法:
+    cd canteen_new
+    python ../test/benchmark_row_decoding.py
+"""
+import os
+import sys
+import timeit
+import tracemalloc
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'canteen_new'))
+
+from django.conf import settings
+
+settings.configure()
+
+from data.repositories import DishRepository
+
+ROW_COUNT = 1000
+REPEAT = 50
+
+PROJECTION = DishRepository.LIST_PROJECTION
+
+# 模拟驱动返回的元组行，列顺序与 PROJECTION.columns 一致
+ROWS = [
+    (
+        i, i % 20 + 1, f"菜品{i}", "描述" * 5, Decimal("12.50"), "面食", "咸", i % 5,
+        f"/media/dishes/{i}.jpg", 1, 100, Decimal("4.5"), f"商家{i % 20}", "一食堂", 15,
+    )
+    for i in range(1, ROW_COUNT + 1)
+]
+COLUMNS = ["id", "merchant_id", "name", "description", "price", "category", "taste",
+           "spice_level", "image_url", "is_available", "stock_quantity", "rating",
+           "store_name", "canteen", "wait_time"]
+
+
+def decode_legacy(rows):
+    """旧方式：execute_raw_query 的字典行 + 仓储层的格式化"""
+    dishes = [dict(zip(COLUMNS, row)) for row in rows]
+    return [
+        {
+            "id": dish['id'],
+            "merchant_id": dish['merchant_id'],
+            "name": dish['name'],
+            "description": dish['description'],
+            "price": float(dish['price']),
+            "category": dish['category'],
+            "taste": dish['taste'],
+            "spice_level": dish['spice_level'],
+            "image_url": dish['image_url'],
+            "is_available": bool(dish['is_available']),
+            "stock_quantity": dish['stock_quantity'],
+            "rating": float(dish['rating']),
+            "store_name": dish['store_name'],
+            "merchant_name": dish['store_name'],
+            "canteen": dish['canteen'],
+            "wait_time": int(dish['wait_time']) if dish['wait_time'] else 15
+        }
+        for dish in dishes
+    ]
+
+
+def decode_projection(rows):
+    """投影方式"""
+    return PROJECTION.decode(rows)
+
+
+def measure(func):
+    """返回 (每次耗时毫秒, 解码过程中的峰值内存KB)"""
+    seconds = min(timeit.repeat(lambda: func(ROWS), number=REPEAT, repeat=3)) / REPEAT
+
+    tracemalloc.start()
+    result = func(ROWS)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return seconds * 1000, peak / 1024
+
+
+def main():
+    # 只比较投影中的字段（记录末尾带默认值的字段不由查询填写）
+    projected = [{key: dish[key] for key in PROJECTION.keys} for dish in decode_projection(ROWS)]
+    assert decode_legacy(ROWS) == projected, "两种方式的输出不一致"
+
+    print(f"解码 {ROW_COUNT} 行菜品列表结果（{REPEAT} 次取最优）")
+    print(f"{'方式':<12}{'耗时(ms)':>12}{'峰值内存(KB)':>16}")
+    results = {}
+    for name, func in [("旧方式", decode_legacy), ("投影方式", decode_projection)]:
+        results[name] = measure(func)
+        elapsed, peak = results[name]
+        print(f"{name:<12}{elapsed:>12.3f}{peak:>16.1f}")
+
+    legacy, projected = results["旧方式"], results["投影方式"]
+    print(f"\n耗时降低 {1 - projected[0] / legacy[0]:.0%}，"
+          f"峰值内存降低 {1 - projected[1] / legacy[1]:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+"""
+启动导入耗时检查
+用 python -X importtime 在子进程中执行 django.setup() 并加载 URL 配置（即一个工作进程的启动过程），
+输出累计耗时最多的模块，并检查 AI 相关的重量级依赖没有在启动时被导入。
+AI 组件应在首次处理 AI 请求时才创建（见 ai.llm_service.get_llm_service 等访问函数）。
+
+用法:
+    cd canteen_new
+    python ../test/check_import_time.py [--budget-ms 1500] [--top 15]
+
+存在不应导入的模块或总耗时超出预算时以非零状态码退出，可作为回归检查。
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+# 启动时不应导入的模块（只在处理 AI 请求或首次构建搜索建议索引时需要）
+DEFERRED_MODULES = [
+    "openai",
+    "lunarcalendar",
+    "holidays",
+    "ai.llm_service",
+    "ai.orchestrator",
+    "ai.services",
+    "pypinyin",
+]
+
+STARTUP_CODE = (
+    "import os, django;"
+    "os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings');"
+    "django.setup();"
+    "import config.urls"
+)
+
+
+def profile_startup(project_dir):
+    """
+    在子进程中执行启动代码并收集导入耗时
+
+    Returns:
+        {模块名: (自身耗时微秒, 累计耗时微秒)}
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", STARTUP_CODE],
+        cwd=project_dir, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        print(result.stderr[-2000:])
+        raise SystemExit("启动代码执行失败，请确认依赖和环境变量已配置")
+
+    timings = {}
+    for line in result.stderr.splitlines():
+        # 格式: import time:  self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        timings[name.strip()] = (int(self_us), int(cumulative_us))
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="检查工作进程启动的导入耗时")
+    parser.add_argument("--budget-ms", type=float, default=1500, help="导入总耗时预算（毫秒）")
+    parser.add_argument("--top", type=int, default=15, help="输出累计耗时最多的模块数量")
+    args = parser.parse_args()
+
+    project_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "canteen_new")
+    timings = profile_startup(project_dir)
+
+    # 各模块自身耗时之和即导入总耗时（累计耗时有嵌套重复）
+    total_ms = sum(self_us for self_us, _ in timings.values()) / 1000
+    print(f"启动共导入 {len(timings)} 个模块，导入总耗时 {total_ms:.1f} ms（预算 {args.budget_ms:.0f} ms）")
+    print(f"\n累计耗时最多的 {args.top} 个模块:")
+    ranked = sorted(timings.items(), key=lambda item: item[1][1], reverse=True)
+    for name, (_, cumulative_us) in ranked[:args.top]:
+        print(f"  {cumulative_us / 1000:>9.1f} ms  {name}")
+
+    failed = False
+    loaded = [name for name in DEFERRED_MODULES if name in timings]
+    if loaded:
+        print(f"\n失败: 启动时导入了应延迟加载的模块: {', '.join(loaded)}")
+        failed = True
+    if total_ms > args.budget_ms:
+        print(f"\n失败: 导入总耗时超出预算 {total_ms - args.budget_ms:.1f} ms")
+        failed = True
+
+    if failed:
+        sys.exit(1)
+    print("\n通过")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+"""
+排队分流仿真
+用 traffic_data 中记录的客流量回放用餐需求，比较不同推荐策略下的排队情况:
+    recorded  用户按记录中的实际分布就餐（不受推荐影响）
+    rating    部分用户去评分最高的商家（原有按评分排序的推荐）
+    balanced  部分用户去排队分流排序（ai.queue_routing.QueueBalancer）推荐的第一个商家
+
+仿真方法（流体排队模型，按 --step 分钟推进）:
+    - 每条记录按利特尔法则折算到达率 count / waiting_time（人/分钟），商家在没有记录的时段沿用上一次的值；
+    - 商家的服务能力取其记录中到达率的 90 分位数；
+    - 每个时段的总需求等于各商家到达率之和，其中 --follow 比例的用户按推荐就餐，其余按记录分布；
+    - 推荐使用上一时段结束时的排队长度折算的等待时间（相当于商家定期上报）；
+    - 记录中断的时段（如夜间）没有新到达，队伍按服务能力继续减少。
+
+用法:
+    cd canteen_new
+    python ../test/simulate_queue_routing.py [--days 7] [--step 5] [--follow 0.5]
+    python ../test/simulate_queue_routing.py --csv traffic.csv
+CSV 需包含 merchant_id, canteen, count, waiting_time, timestamp 列，可选 rating 列（默认 4.0）。
+"""
+import argparse
+import csv
+import os
+import sys
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+# 添加项目路径
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'canteen_new'))
+
+# 设置Django环境
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+
+import django
+django.setup()
+
+from ai.queue_routing import QueueBalancer
+
+
+def load_from_database(days):
+    """从数据库读取最近 days 天的客流记录和商家平均评分"""
+    from data.database import query_all
+
+    records = query_all(
+        """
+        SELECT t.merchant_id, m.canteen, t.count, t.waiting_time, t.timestamp
+        FROM traffic_data t
+        JOIN merchants m ON m.id = t.merchant_id
+        WHERE t.timestamp >= %s
+        ORDER BY t.timestamp
+        """,
+        (datetime.now() - timedelta(days=days),)
+    )
+    ratings = {
+        row['merchant_id']: float(row['rating'])
+        for row in query_all(
+            "SELECT merchant_id, AVG(rating) AS rating FROM dishes WHERE status = 'active' GROUP BY merchant_id"
+        )
+    }
+    for record in records:
+        record['rating'] = ratings.get(record['merchant_id'], 4.0)
+    return records
+
+
+def load_from_csv(path):
+    """从导出的 CSV 读取客流记录"""
+    records = []
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        for row in csv.DictReader(f):
+            records.append({
+                "merchant_id": int(row['merchant_id']),
+                "canteen": row['canteen'],
+                "count": int(row['count']),
+                "waiting_time": float(row['waiting_time']),
+                "timestamp": datetime.fromisoformat(row['timestamp']),
+                "rating": float(row.get('rating') or 4.0),
+            })
+    records.sort(key=lambda record: record['timestamp'])
+    return records
+
+
+def build_demand(records, step_minutes):
+    """
+    按时段折算各商家的到达率
+
+    Returns:
+        (商家信息 {id: {canteen, rating, capacity}}, [(时段开始, {商家ID: 到达率})])
+    """
+    merchants = {}
+    observed = defaultdict(list)
+    buckets = defaultdict(lambda: defaultdict(list))
+    for record in records:
+        if record['waiting_time'] <= 0:
+            continue
+        rate = record['count'] / record['waiting_time']
+        merchant_id = record['merchant_id']
+        merchants[merchant_id] = {"canteen": record['canteen'], "rating": record['rating']}
+        observed[merchant_id].append(rate)
+        ts = record['timestamp']
+        bucket = ts - timedelta(minutes=ts.minute % step_minutes, seconds=ts.second, microseconds=ts.microsecond)
+        buckets[bucket][merchant_id].append(rate)
+
+    for merchant_id, rates in observed.items():
+        rates.sort()
+        merchants[merchant_id]['capacity'] = max(rates[int(0.9 * (len(rates) - 1))], 0.1)
+
+    timeline = []
+    current = {}
+    for bucket in sorted(buckets):
+        for merchant_id, rates in buckets[bucket].items():
+            current[merchant_id] = sum(rates) / len(rates)
+        timeline.append((bucket, dict(current)))
+    return merchants, timeline
+
+
+def simulate(policy, merchants, timeline, step_minutes, follow):
+    """
+    按策略回放需求
+
+    Returns:
+        {avg_wait, p95_wait, max_wait, max_queue, diners}
+    """
+    clock = {"now": 0.0}
+    balancer = QueueBalancer(clock=lambda: clock["now"])
+    queues = {merchant_id: 0.0 for merchant_id in merchants}
+    waits = []  # (等待时间, 人数)
+    max_queue = 0.0
+    by_rating = sorted(merchants, key=lambda merchant_id: -merchants[merchant_id]['rating'])
+
+    previous = None
+    for step_index, (bucket, rates) in enumerate(timeline):
+        # 记录中断的时段（如夜间）没有新到达，队伍按服务能力继续减少
+        if previous is not None:
+            idle = (bucket - previous).total_seconds() / 60 - step_minutes
+            if idle > 0:
+                for merchant_id, info in merchants.items():
+                    queues[merchant_id] = max(queues[merchant_id] - info['capacity'] * idle, 0.0)
+        previous = bucket
+
+        total = sum(rates.values()) * step_minutes
+        if total <= 0:
+            continue
+        arrivals = {
+            merchant_id: rate * step_minutes * (1 - follow if policy != 'recorded' else 1)
+            for merchant_id, rate in rates.items()
+        }
+
+        followers = round(total * follow) if policy != 'recorded' else 0
+        if policy == 'rating' and followers:
+            arrivals[by_rating[0]] = arrivals.get(by_rating[0], 0) + followers
+        elif policy == 'balanced' and followers:
+            # 推荐看到的是上一时段结束时的等待时间
+            candidates = [
+                {"merchant_id": merchant_id, "canteen": info['canteen'], "rating": info['rating'],
+                 "wait_time": queues[merchant_id] / info['capacity']}
+                for merchant_id, info in merchants.items()
+            ]
+            for i in range(followers):
+                clock["now"] = (step_index + i / followers) * step_minutes * 60
+                chosen = balancer.rank(candidates, limit=3)[0]
+                arrivals[chosen['merchant_id']] = arrivals.get(chosen['merchant_id'], 0) + 1
+
+        for merchant_id, info in merchants.items():
+            arrived = arrivals.get(merchant_id, 0.0)
+            capacity = info['capacity'] * step_minutes
+            if arrived:
+                # 时段内到达的用户平均排在队伍中部
+                waits.append(((queues[merchant_id] + arrived / 2) / info['capacity'], arrived))
+            queues[merchant_id] = max(queues[merchant_id] + arrived - capacity, 0.0)
+            max_queue = max(max_queue, queues[merchant_id])
+
+    diners = sum(weight for _, weight in waits)
+    if not diners:
+        return None
+    waits.sort()
+    cumulative, p95 = 0.0, waits[-1][0]
+    for wait, weight in waits:
+        cumulative += weight
+        if cumulative >= 0.95 * diners:
+            p95 = wait
+            break
+    return {
+        "avg_wait": sum(wait * weight for wait, weight in waits) / diners,
+        "p95_wait": p95,
+        "max_wait": waits[-1][0],
+        "max_queue": max_queue,
+        "diners": diners,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="排队分流仿真")
+    parser.add_argument('--csv', help='从 CSV 读取客流记录（默认读取数据库 traffic_data）')
+    parser.add_argument('--days', type=int, default=7, help='读取数据库中最近的天数')
+    parser.add_argument('--step', type=int, default=5, help='仿真步长（分钟）')
+    parser.add_argument('--follow', type=float, default=0.5, help='按推荐就餐的用户比例')
+    args = parser.parse_args()
+
+    records = load_from_csv(args.csv) if args.csv else load_from_database(args.days)
+    merchants, timeline = build_demand(records, args.step)
+    if not timeline:
+        raise SystemExit("没有可用的客流记录")
+    print(f"客流记录 {len(records)} 条，商家 {len(merchants)} 个，仿真 {len(timeline)} 个时段（步长 {args.step} 分钟），"
+          f"按推荐就餐比例 {args.follow:.0%}")
+
+    print(f"{'策略':<10}{'平均等待':>10}{'P95等待':>10}{'最长等待':>10}{'最长队伍':>10}")
+    for policy in ('recorded', 'rating', 'balanced'):
+        result = simulate(policy, merchants, timeline, args.step, args.follow)
+        print(f"{policy:<10}{result['avg_wait']:>10.1f}{result['p95_wait']:>10.1f}"
+              f"{result['max_wait']:>10.1f}{result['max_queue']:>10.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -12,6 +12,7 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 django.setup()
 
 from ai.context_service import ContextService
+from ai.weather import create_weather_provider
 
 def test_weather_api_connection():
     """测试天气API连接"""
@@ -26,14 +27,17 @@ def test_weather_api_connection():
     
     print(f"✅ 已设置天气API密钥: {api_key[:10]}...")
     
-    # 测试天气服务
-    service = ContextService()
-    weather_info = service.get_weather_info()
+    # 直接请求天气提供方（ContextService 只读缓存，首次请求返回备用数据并在后台刷新）
+    try:
+        weather_info = create_weather_provider().fetch()
+    except Exception as e:
+        print(f"天气API调用异常: {e}")
+        weather_info = {}
     
-    if weather_info.get('weather') != '未知':
+    if weather_info.get('weather', '未知') != '未知':
         print(f"✅ 天气API连接成功！")
         print(f"当前天气: {weather_info['weather']}，温度: {weather_info['temperature']}°C")
-        print(f"季节: {weather_info['season']}，湿度: {weather_info['humidity']}%")
+        print(f"湿度: {weather_info['humidity']}%")
         print(f"风力等级: {weather_info['wind_level']}")
         return True
     else: